@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Backup Catalog for Paperless-ngx
+SQLite (WAL) record of uploads, verifications and deletions shared by the
+backup scripts and the backup exporter
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = "/opt/backups/paperless/catalog/catalog.db"
+
+# Schema migrations, applied in order; PRAGMA user_version records how many ran
+MIGRATIONS = [
+    """
+    CREATE TABLE backups (
+        name TEXT PRIMARY KEY,
+        backup_timestamp INTEGER,
+        size_bytes INTEGER,
+        uploaded_at INTEGER,
+        verified_at INTEGER,
+        verify_status TEXT,
+        deleted_local_at INTEGER,
+        deleted_cloud_at INTEGER
+    );
+    CREATE INDEX backups_live_cloud ON backups(uploaded_at) WHERE deleted_cloud_at IS NULL;
+    CREATE INDEX backups_live_local ON backups(backup_timestamp) WHERE deleted_local_at IS NULL;
+    CREATE TABLE events (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL REFERENCES backups(name) ON DELETE CASCADE,
+        kind TEXT NOT NULL,
+        at INTEGER NOT NULL,
+        details TEXT
+    );
+    CREATE INDEX events_by_name ON events(name, at);
+    """,
+    # Whether checksums.txt covered every artifact when the backup was uploaded
+    """
+    ALTER TABLE backups ADD COLUMN checksum_ok INTEGER;
+    """,
+    # Progress of each upload stage (backup directory, chunks) so a rerun resumes;
+    # upload_files lists the files already uploaded and is cleared once a stage is done
+    """
+    CREATE TABLE upload_progress (
+        name TEXT NOT NULL REFERENCES backups(name) ON DELETE CASCADE,
+        stage TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        status TEXT NOT NULL,
+        files_total INTEGER NOT NULL,
+        bytes_total INTEGER NOT NULL,
+        files_done INTEGER NOT NULL,
+        bytes_done INTEGER NOT NULL,
+        bytes_in_flight INTEGER NOT NULL DEFAULT 0,
+        run_started_at REAL NOT NULL,
+        run_bytes_sent INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        finished_at REAL,
+        PRIMARY KEY (name, stage)
+    );
+    CREATE TABLE upload_files (
+        name TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        PRIMARY KEY (name, stage, path),
+        FOREIGN KEY (name, stage) REFERENCES upload_progress(name, stage) ON DELETE CASCADE
+    );
+    """,
+]
+
+
+def parse_backup_timestamp(name: str) -> Optional[int]:
+    """Extract the Unix timestamp from a backup name (format: backup-YYYYMMDD_HHMMSS)"""
+    try:
+        return int(datetime.strptime(name.replace('backup-', ''), '%Y%m%d_%H%M%S').timestamp())
+    except ValueError:
+        return None
+
+
+class BackupCatalog:
+    """Indexed record of every backup and what has happened to it"""
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH, readonly: bool = False):
+        self.path = Path(path)
+        self.readonly = readonly
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30,
+                                        isolation_level=None, check_same_thread=False)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None,
+                                        check_same_thread=False)
+            # WAL lets the exporter read while a backup script is writing
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        if not readonly:
+            self._migrate()
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _migrate(self):
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for index, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in script.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={index}")
+
+    def _ensure_backup(self, conn: sqlite3.Connection, name: str):
+        conn.execute("INSERT OR IGNORE INTO backups (name, backup_timestamp) VALUES (?, ?)",
+                     (name, parse_backup_timestamp(name)))
+
+    def _event(self, conn: sqlite3.Connection, name: str, kind: str, at: int, details: Optional[Dict] = None):
+        conn.execute("INSERT INTO events (name, kind, at, details) VALUES (?, ?, ?, ?)",
+                     (name, kind, at, json.dumps(details) if details else None))
+
+    def record_upload(self, name: str, size_bytes: int, uploaded_at: Optional[int] = None,
+                      checksum_ok: Optional[bool] = None):
+        """Record a backup that was uploaded to cloud storage"""
+        uploaded_at = uploaded_at or int(time.time())
+        with self._transaction() as conn:
+            self._ensure_backup(conn, name)
+            conn.execute("UPDATE backups SET size_bytes = ?, uploaded_at = ?, checksum_ok = ?, deleted_cloud_at = NULL "
+                         "WHERE name = ?", (size_bytes, uploaded_at, checksum_ok, name))
+            self._event(conn, name, 'upload', uploaded_at, {'size_bytes': size_bytes, 'checksum_ok': checksum_ok})
+
+    def record_verification(self, name: str, ok: bool, detail: Optional[str] = None,
+                            verified_at: Optional[int] = None, mode: str = 'full',
+                            bytes_checked: Optional[int] = None, bytes_total: Optional[int] = None,
+                            seconds: Optional[float] = None, mismatches: Optional[List[str]] = None,
+                            methods: Optional[Dict[str, int]] = None):
+        """Record the outcome of verifying a backup
+
+        Sampled verifications only add an event; the backup's verified_at and
+        verify_status describe the last full or upload verification (every
+        file checked). Upload checks also record their mismatches and how many
+        files were compared by hash and by size and mtime (`methods`).
+        """
+        verified_at = verified_at or int(time.time())
+        status = 'ok' if ok else 'failed'
+        details = {
+            'status': status, 'detail': detail, 'mode': mode,
+            'bytes_checked': bytes_checked, 'bytes_total': bytes_total,
+        }
+        if seconds is not None:
+            details['seconds'] = round(seconds, 3)
+        if mismatches is not None:
+            details['mismatches'] = mismatches
+        if methods is not None:
+            details['methods'] = methods
+        with self._transaction() as conn:
+            self._ensure_backup(conn, name)
+            if mode in ('full', 'upload') or not ok:
+                conn.execute("UPDATE backups SET verified_at = ?, verify_status = ? WHERE name = ?",
+                             (verified_at, status, name))
+            self._event(conn, name, 'verification', verified_at, details)
+
+    def record_deletion(self, name: str, location: str, deleted_at: Optional[int] = None):
+        """Record that a backup was removed from local or cloud storage"""
+        if location not in ('local', 'cloud'):
+            raise ValueError(f"Unknown location: {location}")
+        deleted_at = deleted_at or int(time.time())
+        with self._transaction() as conn:
+            self._ensure_backup(conn, name)
+            conn.execute(f"UPDATE backups SET deleted_{location}_at = ? WHERE name = ?", (deleted_at, name))
+            self._event(conn, name, 'deletion', deleted_at, {'location': location})
+
+    def record_deletions(self, deletions: List[Tuple[str, str]], deleted_at: Optional[int] = None):
+        """Record many (name, location) deletions in one transaction"""
+        deleted_at = deleted_at or int(time.time())
+        with self._transaction() as conn:
+            for name, location in deletions:
+                if location not in ('local', 'cloud'):
+                    raise ValueError(f"Unknown location: {location}")
+                self._ensure_backup(conn, name)
+                conn.execute(f"UPDATE backups SET deleted_{location}_at = ? WHERE name = ?", (deleted_at, name))
+                self._event(conn, name, 'deletion', deleted_at, {'location': location})
+
+    def begin_upload(self, name: str, stage: str, destination: str,
+                     files: List[Tuple[str, int, int]]) -> Set[str]:
+        """Start or resume uploading `files` ((path, size, mtime_ns) each)
+
+        Returns the paths an earlier run of the same stage already uploaded
+        and that have not changed since; files that changed are forgotten so
+        they are uploaded again.
+        """
+        now = time.time()
+        current = {path: (size, mtime_ns) for path, size, mtime_ns in files}
+        with self._transaction() as conn:
+            self._ensure_backup(conn, name)
+            rows = conn.execute("SELECT path, size, mtime_ns FROM upload_files WHERE name = ? AND stage = ?",
+                                (name, stage)).fetchall()
+            stale = [row['path'] for row in rows if current.get(row['path']) != (row['size'], row['mtime_ns'])]
+            conn.executemany("DELETE FROM upload_files WHERE name = ? AND stage = ? AND path = ?",
+                             [(name, stage, path) for path in stale])
+            uploaded = {row['path'] for row in rows} - set(stale)
+            conn.execute(
+                """
+                INSERT INTO upload_progress (name, stage, destination, status, files_total, bytes_total,
+                                             files_done, bytes_done, run_started_at, updated_at)
+                VALUES (:name, :stage, :destination, 'running', :files_total, :bytes_total,
+                        :files_done, :bytes_done, :now, :now)
+                ON CONFLICT (name, stage) DO UPDATE SET
+                    destination = :destination, status = 'running', files_total = :files_total,
+                    bytes_total = :bytes_total, files_done = :files_done, bytes_done = :bytes_done,
+                    bytes_in_flight = 0, run_started_at = :now, run_bytes_sent = 0, updated_at = :now,
+                    finished_at = NULL
+                """, {'name': name, 'stage': stage, 'destination': destination, 'now': now,
+                      'files_total': len(current), 'bytes_total': sum(size for size, _ in current.values()),
+                      'files_done': len(uploaded), 'bytes_done': sum(current[path][0] for path in uploaded)})
+        return uploaded
+
+    def record_upload_batch(self, name: str, stage: str, files: List[Tuple[str, int, int]], bytes_sent: int):
+        """Record a batch of uploaded files; `bytes_sent` is what actually crossed the network"""
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO upload_files (name, stage, path, size, mtime_ns) "
+                             "VALUES (?, ?, ?, ?, ?)", [(name, stage, *entry) for entry in files])
+            conn.execute("UPDATE upload_progress SET files_done = files_done + ?, bytes_done = bytes_done + ?, "
+                         "bytes_in_flight = 0, run_bytes_sent = run_bytes_sent + ?, updated_at = ? "
+                         "WHERE name = ? AND stage = ?",
+                         (len(files), sum(size for _, size, _ in files), bytes_sent, time.time(), name, stage))
+
+    def record_upload_in_flight(self, name: str, stage: str, bytes_in_flight: int):
+        """Record how much of the current batch has been sent so far"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE upload_progress SET bytes_in_flight = ?, updated_at = ? WHERE name = ? AND stage = ?",
+                         (bytes_in_flight, time.time(), name, stage))
+
+    def end_upload(self, name: str, stage: str, ok: bool):
+        """Mark an upload stage done (dropping its file list) or failed (keeping it to resume from)"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE upload_progress SET status = ?, bytes_in_flight = 0, updated_at = ?, finished_at = ? "
+                         "WHERE name = ? AND stage = ?", ('done' if ok else 'failed', now, now, name, stage))
+            if ok:
+                conn.execute("DELETE FROM upload_files WHERE name = ? AND stage = ?", (name, stage))
+
+    def prune(self, keep: int = 50) -> int:
+        """Drop history for backups gone from everywhere, keeping the newest `keep`"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                DELETE FROM backups WHERE name IN (
+                    SELECT name FROM backups
+                    WHERE deleted_cloud_at IS NOT NULL AND deleted_local_at IS NOT NULL
+                    ORDER BY backup_timestamp DESC LIMIT -1 OFFSET ?
+                )
+                """, (keep,))
+            return cursor.rowcount
+
+    def live_cloud_backups(self) -> List[Dict]:
+        """Backups currently in cloud storage, newest first"""
+        rows = self.conn.execute(
+            """
+            SELECT name, size_bytes, uploaded_at, backup_timestamp, verified_at, verify_status
+            FROM backups WHERE uploaded_at IS NOT NULL AND deleted_cloud_at IS NULL
+            ORDER BY uploaded_at DESC
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def live_local_backups(self) -> List[str]:
+        """Names of backups not yet recorded as deleted from local disk"""
+        rows = self.conn.execute("SELECT name FROM backups WHERE deleted_local_at IS NULL").fetchall()
+        return [row['name'] for row in rows]
+
+    def local_sizes(self) -> Dict[str, int]:
+        """Recorded sizes of backups that should still be on local disk"""
+        rows = self.conn.execute(
+            "SELECT name, size_bytes FROM backups WHERE size_bytes IS NOT NULL AND deleted_local_at IS NULL").fetchall()
+        return {row['name']: row['size_bytes'] for row in rows}
+
+    def local_checksums(self) -> Dict[str, bool]:
+        """Recorded checksum coverage of backups that should still be on local disk"""
+        rows = self.conn.execute(
+            "SELECT name, checksum_ok FROM backups WHERE checksum_ok IS NOT NULL AND deleted_local_at IS NULL").fetchall()
+        return {row['name']: bool(row['checksum_ok']) for row in rows}
+
+    def verified_timestamps(self) -> Dict[str, int]:
+        """Time of the last successful verification of each backup"""
+        rows = self.conn.execute(
+            """
+            SELECT name, MAX(at) AS verified_at FROM events
+            WHERE kind = 'verification' AND json_extract(details, '$.status') = 'ok'
+              AND COALESCE(json_extract(details, '$.mode'), 'full') IN ('full', 'upload')
+            GROUP BY name
+            """).fetchall()
+        return {row['name']: row['verified_at'] for row in rows}
+
+    def upload_checks(self) -> Dict[str, Dict]:
+        """The latest upload check of each live cloud backup
+
+        Each entry has ok, at, seconds, mismatches (a list) and methods
+        (files compared by hash and by size and mtime).
+        """
+        rows = self.conn.execute(
+            """
+            SELECT events.name, events.at, events.details FROM events
+            JOIN backups ON backups.name = events.name
+            WHERE kind = 'verification' AND json_extract(details, '$.mode') = 'upload'
+              AND deleted_cloud_at IS NULL
+              AND events.id = (SELECT MAX(id) FROM events AS latest
+                               WHERE latest.name = events.name AND latest.kind = 'verification'
+                                 AND json_extract(latest.details, '$.mode') = 'upload')
+            """).fetchall()
+        checks = {}
+        for row in rows:
+            details = json.loads(row['details'])
+            checks[row['name']] = {
+                'ok': details['status'] == 'ok',
+                'at': row['at'],
+                'seconds': details.get('seconds'),
+                'mismatches': details.get('mismatches') or [],
+                'methods': details.get('methods') or {},
+            }
+        return checks
+
+    def upload_progress(self) -> Dict[str, Dict[str, Dict]]:
+        """{backup name: {stage: progress}} for backups still on local disk
+
+        Each entry has status (running, done or failed), files/bytes total
+        and done, bytes_in_flight of the current batch, and run_started_at,
+        run_bytes_sent and updated_at of the latest run for its throughput.
+        """
+        try:
+            rows = self.conn.execute(
+                """
+                SELECT upload_progress.* FROM upload_progress
+                JOIN backups ON backups.name = upload_progress.name
+                WHERE deleted_local_at IS NULL
+                """).fetchall()
+        except sqlite3.OperationalError:
+            # A read-only catalog that no backup script has migrated yet
+            return {}
+        progress: Dict[str, Dict[str, Dict]] = {}
+        for row in rows:
+            entry = dict(row)
+            progress.setdefault(entry.pop('name'), {})[entry.pop('stage')] = entry
+        return progress
+
+    def verify_coverage(self, window_seconds: int) -> Dict[str, float]:
+        """Share of each live cloud backup's bytes checked by verifications in the window
+
+        Overlapping samples are counted twice, so this is an estimate, capped at 1.
+        Upload checks compare the remote's listed hashes and read nothing
+        back, so they do not count towards it.
+        """
+        rows = self.conn.execute(
+            """
+            SELECT events.name,
+                   SUM(json_extract(details, '$.bytes_checked')) AS bytes_checked,
+                   MAX(json_extract(details, '$.bytes_total')) AS bytes_total
+            FROM events JOIN backups ON backups.name = events.name
+            WHERE kind = 'verification' AND at >= ? AND deleted_cloud_at IS NULL
+              AND json_extract(details, '$.status') = 'ok'
+              AND COALESCE(json_extract(details, '$.mode'), 'full') != 'upload'
+            GROUP BY events.name
+            """, (int(time.time()) - window_seconds,)).fetchall()
+        return {row['name']: min(row['bytes_checked'] / row['bytes_total'], 1.0) if row['bytes_total'] else 0.0
+                for row in rows if row['bytes_checked'] is not None}
+
+    def all_backups(self) -> List[Dict]:
+        """Every backup in the catalog, newest first"""
+        rows = self.conn.execute("SELECT * FROM backups ORDER BY backup_timestamp DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def export_registry(self, registry_path: str):
+        """Atomically write the legacy cloud_backup_registry.json from the catalog"""
+        entries = [{
+            'name': backup['name'],
+            'size_bytes': backup['size_bytes'] or 0,
+            'timestamp': backup['uploaded_at'],
+            'upload_date': datetime.fromtimestamp(backup['uploaded_at']).astimezone().isoformat(timespec='seconds'),
+        } for backup in reversed(self.live_cloud_backups())]
+
+        temp_path = f"{registry_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, registry_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Backup catalog for Paperless-ngx backups')
+    parser.add_argument('--db', default=os.environ.get('BACKUP_CATALOG', DEFAULT_CATALOG_PATH), help='Catalog database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    upload = subparsers.add_parser('record-upload', help='Record an uploaded backup')
+    upload.add_argument('name')
+    upload.add_argument('--size-bytes', type=int, required=True)
+    upload.add_argument('--timestamp', type=int, help='Upload time (default: now)')
+    upload.add_argument('--checksum-ok', choices=['yes', 'no'], help='Whether checksums.txt covered every artifact')
+
+    verification = subparsers.add_parser('record-verification', help='Record a verification result')
+    verification.add_argument('name')
+    verification.add_argument('--status', choices=['ok', 'failed'], required=True)
+    verification.add_argument('--detail')
+
+    deletion = subparsers.add_parser('record-deletion', help='Record a deleted backup')
+    deletion.add_argument('name')
+    deletion.add_argument('--location', choices=['local', 'cloud'], required=True)
+
+    prune = subparsers.add_parser('prune', help='Drop history for fully deleted backups')
+    prune.add_argument('--keep', type=int, default=50, help='Fully deleted backups to keep history for')
+
+    export = subparsers.add_parser('export-registry', help='Write cloud_backup_registry.json from the catalog')
+    export.add_argument('path')
+
+    subparsers.add_parser('list', help='Print every backup in the catalog as JSON')
+
+    args = parser.parse_args(argv)
+    catalog = BackupCatalog(args.db)
+    try:
+        if args.command == 'record-upload':
+            checksum_ok = None if args.checksum_ok is None else args.checksum_ok == 'yes'
+            catalog.record_upload(args.name, args.size_bytes, args.timestamp, checksum_ok)
+        elif args.command == 'record-verification':
+            catalog.record_verification(args.name, args.status == 'ok', args.detail)
+        elif args.command == 'record-deletion':
+            catalog.record_deletion(args.name, args.location)
+        elif args.command == 'prune':
+            logger.info(f"Pruned {catalog.prune(args.keep)} backup(s) from the catalog")
+        elif args.command == 'export-registry':
+            catalog.export_registry(args.path)
+        elif args.command == 'list':
+            print(json.dumps(catalog.all_backups(), indent=2))
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
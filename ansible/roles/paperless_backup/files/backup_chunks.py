@@ -0,0 +1,696 @@
+#!/usr/bin/env python3
+"""
+Incremental Chunked Backups for Paperless-ngx
+Splits volume contents into content-defined chunks kept once in a local chunk
+store; every backup is a small manifest listing the chunks of each file
+"""
+
+import io
+import os
+import gzip
+import json
+import stat
+import sys
+import shlex
+import time
+import zlib
+import random
+import sqlite3
+import hashlib
+import logging
+import tarfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from backup_verify import MANIFEST_FILE, LocalSource, RateLimiter, RcloneSource, SamplePlan, VerifyError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# Remote directory (next to the backup-* directories) holding the chunks
+REMOTE_CHUNKS_DIR = 'chunks'
+
+# Chunk sizes: files up to MIN_CHUNK_SIZE are one chunk, larger ones are cut
+# where the content matches the cut pattern, averaging about 1 MiB past the minimum
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_BITS = 20
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 8 * 1024 * 1024
+# Bytes mapped to digits at a time while looking for a cut
+SCAN_SIZE = 512 * 1024
+
+# Every byte value stands for two bits (a fixed quarter of the values for
+# each digit 0-3), and a chunk ends after the AVG_CHUNK_BITS / 2 bytes whose
+# digits spell CUT_PATTERN. A cut depends only on those bytes, so an
+# insertion moves the boundaries after it along with the data. Fixed so chunk
+# boundaries are identical on every run and host.
+_cut_rng = random.Random(0x5EED)
+_values = list(range(256))
+_cut_rng.shuffle(_values)
+DIGIT_TABLE = bytes(b'0123'[_values.index(value) % 4] for value in range(256))
+CUT_PATTERN = bytes(_cut_rng.choice(b'0123') for _ in range(AVG_CHUNK_BITS // 2))
+
+
+class ChunkError(Exception):
+    """Raised when a chunk is missing or does not match its hash"""
+
+
+def find_cut(data: bytes, start: int = 0) -> int:
+    """Return the length of the chunk beginning at `start` in `data`
+
+    The scan runs in C: bytes.translate maps a stretch of the data to its
+    digits and bytes.find looks for the cut pattern, a stretch at a time so a
+    cut near the minimum size does not pay for translating up to the maximum.
+    """
+    end = len(data)
+    if end - start <= MIN_CHUNK_SIZE:
+        return end - start
+    limit = min(end, start + MAX_CHUNK_SIZE)
+    position = start + MIN_CHUNK_SIZE - len(CUT_PATTERN)
+    while position + len(CUT_PATTERN) <= limit:
+        stretch = min(limit, position + SCAN_SIZE)
+        match = data[position:stretch].translate(DIGIT_TABLE).find(CUT_PATTERN)
+        if match >= 0:
+            return position + match + len(CUT_PATTERN) - start
+        # The next stretch starts where a match straddling this one would
+        position = stretch - len(CUT_PATTERN) + 1
+    return limit - start
+
+
+def iter_chunks(f: BinaryIO) -> Iterator[bytes]:
+    """Split a file into content-defined chunks"""
+    buffer = b''
+    offset = 0
+    eof = False
+    while True:
+        # A cut is only final once a whole maximum-size chunk is buffered
+        if not eof and len(buffer) - offset < MAX_CHUNK_SIZE:
+            parts = [buffer[offset:]]
+            buffered = len(parts[0])
+            while not eof and buffered < MAX_CHUNK_SIZE:
+                data = f.read(READ_SIZE)
+                eof = not data
+                parts.append(data)
+                buffered += len(data)
+            buffer, offset = b''.join(parts), 0
+        if offset == len(buffer):
+            return
+        cut = find_cut(buffer, offset)
+        yield buffer[offset:offset + cut]
+        offset += cut
+
+
+def chunk_relpath(chunk_hash: str) -> str:
+    """Path of a chunk below the chunk directory (local store and remote alike)"""
+    return f"{chunk_hash[:2]}/{chunk_hash}"
+
+
+def decode_chunk(chunk_hash: str, stored: bytes) -> bytes:
+    """Decompress a stored chunk and check it against its hash"""
+    try:
+        data = zlib.decompress(stored)
+    except zlib.error as e:
+        raise ChunkError(f"chunk {chunk_hash} is corrupt: {e}") from e
+    if hashlib.sha256(data).hexdigest() != chunk_hash:
+        raise ChunkError(f"chunk {chunk_hash} does not match its hash")
+    return data
+
+
+class ChunkStore:
+    """Local content-addressed store of zlib-compressed chunks
+
+    Chunks live at <root>/data/<xx>/<sha256>. A SQLite index records every
+    chunk and when it was uploaded, so uploads only send chunks the remote
+    has not seen. The index uses a rollback journal (not WAL) so it can be
+    opened read-only by users who cannot write to the store.
+    """
+
+    def __init__(self, root: str, readonly: bool = False):
+        self.root = Path(root)
+        self.data_dir = self.root / 'data'
+        index_path = self.root / 'index.db'
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, timeout=60, check_same_thread=False)
+        else:
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(index_path), timeout=60, check_same_thread=False)
+            with self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS chunks (
+                        hash TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        stored_size INTEGER NOT NULL,
+                        uploaded_at INTEGER
+                    )""")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_pending ON chunks(hash) WHERE uploaded_at IS NULL")
+        self.known: Set[str] = {row[0] for row in self.conn.execute("SELECT hash FROM chunks")}
+        self._new: List[Tuple[str, int, int]] = []
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def chunk_path(self, chunk_hash: str) -> Path:
+        return self.data_dir / chunk_relpath(chunk_hash)
+
+    def put(self, data: bytes) -> Tuple[str, bool]:
+        """Store a chunk unless it is already known; returns (hash, is_new)"""
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if chunk_hash in self.known:
+                return chunk_hash, False
+            self.known.add(chunk_hash)
+
+        path = self.chunk_path(chunk_hash)
+        path.parent.mkdir(exist_ok=True)
+        stored = zlib.compress(data, 6)
+        temp_path = path.with_name(f".{chunk_hash}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(stored)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._new.append((chunk_hash, len(data), len(stored)))
+        return chunk_hash, True
+
+    def get(self, chunk_hash: str) -> bytes:
+        try:
+            stored = self.chunk_path(chunk_hash).read_bytes()
+        except OSError as e:
+            raise ChunkError(f"chunk {chunk_hash} missing from the local store") from e
+        return decode_chunk(chunk_hash, stored)
+
+    def flush(self):
+        """Record the chunks stored since the last flush in the index"""
+        with self._lock:
+            new, self._new = self._new, []
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO chunks (hash, size, stored_size) VALUES (?, ?, ?)", new)
+
+    def pending_uploads(self) -> List[str]:
+        rows = self.conn.execute("SELECT hash FROM chunks WHERE uploaded_at IS NULL ORDER BY hash")
+        return [chunk_relpath(row[0]) for row in rows]
+
+    def mark_uploaded(self, chunk_hashes: List[str]):
+        now = int(time.time())
+        with self.conn:
+            self.conn.executemany("UPDATE chunks SET uploaded_at = ? WHERE hash = ?",
+                                  [(now, chunk_hash) for chunk_hash in chunk_hashes])
+
+    def delete(self, chunk_hashes: Set[str]):
+        for chunk_hash in chunk_hashes:
+            try:
+                self.chunk_path(chunk_hash).unlink()
+            except FileNotFoundError:
+                pass
+        with self.conn:
+            self.conn.executemany("DELETE FROM chunks WHERE hash = ?", [(h,) for h in chunk_hashes])
+        self.known -= chunk_hashes
+
+
+def read_manifest(data: bytes) -> Dict:
+    manifest = json.loads(gzip.decompress(data))
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ChunkError(f"unsupported manifest version {manifest.get('version')}")
+    return manifest
+
+
+def write_manifest(path: Path, manifest: Dict) -> str:
+    """Atomically write a manifest; returns its sha256"""
+    data = gzip.compress(json.dumps(manifest, separators=(',', ':')).encode(), mtime=0)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return hashlib.sha256(data).hexdigest()
+
+
+def manifest_chunks(manifest: Dict) -> Set[str]:
+    """Every chunk a manifest references"""
+    return {chunk_hash for entries in manifest['volumes'].values()
+            for entry in entries for chunk_hash in entry.get('chunks', ())}
+
+
+def backup_volume(name: str, source: str, store_root: str, previous: Optional[List[Dict]] = None) -> Dict:
+    """Chunk one volume into the store (runs in a worker process)
+
+    Files whose size, mtime and inode match the previous manifest reuse its
+    chunk list without being read, so only changed files are chunked.
+    """
+    started = time.monotonic()
+    store = ChunkStore(store_root)
+    previous_files = {e['path']: e for e in previous or () if e['type'] == 'file'}
+    stats = {'files': 0, 'reused_files': 0, 'bytes': 0, 'chunked_bytes': 0, 'new_chunks': 0, 'new_bytes': 0}
+    entries = []
+
+    def add(path: str, rel_path: str):
+        st = os.lstat(path)
+        entry = {'path': rel_path, 'mode': stat.S_IMODE(st.st_mode), 'uid': st.st_uid, 'gid': st.st_gid,
+                 'mtime_ns': st.st_mtime_ns}
+        if stat.S_ISDIR(st.st_mode):
+            entry['type'] = 'dir'
+        elif stat.S_ISLNK(st.st_mode):
+            entry['type'] = 'symlink'
+            entry['target'] = os.readlink(path)
+        elif stat.S_ISREG(st.st_mode):
+            entry.update(type='file', size=st.st_size, inode=st.st_ino)
+            stats['files'] += 1
+            stats['bytes'] += st.st_size
+            old = previous_files.get(rel_path)
+            if (old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns and
+                    old['inode'] == st.st_ino and all(h in store.known for h in old['chunks'])):
+                entry['chunks'] = old['chunks']
+                stats['reused_files'] += 1
+            else:
+                entry['chunks'] = []
+                with open(path, 'rb') as f:
+                    for chunk in iter_chunks(f):
+                        chunk_hash, is_new = store.put(chunk)
+                        entry['chunks'].append(chunk_hash)
+                        stats['chunked_bytes'] += len(chunk)
+                        if is_new:
+                            stats['new_chunks'] += 1
+                            stats['new_bytes'] += len(chunk)
+        else:
+            logger.warning(f"Skipping special file {path}")
+            return
+        entries.append(entry)
+
+    try:
+        add(source, '.')
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, source)
+            for file_name in sorted(dirnames) + sorted(filenames):
+                rel_path = file_name if rel_dir == '.' else f"{rel_dir}/{file_name}"
+                add(os.path.join(dirpath, file_name), rel_path)
+        store.flush()
+    finally:
+        store.close()
+
+    stats['seconds'] = time.monotonic() - started
+    return {'name': name, 'entries': entries, 'stats': stats}
+
+
+class ChunkFetcher:
+    """Reads chunks from the local store, falling back to a download cache"""
+
+    def __init__(self, store: Optional[ChunkStore], cache_dir: Optional[Path] = None):
+        self.store = store
+        self.cache_dir = cache_dir
+
+    def has(self, chunk_hash: str) -> bool:
+        return self.store is not None and chunk_hash in self.store.known
+
+    def get(self, chunk_hash: str) -> bytes:
+        if self.has(chunk_hash):
+            return self.store.get(chunk_hash)
+        if self.cache_dir is not None:
+            try:
+                return decode_chunk(chunk_hash, (self.cache_dir / chunk_relpath(chunk_hash)).read_bytes())
+            except OSError:
+                pass
+        raise ChunkError(f"chunk {chunk_hash} is not available locally")
+
+
+class ChunkedFileReader(io.RawIOBase):
+    """Reads a file back by concatenating its chunks"""
+
+    def __init__(self, chunks: List[str], fetch: Callable[[str], bytes]):
+        self.chunks = iter(chunks)
+        self.fetch = fetch
+        self._buffer = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk_hash = next(self.chunks, None)
+            if chunk_hash is None:
+                return 0
+            self._buffer = memoryview(self.fetch(chunk_hash))
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def write_tar(entries: List[Dict], fetch: Callable[[str], bytes], out: BinaryIO):
+    """Rebuild a volume as a tar stream from its manifest entries"""
+    with tarfile.open(fileobj=out, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        for entry in entries:
+            info = tarfile.TarInfo(entry['path'])
+            info.mode = entry['mode']
+            info.uid = entry['uid']
+            info.gid = entry['gid']
+            info.mtime = entry['mtime_ns'] / 1e9
+            if entry['type'] == 'dir':
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif entry['type'] == 'symlink':
+                info.type = tarfile.SYMTYPE
+                info.linkname = entry['target']
+                tar.addfile(info)
+            else:
+                info.size = entry['size']
+                tar.addfile(info, io.BufferedReader(ChunkedFileReader(entry['chunks'], fetch)))
+
+
+def restore_volume(name: str, entries: List[Dict], fetcher: ChunkFetcher, sink) -> Dict:
+    """Stream a volume rebuilt from chunks into a restore sink"""
+    started = time.monotonic()
+    read_fd, write_fd = os.pipe()
+    errors: List[BaseException] = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as out:
+                write_tar(entries, fetcher.get, out)
+        except BrokenPipeError:
+            pass
+        except BaseException as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, name=f"tar-{name}", daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as stream:
+            sink.restore(name, stream)
+            # Let the producer finish writing the end-of-archive blocks
+            while stream.read(1024 * 1024):
+                pass
+    except Exception:
+        producer.join()
+        sink.discard(name)
+        if errors:
+            raise errors[0]
+        raise
+    producer.join()
+    if errors:
+        sink.discard(name)
+        raise errors[0]
+    # Every chunk was read and checked; the rebuilt volume replaces the old one
+    sink.commit(name)
+    size = sum(e.get('size', 0) for e in entries)
+    return {'name': name, 'bytes': size, 'files': sum(1 for e in entries if e['type'] == 'file'),
+            'seconds': time.monotonic() - started}
+
+
+def download_chunks(remote: str, chunk_hashes: Set[str], cache_dir: Path, rclone: str = 'rclone',
+                    transfers: int = 8):
+    """Fetch chunks into the cache with one rclone copy"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as files_from:
+        files_from.write(''.join(f"{chunk_relpath(h)}\n" for h in sorted(chunk_hashes)))
+        files_from.flush()
+        result = subprocess.run([rclone, 'copy', f"{remote}/{REMOTE_CHUNKS_DIR}", str(cache_dir),
+                                 '--files-from', files_from.name, '--no-traverse', '--transfers', str(transfers)])
+    if result.returncode != 0:
+        raise ChunkError(f"rclone copy of {len(chunk_hashes)} chunk(s) failed")
+
+
+def verify_chunks(source, manifest: Dict, jobs: int = 4, limiter: Optional[RateLimiter] = None,
+                  plan: Optional[SamplePlan] = None) -> Dict:
+    """Check that every chunk of a manifest exists in the source and is intact
+
+    Existence is checked against a single listing of the chunk directory.
+    Chunks are then downloaded and hashed: all of them, or with a sample
+    plan the stripe of chunks whose turn it is, so every chunk is hashed
+    once per window like every stripe of an archive.
+    """
+    started = time.monotonic()
+    referenced = manifest_chunks(manifest)
+    present = {Path(path).name for path in source.list_tree(REMOTE_CHUNKS_DIR)}
+    missing = sorted(referenced - present)
+
+    to_check = sorted(referenced & present)
+    if plan is not None:
+        to_check = [h for h in to_check if plan.turn(REMOTE_CHUNKS_DIR, h) == 0]
+
+    def check(chunk_hash: str) -> Tuple[int, Optional[str]]:
+        try:
+            with source.open(f"{REMOTE_CHUNKS_DIR}/{chunk_hash[:2]}", chunk_hash) as raw:
+                stored = raw.read()
+            if limiter:
+                limiter.consume(len(stored))
+            return len(decode_chunk(chunk_hash, stored)), None
+        except (ChunkError, VerifyError, OSError) as e:
+            return 0, str(e)
+
+    corrupt, bytes_checked = [], 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for chunk_hash, (size, error) in zip(to_check, executor.map(check, to_check)):
+            if error:
+                corrupt.append(error)
+            bytes_checked += size
+
+    return {
+        'ok': not missing and not corrupt,
+        'referenced': len(referenced),
+        'checked': len(to_check),
+        'missing': missing,
+        'corrupt': corrupt,
+        'bytes_checked': bytes_checked,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def run_backup(args: argparse.Namespace) -> int:
+    previous_volumes: Dict[str, List[Dict]] = {}
+    if args.previous and Path(args.previous).exists():
+        previous_volumes = read_manifest(Path(args.previous).read_bytes())['volumes']
+
+    manifest = {'version': MANIFEST_VERSION, 'created': int(time.time()), 'chunk_format': 'zlib', 'volumes': {}}
+    failed = False
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs or len(args.volume)) as pool:
+        futures = {
+            pool.submit(backup_volume, name, path, args.store, previous_volumes.get(name)): name
+            for name, path in args.volume
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Failed to back up {name}: {e}")
+                failed = True
+                continue
+            stats = result['stats']
+            logger.info(f"Backed up {name}: {stats['files']} files ({stats['reused_files']} unchanged), "
+                        f"chunked {stats['chunked_bytes']} of {stats['bytes']} bytes, "
+                        f"{stats['new_chunks']} new chunk(s) / {stats['new_bytes']} new bytes "
+                        f"in {stats['seconds']:.1f}s")
+            manifest['volumes'][name] = result['entries']
+    if failed:
+        return 1
+
+    manifest_path = Path(args.output) / MANIFEST_FILE
+    digest = write_manifest(manifest_path, manifest)
+    logger.info(f"Wrote {manifest_path} ({manifest_path.stat().st_size} bytes)")
+    if args.checksums:
+        from backup_pipeline import write_checksums
+        write_checksums(Path(args.checksums), [{'file': MANIFEST_FILE, 'sha256': digest}])
+    return 0
+
+
+def run_pending(args: argparse.Namespace) -> int:
+    store = ChunkStore(args.store, readonly=True)
+    try:
+        for path in store.pending_uploads():
+            print(path)
+    finally:
+        store.close()
+    return 0
+
+
+def run_mark_uploaded(args: argparse.Namespace) -> int:
+    chunk_hashes = [Path(line.strip()).name for line in sys.stdin if line.strip()]
+    try:
+        store = ChunkStore(args.store)
+        try:
+            store.mark_uploaded(chunk_hashes)
+        finally:
+            store.close()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to mark {len(chunk_hashes)} chunk(s) as uploaded in {args.store}: {e}")
+        return 1
+    logger.info(f"Marked {len(chunk_hashes)} chunk(s) as uploaded")
+    return 0
+
+
+def run_gc(args: argparse.Namespace) -> int:
+    referenced: Set[str] = set()
+    for manifest_path in Path(args.backups_dir).glob(f"backup-*/{MANIFEST_FILE}"):
+        referenced |= manifest_chunks(read_manifest(manifest_path.read_bytes()))
+    store = ChunkStore(args.store)
+    try:
+        unreferenced = store.known - referenced
+        logger.info(f"{len(unreferenced)} of {len(store.known)} local chunk(s) are no longer referenced")
+        if not args.dry_run:
+            store.delete(unreferenced)
+    finally:
+        store.close()
+    return 0
+
+
+def run_prune_remote(args: argparse.Namespace) -> int:
+    """Delete remote chunks no remote manifest references
+
+    Chunks still in the local store are kept: the index says they were
+    uploaded, so the next backup may reference them without uploading again.
+    """
+    source = RcloneSource(args.remote, args.rclone)
+    referenced: Set[str] = set()
+    for backup_name in source.list_backups():
+        if MANIFEST_FILE in source.list_files(backup_name):
+            with source.open(backup_name, MANIFEST_FILE) as raw:
+                referenced |= manifest_chunks(read_manifest(raw.read()))
+    if args.store and (Path(args.store) / 'index.db').exists():
+        store = ChunkStore(args.store, readonly=True)
+        referenced |= store.known
+        store.close()
+
+    remote_paths = source.list_tree(REMOTE_CHUNKS_DIR)
+    unreferenced = [path for path in remote_paths if Path(path).name not in referenced]
+    logger.info(f"{len(unreferenced)} of {len(remote_paths)} remote chunk(s) are no longer referenced")
+    if unreferenced and not args.dry_run:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as files_from:
+            files_from.write(''.join(f"{path}\n" for path in unreferenced))
+            files_from.flush()
+            result = subprocess.run([args.rclone, 'delete', f"{args.remote}/{REMOTE_CHUNKS_DIR}",
+                                     '--files-from', files_from.name, '--no-traverse'])
+        if result.returncode != 0:
+            logger.error("Failed to delete unreferenced remote chunks")
+            return 1
+    return 0
+
+
+def run_restore(args: argparse.Namespace) -> int:
+    from backup_restore import (CommandSink, DirectorySink, DockerVolumeSink, RestoreError,
+                                format_rate, restore_artifact, DATABASE_FILE)
+
+    source = RcloneSource(args.remote, args.rclone) if args.remote else LocalSource(args.source_dir)
+    with source.open(args.backup, MANIFEST_FILE) as raw:
+        manifest = read_manifest(raw.read())
+    volumes = {name: entries for name, entries in manifest['volumes'].items()
+               if not args.volumes or name in args.volumes.split(',')}
+
+    store = None
+    if args.store and (Path(args.store) / 'index.db').exists():
+        store = ChunkStore(args.store, readonly=True)
+    cache_dir = Path(args.cache) if args.cache else None
+    fetcher = ChunkFetcher(store, cache_dir)
+
+    started = time.monotonic()
+    needed = {h for entries in volumes.values() for e in entries for h in e.get('chunks', ())}
+    missing = {h for h in needed if not fetcher.has(h)}
+    if missing and not args.remote:
+        # A local source already holds the chunks in the remote layout
+        fetcher.cache_dir = Path(args.source_dir) / REMOTE_CHUNKS_DIR
+    elif missing:
+        if cache_dir is None:
+            logger.error(f"{len(missing)} chunk(s) are not in the local store and no --cache was given")
+            return 1
+        logger.info(f"Downloading {len(missing)} of {len(needed)} chunk(s) not in the local store")
+        try:
+            download_chunks(args.remote, missing, cache_dir, args.rclone, args.transfers)
+        except ChunkError as e:
+            logger.error(str(e))
+            return 1
+
+    sink = DirectorySink(args.target_dir) if args.target_dir else \
+        DockerVolumeSink(args.docker_volume_prefix, args.docker_image)
+    db_sink = CommandSink(shlex.split(args.db_command)) if args.db_command else None
+
+    failed = False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(volumes) + 1) as executor:
+        futures = {executor.submit(restore_volume, name, entries, fetcher, sink): name
+                   for name, entries in volumes.items()}
+        if db_sink is not None:
+            futures[executor.submit(restore_artifact, source, args.backup, DATABASE_FILE, 'database', db_sink)] = \
+                'database'
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except (ChunkError, RestoreError, VerifyError, OSError, tarfile.TarError) as e:
+                logger.error(f"✗ Failed to restore {name}: {e}")
+                failed = True
+                continue
+            if name == 'database':
+                logger.info(f"✓ Restored database in {result['seconds']:.1f}s")
+            else:
+                logger.info(f"✓ Restored {name}: {result['files']} files, "
+                            f"{format_rate(result['bytes'], result['seconds'])}")
+    if store is not None:
+        store.close()
+    logger.info(f"Restore of {args.backup} finished in {time.monotonic() - started:.1f}s")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from backup_pipeline import parse_volume
+
+    parser = argparse.ArgumentParser(description='Incremental chunked backups for Paperless-ngx')
+    parser.add_argument('--store', default=os.environ.get('BACKUP_CHUNK_STORE'), help='Local chunk store directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup = subparsers.add_parser('backup', help='Chunk volumes into the store and write a manifest')
+    backup.add_argument('--output', required=True, help='Backup directory to write the manifest into')
+    backup.add_argument('--volume', action='append', type=parse_volume, required=True, metavar='NAME=PATH',
+                        help='Volume to back up (repeatable)')
+    backup.add_argument('--previous', help="Previous backup's manifest; unchanged files reuse its chunk lists")
+    backup.add_argument('--jobs', type=int, default=0, help='Volumes to chunk at once (default: one per volume)')
+    backup.add_argument('--checksums', help='sha256sum-format file to record the manifest digest in')
+    backup.set_defaults(func=run_backup)
+
+    pending = subparsers.add_parser('pending', help='Print chunks not uploaded yet (paths below the chunk dir)')
+    pending.set_defaults(func=run_pending)
+
+    mark = subparsers.add_parser('mark-uploaded', help='Mark the chunk paths read from stdin as uploaded')
+    mark.set_defaults(func=run_mark_uploaded)
+
+    gc = subparsers.add_parser('gc', help='Delete local chunks no local manifest references')
+    gc.add_argument('--backups-dir', required=True, help='Directory holding the local backup-* directories')
+    gc.add_argument('--dry-run', action='store_true')
+    gc.set_defaults(func=run_gc)
+
+    prune = subparsers.add_parser('prune-remote', help='Delete remote chunks no remote manifest references')
+    prune.add_argument('--remote', required=True, help='rclone path holding the backups')
+    prune.add_argument('--rclone', default='rclone', help='rclone binary')
+    prune.add_argument('--dry-run', action='store_true')
+    prune.set_defaults(func=run_prune_remote)
+
+    restore = subparsers.add_parser('restore', help='Rebuild volumes from a manifest')
+    source_group = restore.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--remote', help='rclone path holding the backups')
+    source_group.add_argument('--source-dir', help='Local directory laid out like the remote')
+    target_group = restore.add_mutually_exclusive_group(required=True)
+    target_group.add_argument('--target-dir', help='Extract each volume into TARGET_DIR/<volume>')
+    target_group.add_argument('--docker-volume-prefix', help='Extract each volume into the Docker volume PREFIX<volume>')
+    restore.add_argument('--docker-image', default='alpine:latest', help='Image used to extract into Docker volumes')
+    restore.add_argument('--db-command', help='Command whose stdin receives database.sql (e.g. psql)')
+    restore.add_argument('--volumes', help='Comma-separated volumes to restore (default: all)')
+    restore.add_argument('--cache', help='Directory to download chunks missing from the local store into')
+    restore.add_argument('--rclone', default='rclone', help='rclone binary')
+    restore.add_argument('--transfers', type=int, default=8, help='Parallel chunk downloads')
+    restore.add_argument('backup', help='Backup to restore')
+    restore.set_defaults(func=run_restore)
+
+    args = parser.parse_args(argv)
+    if args.command in ('backup', 'pending', 'mark-uploaded', 'gc') and not args.store:
+        parser.error('--store is required')
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Backup Pipeline for Paperless-ngx
+Archives Docker volumes concurrently with block-parallel gzip compression,
+hashing every artifact while it is written and indexing every archive member
+"""
+
+import io
+import os
+import sys
+import gzip
+import json
+import fcntl
+import time
+import hashlib
+import logging
+import tarfile
+import argparse
+import concurrent.futures
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Deque, Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+CHECKSUMS_FILE = 'checksums.txt'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index.json.gz'
+
+
+def index_name(archive_name: str) -> str:
+    """media.tar.gz -> media.index.json.gz"""
+    return archive_name[:-len('.tar.gz')] + INDEX_SUFFIX
+
+
+class HashingWriter(io.RawIOBase):
+    """Writes through to a file while computing its sha256 and size"""
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.sha256 = hashlib.sha256()
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.out.write(data)
+        self.sha256.update(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+
+class HashingReader(io.RawIOBase):
+    """Reads through from a file while computing its sha256"""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        buffer[:len(data)] = data
+        self.sha256.update(data)
+        return len(data)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Compresses fixed-size blocks in parallel as independent gzip members
+
+    Concatenated gzip members are a valid gzip stream (RFC 1952), so the output
+    reads like any other .tar.gz with gunzip, tar xzf or Python's gzip module,
+    the same trick pigz uses. zlib releases the GIL while compressing, so
+    threads are enough to keep every core busy. Members are written in order
+    and at most `max_pending` blocks are in flight to bound memory use.
+
+    Every block but the last holds exactly `block_size` input bytes, so with
+    the compressed length of each (`block_lengths`) any input offset maps to
+    the member holding it, which decompresses on its own.
+    """
+
+    def __init__(self, out: BinaryIO, executor: concurrent.futures.Executor, level: int = 6,
+                 block_size: int = DEFAULT_BLOCK_SIZE, max_pending: int = 8):
+        self.out = out
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending
+        self.bytes_in = 0
+        self.block_lengths: List[int] = []
+        self._buffer = bytearray()
+        self._pending: Deque[concurrent.futures.Future] = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def _submit(self, block: bytes):
+        # mtime=0 keeps the output reproducible for identical input
+        self._pending.append(self.executor.submit(gzip.compress, block, self.level, mtime=0))
+        while len(self._pending) >= self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        member = self._pending.popleft().result()
+        self.out.write(member)
+        self.block_lengths.append(len(member))
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.bytes_in += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            # Empty input still gets one (empty) member: a zero-byte file isn't gzip
+            if self._buffer or not self.block_lengths and not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_next()
+        super().close()
+
+
+class IndexingTarFile(tarfile.TarFile):
+    """Records where each member's header and data land in the tar stream
+
+    The header offset covers any PAX extended header in front of the member,
+    so the bytes from `offset` to the end of the data are a tar archive of
+    that member alone. Regular files are hashed as they are copied in.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index: List[Dict] = []
+
+    def addfile(self, tarinfo, fileobj=None, *args, **kwargs):
+        offset = self.offset
+        reader = HashingReader(fileobj) if fileobj is not None else None
+        super().addfile(tarinfo, reader, *args, **kwargs)
+        # Data is padded to whole 512 byte records
+        padded = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE if tarinfo.isreg() else 0
+        self.index.append({
+            'path': tarinfo.name,
+            'offset': offset,
+            'data_offset': self.offset - padded,
+            'size': tarinfo.size if tarinfo.isreg() else 0,
+            'sha256': reader.sha256.hexdigest() if reader else None,
+        })
+
+
+def write_index(index_path: Path, archive_name: str, compressor: ParallelGzipWriter,
+                members: List[Dict]) -> Dict:
+    """Write an archive's member index next to it (<name>.index.json.gz)
+
+    `blocks` holds the compressed offset of every gzip member; block i covers
+    tar bytes [i * block_size, (i + 1) * block_size).
+    """
+    blocks, offset = [], 0
+    for length in compressor.block_lengths:
+        blocks.append(offset)
+        offset += length
+    index = {
+        'version': INDEX_VERSION,
+        'archive': archive_name,
+        'block_size': compressor.block_size,
+        'size': compressor.bytes_in,
+        'compressed_size': offset,
+        'blocks': blocks,
+        'members': members,
+    }
+    data = gzip.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'), mtime=0)
+    temp_path = index_path.with_name(f".{index_path.name}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, index_path)
+    return {'file': index_path.name, 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def archive_volume(name: str, source: str, output_dir: str, level: int = 6,
+                   threads: int = 0, block_size: int = DEFAULT_BLOCK_SIZE) -> Dict:
+    """Archive one volume to <output_dir>/<name>.tar.gz and its member index (runs in a worker process)"""
+    started = time.monotonic()
+    threads = threads or os.cpu_count() or 1
+    output_path = Path(output_dir) / f"{name}.tar.gz"
+    temp_path = output_path.with_name(f".{output_path.name}.tmp")
+
+    with open(temp_path, 'wb') as raw, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        hashing = HashingWriter(raw)
+        compressor = ParallelGzipWriter(hashing, executor, level, block_size, max_pending=threads * 2)
+        # Same member layout as `cd <volume> && tar czf <name>.tar.gz .`
+        with IndexingTarFile.open(fileobj=compressor, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            tar.add(source, arcname='.')
+        compressor.close()
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temp_path, output_path)
+    index = write_index(output_path.with_name(index_name(output_path.name)), output_path.name,
+                        compressor, tar.index)
+
+    return {
+        'file': output_path.name,
+        'sha256': hashing.sha256.hexdigest(),
+        'bytes_in': compressor.bytes_in,
+        'bytes_out': hashing.bytes_written,
+        'seconds': time.monotonic() - started,
+        'index': index,
+    }
+
+
+def tee_stream(source: BinaryIO, output_path: Path, chunk_size: int = DEFAULT_BLOCK_SIZE) -> Dict:
+    """Copy a stream (e.g. pg_dump output) to a file, hashing it on the way"""
+    started = time.monotonic()
+    temp_path = output_path.with_name(f".{output_path.name}.tmp")
+    with open(temp_path, 'wb') as raw:
+        hashing = HashingWriter(raw)
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            hashing.write(chunk)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temp_path, output_path)
+
+    return {
+        'file': output_path.name,
+        'sha256': hashing.sha256.hexdigest(),
+        'bytes_in': hashing.bytes_written,
+        'bytes_out': hashing.bytes_written,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def read_checksums(checksums_path: Path) -> Dict[str, str]:
+    """Read a sha256sum-format file into {file name: digest}"""
+    checksums = {}
+    if checksums_path.exists():
+        for line in checksums_path.read_text().splitlines():
+            digest, _, file_name = line.partition('  ')
+            if file_name:
+                checksums[file_name[2:] if file_name.startswith('./') else file_name] = digest
+    return checksums
+
+
+def write_checksums(checksums_path: Path, results: List[Dict]):
+    """Merge digests into a sha256sum-compatible checksums file"""
+    # Several pipeline steps may record digests; lock the backup directory
+    # itself so the read-modify-write is serialized without a stray lock file
+    lock_fd = os.open(checksums_path.parent, os.O_RDONLY)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        checksums = read_checksums(checksums_path)
+        for result in results:
+            checksums[result['file']] = result['sha256']
+
+        temp_path = checksums_path.with_name(f".{checksums_path.name}.tmp")
+        temp_path.write_text(''.join(f"{digest}  ./{file_name}\n" for file_name, digest in sorted(checksums.items())))
+        os.replace(temp_path, checksums_path)
+    finally:
+        os.close(lock_fd)
+
+
+def checksum_coverage(backup_dir: Path) -> Tuple[List[str], List[str]]:
+    """Find artifacts missing from checksums.txt or modified after it was written
+
+    Returns (missing, stale). Both empty means every artifact has a digest
+    that was taken from the bytes currently on disk; nothing is hashed here.
+    """
+    checksums_path = backup_dir / CHECKSUMS_FILE
+    if not checksums_path.exists():
+        return sorted(entry.name for entry in os.scandir(backup_dir)
+                      if entry.is_file() and not entry.name.startswith('.')), []
+    checksums_mtime = checksums_path.stat().st_mtime_ns
+    recorded = read_checksums(checksums_path)
+
+    missing, stale = [], []
+    for entry in os.scandir(backup_dir):
+        if entry.name == CHECKSUMS_FILE or entry.name.startswith('.') or not entry.is_file():
+            continue
+        if entry.name not in recorded:
+            missing.append(entry.name)
+        elif entry.stat().st_mtime_ns > checksums_mtime:
+            stale.append(entry.name)
+    return sorted(missing), sorted(stale)
+
+
+def parse_volume(value: str) -> Tuple[str, str]:
+    name, sep, path = value.partition('=')
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError(f"expected NAME=PATH, got {value!r}")
+    return name, path
+
+
+def run_archive(args: argparse.Namespace) -> int:
+    jobs = args.jobs or len(args.volume)
+    results = []
+    failed = False
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(archive_volume, name, path, args.output, args.level, args.threads, args.block_size): name
+            for name, path in args.volume
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Failed to archive {name}: {e}")
+                failed = True
+                continue
+            rate = result['bytes_in'] / result['seconds'] / 1024 / 1024 if result['seconds'] else 0
+            logger.info(f"Archived {name}: {result['bytes_in']} -> {result['bytes_out']} bytes "
+                        f"in {result['seconds']:.1f}s ({rate:.1f} MiB/s)")
+            results.extend([result, result['index']])
+
+    if args.checksums:
+        write_checksums(Path(args.checksums), results)
+    return 1 if failed else 0
+
+
+def run_tee(args: argparse.Namespace) -> int:
+    output_path = Path(args.output)
+    result = tee_stream(sys.stdin.buffer, output_path)
+    logger.info(f"Wrote {output_path.name}: {result['bytes_out']} bytes in {result['seconds']:.1f}s")
+    if args.checksums:
+        write_checksums(Path(args.checksums), [result])
+    return 0
+
+
+def run_coverage(args: argparse.Namespace) -> int:
+    missing, stale = checksum_coverage(Path(args.backup_dir))
+    for name in missing:
+        logger.warning(f"No checksum recorded for {name}")
+    for name in stale:
+        logger.warning(f"{name} changed after its checksum was recorded")
+    return 1 if missing or stale else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Paperless-ngx backup pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    archive = subparsers.add_parser('archive', help='Archive volumes in parallel')
+    archive.add_argument('--output', required=True, help='Backup directory to write archives into')
+    archive.add_argument('--volume', action='append', type=parse_volume, required=True, metavar='NAME=PATH',
+                         help='Volume to archive as NAME.tar.gz (repeatable)')
+    archive.add_argument('--jobs', type=int, default=0, help='Volumes to archive at once (default: one per volume)')
+    archive.add_argument('--threads', type=int, default=0, help='Compression threads per volume (default: CPU count)')
+    archive.add_argument('--level', type=int, default=6, help='gzip compression level')
+    archive.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Bytes per independently compressed block')
+    archive.add_argument('--checksums', help='sha256sum-format file to record archive digests in')
+    archive.set_defaults(func=run_archive)
+
+    tee = subparsers.add_parser('tee', help='Write stdin to a file, recording its digest as it is written')
+    tee.add_argument('--output', required=True, help='File to write')
+    tee.add_argument('--checksums', help='sha256sum-format file to record the digest in')
+    tee.set_defaults(func=run_tee)
+
+    coverage = subparsers.add_parser('coverage', help='Check every artifact has an up-to-date checksum (no hashing)')
+    coverage.add_argument('backup_dir')
+    coverage.set_defaults(func=run_coverage)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
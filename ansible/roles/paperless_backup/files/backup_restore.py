@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Restore Engine for Paperless-ngx
+Streams each volume archive from the backup source through gunzip into a
+staging directory beside its target while the other volumes and the database
+load run alongside. The staged volume replaces the target only once the
+download matched checksums.txt.
+Single files or subtrees are restored with ranged reads through each
+archive's member index.
+"""
+
+import io
+import gzip
+import json
+import zlib
+import time
+import shlex
+import shutil
+import hashlib
+import logging
+import tarfile
+import argparse
+import subprocess
+import concurrent.futures
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from backup_pipeline import INDEX_VERSION, index_name
+from backup_verify import (CHECKSUMS_FILE, LocalSource, RateLimiter, RcloneSource, VerifyError,
+                           parse_bandwidth, parse_checksums)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+DATABASE_FILE = 'database.sql'
+# Blocks between two wanted ranges read through rather than starting another
+# read; each rclone cat costs a round trip to the remote
+DEFAULT_MAX_GAP_BLOCKS = 4
+# Bound on the blocks held in memory for one read (a larger single file is read whole)
+MAX_READ_BLOCKS = 64
+
+
+class RestoreError(Exception):
+    """Raised when an artifact cannot be restored"""
+
+
+class MeteredReader(io.RawIOBase):
+    """Counts the bytes read from a stream and the time spent waiting on it
+
+    Stacking one per stage (download, then decompression) lets the time of
+    each stage be told apart even though they run interleaved in one thread.
+    """
+
+    def __init__(self, raw: BinaryIO, limiter: Optional[RateLimiter] = None, hash_bytes: bool = False):
+        self.raw = raw
+        self.limiter = limiter
+        self.sha256 = hashlib.sha256() if hash_bytes else None
+        self.bytes_read = 0
+        self.seconds = 0.0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        started = time.monotonic()
+        data = self.raw.read(min(len(buffer), CHUNK_SIZE))
+        if self.limiter:
+            self.limiter.consume(len(data))
+        self.seconds += time.monotonic() - started
+        buffer[:len(data)] = data
+        if self.sha256:
+            self.sha256.update(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+
+class FragmentReader(io.RawIOBase):
+    """Reads an iterator of byte strings as one stream"""
+
+    def __init__(self, fragments: Iterator[bytes]):
+        self.fragments = fragments
+        self._buffer = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            fragment = next(self.fragments, None)
+            if fragment is None:
+                return 0
+            self._buffer = memoryview(fragment)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def run_command(command: List[str], stream: Optional[BinaryIO] = None):
+    """Run a command with `stream` (if any) piped into its stdin, raising RestoreError if it fails"""
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE if stream is not None else subprocess.DEVNULL)
+    if stream is not None:
+        try:
+            shutil.copyfileobj(stream, proc.stdin, CHUNK_SIZE)
+            proc.stdin.close()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+    if proc.wait() != 0:
+        raise RestoreError(f"{shlex.join(command)} exited with status {proc.returncode}")
+
+
+class DirectorySink:
+    """Extracts a tar stream into <root>/<volume>, replacing what was there
+
+    The stream is extracted into a hidden staging directory beside the
+    target. commit() swaps it in once the caller checked the download;
+    discard() deletes it and leaves the target as it was.
+
+    With replace=False the stream is extracted over the existing contents,
+    for restoring single files, and commit() and discard() do nothing.
+    """
+
+    def __init__(self, root: str, replace: bool = True):
+        self.root = Path(root)
+        self.replace = replace
+
+    def _staging(self, name: str) -> Path:
+        return self.root / f".{name}.restoring"
+
+    def restore(self, name: str, stream: BinaryIO):
+        target = self.root / name
+        if self.replace:
+            target = self._staging(name)
+            shutil.rmtree(target, ignore_errors=True)
+        target.mkdir(parents=True, exist_ok=not self.replace)
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            # The 'tar' filter (where available) refuses members escaping the target
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extractall(target, numeric_owner=True, filter='tar')
+            else:
+                tar.extractall(target, numeric_owner=True)
+
+    def commit(self, name: str):
+        if not self.replace:
+            return
+        target, replaced = self.root / name, self.root / f".{name}.replaced"
+        if target.exists():
+            target.rename(replaced)
+        self._staging(name).rename(target)
+        shutil.rmtree(replaced, ignore_errors=True)
+
+    def discard(self, name: str):
+        if self.replace:
+            shutil.rmtree(self._staging(name), ignore_errors=True)
+
+
+class CommandSink:
+    """Pipes a stream into a command's stdin (e.g. psql)
+
+    A command cannot be taken back: commit() and discard() do nothing, and a
+    stream that fails its check afterwards is only reported.
+    """
+
+    def __init__(self, command: List[str]):
+        self.command = command
+
+    def restore(self, name: str, stream: BinaryIO):
+        run_command(self.command, stream)
+
+    def commit(self, name: str):
+        pass
+
+    def discard(self, name: str):
+        pass
+
+
+class DockerVolumeSink:
+    """Extracts a tar stream into the Docker volume <prefix><volume>
+
+    The stream is extracted into a staging directory inside the volume, so
+    the swap in commit() renames entries on one filesystem instead of
+    copying them. discard() deletes the staging directory.
+
+    With replace=False the stream is extracted over the existing contents
+    and commit() and discard() do nothing.
+    """
+
+    STAGING_DIR = '.paperless-restore'
+
+    def __init__(self, prefix: str, image: str = 'alpine:latest', replace: bool = True):
+        self.prefix = prefix
+        self.image = image
+        self.replace = replace
+
+    def _run(self, name: str, script: str, stream: Optional[BinaryIO] = None):
+        run_command(['docker', 'run', '--rm'] + (['-i'] if stream is not None else []) +
+                    ['-v', f"{self.prefix}{name}:/target", self.image, 'sh', '-c', script], stream)
+
+    def restore(self, name: str, stream: BinaryIO):
+        if self.replace:
+            staging = f"/target/{self.STAGING_DIR}"
+            self._run(name, f"rm -rf {staging} && mkdir {staging} && tar xf - -C {staging}", stream)
+        else:
+            self._run(name, 'tar xf - -C /target', stream)
+
+    def commit(self, name: str):
+        if self.replace:
+            staging = f"/target/{self.STAGING_DIR}"
+            self._run(name, f"find /target -mindepth 1 -maxdepth 1 ! -name {self.STAGING_DIR} -exec rm -rf {{}} + && "
+                            f"find {staging} -mindepth 1 -maxdepth 1 -exec mv {{}} /target/ \\; && rmdir {staging}")
+
+    def discard(self, name: str):
+        if self.replace:
+            self._run(name, f"rm -rf /target/{self.STAGING_DIR}")
+
+
+def restore_artifact(source, backup_name: str, file_name: str, name: str, sink,
+                     expected: Optional[str] = None, limiter: Optional[RateLimiter] = None) -> Dict:
+    """Stream one artifact into its sink, timing each stage
+
+    The download is hashed as it streams through. The sink's staged copy
+    replaces its target (commit) only once the digest matched `expected`;
+    on a mismatch or any failure it is discarded.
+    """
+    started = time.monotonic()
+    try:
+        with source.open(backup_name, file_name) as raw:
+            download = MeteredReader(raw, limiter, hash_bytes=expected is not None)
+            if file_name.endswith('.gz'):
+                gz = gzip.GzipFile(fileobj=io.BufferedReader(download, CHUNK_SIZE), mode='rb')
+                decompress = MeteredReader(gz)
+                sink.restore(name, io.BufferedReader(decompress, CHUNK_SIZE))
+                # Read to the end so the trailing gzip member and the digest are complete
+                while decompress.read(CHUNK_SIZE):
+                    pass
+            else:
+                decompress = None
+                sink.restore(name, io.BufferedReader(download, CHUNK_SIZE))
+            while download.read(CHUNK_SIZE):
+                pass
+        if expected is not None and download.sha256.hexdigest() != expected:
+            raise RestoreError(f"{file_name} does not match checksums.txt")
+    except BaseException:
+        sink.discard(name)
+        raise
+    sink.commit(name)
+    seconds = time.monotonic() - started
+
+    download_seconds = download.seconds
+    decompress_seconds = decompress.seconds - download_seconds if decompress else 0.0
+    return {
+        'name': name,
+        'file': file_name,
+        'seconds': seconds,
+        'stages': {
+            'download': (download.bytes_read, download_seconds),
+            'decompress': (decompress.bytes_read, decompress_seconds) if decompress else None,
+            'write': (decompress.bytes_read if decompress else download.bytes_read,
+                      seconds - (decompress.seconds if decompress else download_seconds)),
+        },
+    }
+
+
+def load_index(source, backup_name: str, archive_name: str, expected: Optional[str] = None,
+               limiter: Optional[RateLimiter] = None) -> Dict:
+    """Read an archive's member index (<volume>.index.json.gz)"""
+    file_name = index_name(archive_name)
+    with source.open(backup_name, file_name) as raw:
+        data = raw.read()
+    if limiter:
+        limiter.consume(len(data))
+    if expected is not None and hashlib.sha256(data).hexdigest() != expected:
+        raise RestoreError(f"{file_name} does not match checksums.txt")
+    index = json.loads(gzip.decompress(data))
+    if index.get('version') != INDEX_VERSION:
+        raise RestoreError(f"{file_name} has unsupported version {index.get('version')}")
+    return index
+
+
+def member_end(member: Dict) -> int:
+    """Offset just past the member's data, padded to whole tar records"""
+    return member['data_offset'] + -(-member['size'] // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def select_members(index: Dict, paths: List[str]) -> List[Dict]:
+    """Members that are one of `paths` or below one of them, in archive order"""
+    wanted = [path.strip('/').removeprefix('./') for path in paths]
+    selected = []
+    for member in index['members']:
+        path = member['path'].removeprefix('./')
+        if any(not prefix or path == prefix or path.startswith(prefix + '/') for prefix in wanted):
+            selected.append(member)
+    return selected
+
+
+def plan_reads(index: Dict, members: List[Dict], max_gap_blocks: int = DEFAULT_MAX_GAP_BLOCKS,
+               max_blocks: int = MAX_READ_BLOCKS) -> List[Tuple[int, int, List[Dict]]]:
+    """Group members into reads of consecutive blocks: [(first, last, members)]
+
+    Members close together share a read, so a subtree stored contiguously
+    costs a few reads however many files it holds.
+    """
+    block_size = index['block_size']
+    reads: List[Tuple[int, int, List[Dict]]] = []
+    for member in members:
+        first, last = member['offset'] // block_size, (member_end(member) - 1) // block_size
+        if reads:
+            read_first, read_last, read_members = reads[-1]
+            if first - read_last - 1 <= max_gap_blocks and max(last, read_last) - read_first < max_blocks:
+                reads[-1] = (read_first, max(last, read_last), read_members + [member])
+                continue
+        reads.append((first, last, [member]))
+    return reads
+
+
+def decompress_members(data: bytes) -> bytes:
+    """Decompress back-to-back gzip members; each one checks its own CRC"""
+    blocks = []
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        blocks.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            raise RestoreError("truncated gzip member")
+        data = decompressor.unused_data
+    return b''.join(blocks)
+
+
+def read_fragments(source, backup_name: str, archive_name: str, index: Dict, members: List[Dict],
+                   limiter: Optional[RateLimiter] = None, max_gap_blocks: int = DEFAULT_MAX_GAP_BLOCKS,
+                   stats: Optional[Dict] = None) -> Iterator[bytes]:
+    """Yield each member's tar records (header through data), checking file digests
+
+    Only the blocks holding the members are read; every member's bytes make
+    a tar archive of that member alone, so together they extract with tar.
+    """
+    block_size, blocks = index['block_size'], index['blocks']
+    for first, last, read_members in plan_reads(index, members, max_gap_blocks):
+        start = blocks[first]
+        end = blocks[last + 1] if last + 1 < len(blocks) else index['compressed_size']
+        data = source.read_range(backup_name, archive_name, start, end - start)
+        if limiter:
+            limiter.consume(len(data))
+        if len(data) != end - start:
+            raise RestoreError(f"short read of {archive_name} at byte {start}")
+        try:
+            tar_bytes = decompress_members(data)
+        except zlib.error as e:
+            raise RestoreError(f"corrupt gzip member in {archive_name} between bytes {start} and {end}: {e}") from e
+        base = first * block_size
+        if stats is not None:
+            stats['reads'] += 1
+            stats['bytes_read'] += len(data)
+        for member in read_members:
+            if member['sha256'] is not None:
+                content = tar_bytes[member['data_offset'] - base:member['data_offset'] - base + member['size']]
+                if hashlib.sha256(content).hexdigest() != member['sha256']:
+                    raise RestoreError(f"{member['path']} in {archive_name} does not match its index")
+            yield tar_bytes[member['offset'] - base:member_end(member) - base]
+    # End-of-archive marker
+    yield bytes(2 * tarfile.BLOCKSIZE)
+
+
+def restore_paths(source, backup_name: str, name: str, paths: List[str], sink, verify: bool = True,
+                  limiter: Optional[RateLimiter] = None, max_gap_blocks: int = DEFAULT_MAX_GAP_BLOCKS) -> Dict:
+    """Restore files or subtrees of one volume from ranged reads of its archive"""
+    started = time.monotonic()
+    archive_name = f"{name}.tar.gz"
+    files = source.list_files(backup_name)
+    if archive_name not in files:
+        raise RestoreError(f"{archive_name} not found in backup")
+    if index_name(archive_name) not in files:
+        raise RestoreError(f"{archive_name} has no member index; restore the whole volume instead")
+    expected = None
+    if verify and CHECKSUMS_FILE in files:
+        with source.open(backup_name, CHECKSUMS_FILE) as raw:
+            expected = parse_checksums(raw.read()).get(index_name(archive_name))
+
+    index = load_index(source, backup_name, archive_name, expected, limiter)
+    if index['compressed_size'] != files[archive_name]:
+        raise RestoreError(f"{archive_name} is {files[archive_name]} bytes, its index expects "
+                           f"{index['compressed_size']}")
+    members = select_members(index, paths)
+    if not members:
+        raise RestoreError(f"No member of {archive_name} matches {', '.join(paths)}")
+
+    stats = {'reads': 0, 'bytes_read': 0}
+    fragments = read_fragments(source, backup_name, archive_name, index, members, limiter, max_gap_blocks, stats)
+    stream = io.BufferedReader(FragmentReader(fragments), CHUNK_SIZE)
+    try:
+        sink.restore(name, stream)
+        # Drain so every digest is checked even if the sink stopped early
+        while stream.read(CHUNK_SIZE):
+            pass
+    except BaseException:
+        sink.discard(name)
+        raise
+    sink.commit(name)
+    return {
+        'name': name,
+        'files': sum(1 for member in members if member['sha256'] is not None),
+        'bytes': sum(member['size'] for member in members),
+        'reads': stats['reads'],
+        'bytes_read': stats['bytes_read'],
+        'archive_bytes': index['compressed_size'],
+        'seconds': time.monotonic() - started,
+    }
+
+
+def parse_restore_path(value: str) -> Tuple[str, str]:
+    name, sep, path = value.partition(':')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"expected VOLUME:PATH, got {value!r}")
+    return name, path
+
+
+def format_rate(bytes_done: int, seconds: float) -> str:
+    rate = bytes_done / seconds / 1024 / 1024 if seconds > 0 else 0
+    return f"{bytes_done / 1024 / 1024:.1f} MiB in {seconds:.1f}s ({rate:.1f} MiB/s)"
+
+
+def restore_backup(source, backup_name: str, volume_sink, db_sink=None, volumes: Optional[List[str]] = None,
+                   verify: bool = True, limiter: Optional[RateLimiter] = None) -> List[Dict]:
+    """Restore every volume and the database concurrently"""
+    files = source.list_files(backup_name)
+    checksums: Dict[str, str] = {}
+    if verify and CHECKSUMS_FILE in files:
+        with source.open(backup_name, CHECKSUMS_FILE) as raw:
+            checksums = parse_checksums(raw.read())
+
+    jobs = {}
+    for file_name in sorted(files):
+        if file_name.endswith('.tar.gz'):
+            name = file_name[:-len('.tar.gz')]
+            if volumes is None or name in volumes:
+                jobs[name] = (file_name, volume_sink)
+    for name in volumes or []:
+        if name not in jobs:
+            logger.warning(f"{name}.tar.gz not found in backup")
+    if db_sink is not None:
+        if DATABASE_FILE in files:
+            jobs['database'] = (DATABASE_FILE, db_sink)
+        else:
+            logger.warning("Database backup not found, skipping database restore")
+
+    results, errors = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor:
+        futures = {
+            executor.submit(restore_artifact, source, backup_name, file_name, name, sink,
+                            checksums.get(file_name), limiter): name
+            for name, (file_name, sink) in jobs.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except (RestoreError, VerifyError, OSError, EOFError, tarfile.TarError, gzip.BadGzipFile,
+                    zlib.error) as e:
+                logger.error(f"✗ Failed to restore {name}: {e}")
+                errors.append(name)
+                continue
+            stages = ', '.join(f"{stage} {format_rate(*numbers)}"
+                               for stage, numbers in result['stages'].items() if numbers)
+            logger.info(f"✓ Restored {name} in {result['seconds']:.1f}s: {stages}")
+            results.append(result)
+
+    if errors:
+        raise RestoreError(f"Failed to restore: {', '.join(sorted(errors))}")
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Restore a Paperless-ngx backup by streaming it')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--remote', help='rclone path holding the backups (e.g. remote:paperless-backup)')
+    source_group.add_argument('--source-dir', help='Local directory holding the backups instead of a remote')
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument('--target-dir', help='Extract each volume into TARGET_DIR/<volume>')
+    target_group.add_argument('--docker-volume-prefix', help='Extract each volume into the Docker volume PREFIX<volume>')
+    parser.add_argument('--docker-image', default='alpine:latest', help='Image used to extract into Docker volumes')
+    parser.add_argument('--db-command', help='Command whose stdin receives database.sql (e.g. psql); skipped if unset')
+    parser.add_argument('--volumes', help='Comma-separated volumes to restore (default: every archive in the backup)')
+    parser.add_argument('--rclone', default='rclone', help='rclone binary')
+    parser.add_argument('--bwlimit', type=parse_bandwidth, default=0, help='Combined download cap, e.g. 50M')
+    parser.add_argument('--no-verify', action='store_true', help='Skip checking downloads against checksums.txt')
+    parser.add_argument('--path', action='append', type=parse_restore_path, metavar='VOLUME:PATH',
+                        help='Restore only this file or directory (e.g. media:documents/originals/0001.pdf) '
+                             'over the existing contents, reading just its blocks (repeatable)')
+    parser.add_argument('--max-gap', type=int, default=DEFAULT_MAX_GAP_BLOCKS,
+                        help='Blocks between wanted members read through instead of starting a new read')
+    parser.add_argument('backup', help='Backup to restore (e.g. backup-20240101_020000)')
+    args = parser.parse_args(argv)
+
+    source = RcloneSource(args.remote, args.rclone) if args.remote else LocalSource(args.source_dir)
+    replace = not args.path
+    if args.target_dir:
+        volume_sink = DirectorySink(args.target_dir, replace)
+    else:
+        volume_sink = DockerVolumeSink(args.docker_volume_prefix, args.docker_image, replace)
+    db_sink = CommandSink(shlex.split(args.db_command)) if args.db_command else None
+    volumes = args.volumes.split(',') if args.volumes else None
+    limiter = RateLimiter(args.bwlimit) if args.bwlimit else None
+
+    started = time.monotonic()
+    if args.path:
+        paths: Dict[str, List[str]] = {}
+        for name, path in args.path:
+            paths.setdefault(name, []).append(path)
+        failed = False
+        for name, volume_paths in sorted(paths.items()):
+            try:
+                result = restore_paths(source, args.backup, name, volume_paths, volume_sink,
+                                       verify=not args.no_verify, limiter=limiter, max_gap_blocks=args.max_gap)
+            except (RestoreError, VerifyError, OSError, EOFError, ValueError, tarfile.TarError, zlib.error) as e:
+                logger.error(f"✗ Failed to restore from {name}: {e}")
+                failed = True
+                continue
+            logger.info(f"✓ Restored {result['files']} file(s) ({result['bytes']} bytes) from {name} "
+                        f"with {result['reads']} read(s) of {result['bytes_read']} of {result['archive_bytes']} "
+                        f"archive bytes in {result['seconds']:.1f}s")
+        return 1 if failed else 0
+
+    try:
+        results = restore_backup(source, args.backup, volume_sink, db_sink, volumes,
+                                 verify=not args.no_verify, limiter=limiter)
+    except (RestoreError, VerifyError) as e:
+        logger.error(str(e))
+        return 1
+
+    downloaded = sum(r['stages']['download'][0] for r in results)
+    logger.info(f"Restored {len(results)} artifact(s) from {args.backup}: "
+                f"{format_rate(downloaded, time.monotonic() - started)} overall")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Retention Engine for Paperless-ngx Backups
+Applies a grandfather-father-son policy to local and cloud backups from one
+remote listing, plus an optional age limit for local copies, deleting
+expired backups concurrently and recording every deletion in the backup
+catalog
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import subprocess
+import concurrent.futures
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backup_verify import RcloneSource, VerifyError
+from backup_catalog import BackupCatalog, DEFAULT_CATALOG_PATH, parse_backup_timestamp
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Bucket keys for each policy rule; a backup is kept when it is the newest in
+# its bucket and the rule has not yet kept its quota of buckets
+RULES: Dict[str, Callable[[str, datetime], Tuple]] = {
+    'last': lambda name, when: (name,),
+    'daily': lambda name, when: (when.year, when.month, when.day),
+    'weekly': lambda name, when: tuple(when.isocalendar()[:2]),
+    'monthly': lambda name, when: (when.year, when.month),
+}
+
+
+class RetentionPolicy:
+    """How many backups each grandfather-father-son rule keeps
+
+    `last` keeps the newest N backups, `daily`/`weekly`/`monthly` keep the
+    newest backup of each of the N most recent days/ISO weeks/months that
+    have one. A backup kept by any rule survives; with only `last` set this
+    is the flat keep-the-newest-N retention.
+    """
+
+    def __init__(self, last: int = 0, daily: int = 0, weekly: int = 0, monthly: int = 0):
+        self.counts = {'last': last, 'daily': daily, 'weekly': weekly, 'monthly': monthly}
+        if max(self.counts.values()) < 1:
+            raise ValueError("Retention policy must keep at least one backup")
+
+    def __str__(self) -> str:
+        return ', '.join(f"{rule} {count}" for rule, count in self.counts.items() if count)
+
+    def apply(self, timestamps: Dict[str, int]) -> Dict[str, List[str]]:
+        """Return {backup name: rules keeping it} (empty list = expired)"""
+        reasons: Dict[str, List[str]] = {name: [] for name in timestamps}
+        remaining = dict(self.counts)
+        last_bucket: Dict[str, Optional[Tuple]] = {rule: None for rule in RULES}
+        for name in sorted(timestamps, key=lambda n: (timestamps[n], n), reverse=True):
+            when = datetime.fromtimestamp(timestamps[name])
+            for rule, bucket_of in RULES.items():
+                if remaining[rule] <= 0:
+                    continue
+                bucket = bucket_of(name, when)
+                if bucket != last_bucket[rule]:
+                    last_bucket[rule] = bucket
+                    remaining[rule] -= 1
+                    reasons[name].append(rule)
+        return reasons
+
+
+def list_local_backups(backups_dir: Path) -> List[str]:
+    try:
+        return sorted(entry.name for entry in os.scandir(backups_dir)
+                      if entry.is_dir(follow_symlinks=False) and parse_backup_timestamp(entry.name) is not None)
+    except FileNotFoundError:
+        return []
+
+
+def build_plan(policy: Optional[RetentionPolicy], local: List[str], cloud: Optional[List[str]],
+               local_max_age_days: int = 0, now: Optional[float] = None) -> List[Dict]:
+    """Decide the fate of every backup, newest first
+
+    Without a policy every backup is kept and only the local age limit
+    applies. A local copy older than `local_max_age_days` is deleted even
+    when the policy keeps the backup (its cloud copy stays).
+    """
+    names = set(local) | set(cloud or [])
+    timestamps = {name: parse_backup_timestamp(name) for name in names}
+    unparsed = sorted(name for name, timestamp in timestamps.items() if timestamp is None)
+    for name in unparsed:
+        logger.warning(f"Could not parse timestamp from backup: {name}")
+    parsed = {name: timestamp for name, timestamp in timestamps.items() if timestamp is not None}
+    reasons = policy.apply(parsed) if policy is not None else {name: ['no policy'] for name in parsed}
+
+    local_cutoff = (now if now is not None else time.time()) - local_max_age_days * 86400
+    local_names, cloud_names = set(local), set(cloud or [])
+    return [{
+        'name': name,
+        'timestamp': timestamps[name],
+        'local': name in local_names,
+        'cloud': name in cloud_names,
+        'keep': bool(reasons[name]),
+        'keep_local': bool(reasons[name]) and not (local_max_age_days > 0 and timestamps[name] < local_cutoff),
+        'reasons': reasons[name],
+    } for name in sorted(reasons, key=lambda n: (timestamps[n], n), reverse=True)]
+
+
+def format_plan(plan: List[Dict], dry_run: bool) -> List[str]:
+    lines = []
+    for entry in plan:
+        where = '+'.join(location for location in ('local', 'cloud') if entry[location])
+        if entry['keep'] and entry['local'] and not entry['keep_local']:
+            lines.append(f"  ✗ {'would delete' if dry_run else 'delete '} {entry['name']} [local] "
+                         f"(past the local age limit; {', '.join(entry['reasons'])})")
+        elif entry['keep']:
+            lines.append(f"  ✓ keep    {entry['name']} [{where}] ({', '.join(entry['reasons'])})")
+        else:
+            lines.append(f"  ✗ {'would delete' if dry_run else 'delete '} {entry['name']} [{where}]")
+    return lines
+
+
+def purge_cloud(remote: str, name: str, rclone: str) -> Optional[str]:
+    """Delete one backup directory from cloud storage; returns an error or None"""
+    result = subprocess.run([rclone, 'purge', f"{remote}/{name}"], capture_output=True, text=True, timeout=3600)
+    if result.returncode != 0:
+        return result.stderr.strip() or f"exit status {result.returncode}"
+    return None
+
+
+def remove_local(backups_dir: Path, name: str) -> Optional[str]:
+    try:
+        shutil.rmtree(backups_dir / name)
+    except OSError as e:
+        return str(e)
+    return None
+
+
+def execute_plan(plan: List[Dict], backups_dir: Path, remote: Optional[str], rclone: str = 'rclone',
+                 jobs: int = 4) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str, str]]]:
+    """Delete every expired copy concurrently
+
+    Returns ([(name, location)] deleted, [(name, location, error)] failed).
+    """
+    tasks = []
+    for entry in plan:
+        if entry['cloud'] and remote and not entry['keep']:
+            tasks.append((entry['name'], 'cloud'))
+        if entry['local'] and not entry['keep_local']:
+            tasks.append((entry['name'], 'local'))
+
+    deleted, failed = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {
+            executor.submit(purge_cloud, remote, name, rclone) if location == 'cloud'
+            else executor.submit(remove_local, backups_dir, name): (name, location)
+            for name, location in tasks
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name, location = futures[future]
+            error = future.result()
+            if error:
+                logger.error(f"  ✗ Failed to delete {name} from {location} storage: {error}")
+                failed.append((name, location, error))
+            else:
+                logger.info(f"  ✓ Deleted {name} from {location} storage")
+                deleted.append((name, location))
+    return deleted, failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Apply the backup retention policy to local and cloud backups')
+    parser.add_argument('--backups-dir', required=True, help='Directory holding the local backup-* directories')
+    parser.add_argument('--remote', help='rclone path holding the cloud backups (local only if unset)')
+    parser.add_argument('--rclone', default='rclone', help='rclone binary')
+    parser.add_argument('--catalog', default=os.environ.get('BACKUP_CATALOG', DEFAULT_CATALOG_PATH),
+                        help='Backup catalog to record deletions in')
+    parser.add_argument('--registry', help='Regenerate this cloud_backup_registry.json from the catalog')
+    parser.add_argument('--catalog-history', type=int, default=50, help='Fully deleted backups to keep history for')
+    parser.add_argument('--keep-last', type=int, default=0, help='Keep the newest N backups')
+    parser.add_argument('--keep-daily', type=int, default=0, help='Keep the newest backup of each of the last N days')
+    parser.add_argument('--keep-weekly', type=int, default=0, help='Keep the newest backup of each of the last N weeks')
+    parser.add_argument('--keep-monthly', type=int, default=0, help='Keep the newest backup of each of the last N months')
+    parser.add_argument('--local-max-age-days', type=int, default=0,
+                        help='Also delete local copies older than N days (with no --keep-* option, only this applies)')
+    parser.add_argument('--jobs', type=int, default=4, help='Deletions to run at once')
+    parser.add_argument('--dry-run', action='store_true', help='Print the plan without deleting anything')
+    parser.add_argument('--json', action='store_true', help='Print the plan as JSON')
+    args = parser.parse_args(argv)
+
+    policy = None
+    if max(args.keep_last, args.keep_daily, args.keep_weekly, args.keep_monthly) > 0 or not args.local_max_age_days:
+        try:
+            policy = RetentionPolicy(args.keep_last, args.keep_daily, args.keep_weekly, args.keep_monthly)
+        except ValueError as e:
+            parser.error(str(e))
+
+    started = time.monotonic()
+    backups_dir = Path(args.backups_dir)
+    local = list_local_backups(backups_dir)
+    cloud = None
+    if args.remote:
+        try:
+            # One listing of the remote for the whole run
+            cloud = RcloneSource(args.remote, args.rclone).list_backups()
+        except VerifyError as e:
+            logger.warning(f"Could not list cloud backups, only local backups will be processed: {e}")
+    plan = build_plan(policy, local, cloud, args.local_max_age_days)
+
+    expired = [entry for entry in plan if not entry['keep'] or (entry['local'] and not entry['keep_local'])]
+    local_limit = f", local copies kept {args.local_max_age_days} day(s)" if args.local_max_age_days else ''
+    logger.info(f"{len(plan)} backup(s) found ({len(local)} local, "
+                f"{'unknown' if cloud is None else len(cloud)} cloud); policy: {policy or 'none'}{local_limit}; "
+                f"{len(expired)} to delete")
+    if args.json:
+        print(json.dumps(plan, indent=2))
+    else:
+        for line in format_plan(plan, args.dry_run):
+            logger.info(line)
+    if args.dry_run:
+        logger.info("DRY RUN complete - no actual deletions performed")
+        return 0
+
+    deleted, failed = execute_plan(plan, backups_dir, args.remote if cloud is not None else None,
+                                   args.rclone, args.jobs)
+
+    catalog = BackupCatalog(args.catalog)
+    try:
+        catalog.record_deletions(deleted)
+        # Local backups removed by anything else (by hand, a failed run cleaning up);
+        # skipped when the backup directory itself is missing, e.g. an unmounted disk
+        on_disk = set(list_local_backups(backups_dir))
+        missing = [(name, 'local') for name in catalog.live_local_backups()
+                   if name not in on_disk] if backups_dir.is_dir() else []
+        if missing:
+            logger.warning(f"{len(missing)} backup(s) missing from local storage, marking them deleted: "
+                           f"{', '.join(name for name, _ in missing)}")
+            catalog.record_deletions(missing)
+        if cloud is not None:
+            # Backups the catalog still thinks are in the cloud but the listing lacks
+            listed = set(cloud)
+            gone = [(backup['name'], 'cloud') for backup in catalog.live_cloud_backups()
+                    if backup['name'] not in listed]
+            if gone:
+                logger.warning(f"{len(gone)} backup(s) missing from cloud storage, marking them deleted: "
+                               f"{', '.join(name for name, _ in gone)}")
+                catalog.record_deletions(gone)
+        catalog.prune(args.catalog_history)
+        if args.registry:
+            catalog.export_registry(args.registry)
+    finally:
+        catalog.close()
+
+    logger.info(f"Retention finished in {time.monotonic() - started:.1f}s: "
+                f"{len(deleted)} deletion(s), {len(failed)} failure(s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
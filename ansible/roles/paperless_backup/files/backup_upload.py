@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Backup Uploader for Paperless-ngx
+Uploads a backup directory (or the new chunks of the chunk store) to the
+rclone remote in batches, recording every finished batch in the backup
+catalog so an interrupted upload resumes with the files it had not finished,
+under a time-of-day bandwidth schedule. Files larger than the part size are
+uploaded as fixed-size parts, each recorded when it finishes, so resuming
+repeats at most the file or part that was in flight.
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from backup_verify import CHUNK_SIZE, parse_bandwidth, part_name
+from backup_catalog import BackupCatalog
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# A batch closes once it holds this many bytes or files; it is the unit that
+# is recorded in the catalog. A rerun skips the batches recorded and, within
+# the interrupted one, the files rclone finished; only the files that were in
+# flight are sent twice
+DEFAULT_BATCH_SIZE = 256 * 1024 * 1024
+DEFAULT_BATCH_FILES = 1000
+# Files larger than this are uploaded as <file>.part00000, ... of this size,
+# one `rclone rcat` each; the readers in backup_verify.py join them again
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+# Seconds between rclone transfer stats; each one updates the catalog
+STATS_INTERVAL = 5
+
+# (path relative to the source directory, size, mtime_ns)
+FileEntry = Tuple[str, int, int]
+# (part entry, path of the file it belongs to, offset of the part in that file)
+PartEntry = Tuple[FileEntry, str, int]
+
+
+class UploadError(Exception):
+    """Raised when rclone fails to upload a batch"""
+
+
+class BandwidthSchedule:
+    """An rclone --bwlimit timetable such as "08:00,512K 19:00,4M 23:00,off"
+
+    A single rate ("20M") applies all day; "off" or "0" is unlimited. Each
+    entry holds from its time of day until the next one, and the last one
+    carries over midnight. rclone applies the timetable itself, also in the
+    middle of a transfer; it is parsed here to reject typos before anything
+    is uploaded and to log the rate in force.
+    """
+
+    def __init__(self, spec: str = 'off'):
+        self.spec = ' '.join(spec.split()) or 'off'
+        tokens = self.spec.split(' ')
+        # (minute of the day, bytes per second; 0 = unlimited)
+        self.slots: List[Tuple[int, int]] = []
+        for token in tokens:
+            when, comma, rate = token.rpartition(',')
+            if not comma:
+                if len(tokens) > 1:
+                    raise ValueError(f"Bandwidth schedule entry {token!r} has no time (expected HH:MM,RATE)")
+                self.slots.append((0, self._parse_rate(token)))
+                continue
+            try:
+                hours, minutes = (int(part) for part in when.split(':'))
+            except ValueError:
+                raise ValueError(f"Bad time in bandwidth schedule entry {token!r} (expected HH:MM,RATE)")
+            if not (0 <= hours < 24 and 0 <= minutes < 60):
+                raise ValueError(f"Bad time in bandwidth schedule entry {token!r}")
+            self.slots.append((hours * 60 + minutes, self._parse_rate(rate)))
+        self.slots.sort()
+
+    @staticmethod
+    def _parse_rate(value: str) -> int:
+        if value.lower() == 'off':
+            return 0
+        try:
+            # UPLOAD:DOWNLOAD pairs are allowed by rclone; only the upload rate matters here
+            return parse_bandwidth(value.split(':')[0])
+        except ValueError:
+            raise ValueError(f"Bad rate in bandwidth schedule: {value!r}")
+
+    def __str__(self) -> str:
+        return self.spec
+
+    def rate_at(self, moment: datetime) -> int:
+        """Bytes per second allowed at `moment` (0 = unlimited)"""
+        minute = moment.hour * 60 + moment.minute
+        rate = self.slots[-1][1]
+        for start, slot_rate in self.slots:
+            if start <= minute:
+                rate = slot_rate
+        return rate
+
+    def rclone_args(self) -> List[str]:
+        if not any(rate for _, rate in self.slots):
+            return []
+        return ['--bwlimit', self.spec]
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def list_upload_files(source: Path, files_from: Optional[List[str]] = None) -> List[FileEntry]:
+    """Every file to upload, sorted by path: all files below `source`, or just `files_from`"""
+    if files_from is not None:
+        entries = []
+        for path in files_from:
+            file_stat = os.stat(source / path)
+            entries.append((path, file_stat.st_size, file_stat.st_mtime_ns))
+        return sorted(entries)
+
+    entries = []
+    for directory, _, names in os.walk(source):
+        for name in names:
+            full_path = os.path.join(directory, name)
+            file_stat = os.stat(full_path)
+            entries.append((os.path.relpath(full_path, source), file_stat.st_size, file_stat.st_mtime_ns))
+    return sorted(entries)
+
+
+def plan_batches(files: List[FileEntry], batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_files: int = DEFAULT_BATCH_FILES) -> List[List[FileEntry]]:
+    """Group files in order into batches of about `batch_size` bytes or `batch_files` files"""
+    batches: List[List[FileEntry]] = []
+    batch: List[FileEntry] = []
+    batch_bytes = 0
+    for entry in files:
+        batch.append(entry)
+        batch_bytes += entry[1]
+        if batch_bytes >= batch_size or len(batch) >= batch_files:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def split_parts(files: List[FileEntry], part_size: int) -> Tuple[List[FileEntry], List[PartEntry]]:
+    """Split off the files larger than `part_size` (0 = none) into parts of that size
+
+    Each part is an entry of its own, with the mtime of its file, so the
+    catalog records and resumes parts like whole files.
+    """
+    whole: List[FileEntry] = []
+    parts: List[PartEntry] = []
+    for path, size, mtime_ns in files:
+        if part_size <= 0 or size <= part_size:
+            whole.append((path, size, mtime_ns))
+            continue
+        for number, offset in enumerate(range(0, size, part_size)):
+            parts.append(((part_name(path, number), min(part_size, size - offset), mtime_ns), path, offset))
+    return whole, parts
+
+
+def run_rclone(command: List[str], on_progress: Optional[Callable[[int], None]] = None,
+               feed: Optional[Callable[[BinaryIO], None]] = None) -> int:
+    """Run an rclone upload with JSON logging; returns the bytes rclone reports sending
+
+    `on_progress` gets the bytes sent so far from every stats line. `feed`,
+    run on its own thread, writes rclone's standard input.
+    """
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE if feed else subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    errors = []
+    feeder = None
+    if feed:
+        def feed_stdin():
+            try:
+                feed(proc.stdin.buffer)
+            except OSError as e:
+                # The file could not be read, or rclone went away (its exit status says why)
+                errors.append(str(e))
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+        feeder = threading.Thread(target=feed_stdin, name='rclone-feed', daemon=True)
+        feeder.start()
+    bytes_sent = 0
+    try:
+        for line in proc.stderr:
+            line = line.strip()
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                if line:
+                    logger.info(f"rclone: {line}")
+                continue
+            if 'stats' in record:
+                bytes_sent = record['stats'].get('bytes', bytes_sent)
+                if on_progress:
+                    on_progress(bytes_sent)
+            elif record.get('level') in ('error', 'critical'):
+                errors.append(record.get('msg', line))
+                logger.error(f"rclone: {record.get('msg', line)}")
+            elif record.get('msg'):
+                logger.info(f"rclone: {record['msg']}")
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if feeder:
+        feeder.join()
+    if proc.wait() != 0 or errors:
+        raise UploadError(errors[-1] if errors else f"rclone {command[1]} exited with status {proc.returncode}")
+    return bytes_sent
+
+
+def rclone_log_args(schedule: BandwidthSchedule) -> List[str]:
+    return ['--use-json-log', '--stats', f"{STATS_INTERVAL}s", '--stats-log-level', 'NOTICE', *schedule.rclone_args()]
+
+
+def copy_batch(source: Path, destination: str, paths: List[str], transfers: int, schedule: BandwidthSchedule,
+               rclone: str = 'rclone', on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """Upload `paths` with one `rclone copy`; returns the bytes rclone reports sending
+
+    rclone uploads up to `transfers` files at once within the combined
+    bandwidth of the schedule, and skips files already on the remote with
+    the same size and mtime.
+    """
+    with tempfile.NamedTemporaryFile('w', prefix='backup-upload-', suffix='.files') as file_list:
+        file_list.write(''.join(f"{path}\n" for path in paths))
+        file_list.flush()
+        return run_rclone([rclone, 'copy', str(source), destination, '--files-from-raw', file_list.name,
+                           '--no-traverse', '--transfers', str(transfers), *rclone_log_args(schedule)], on_progress)
+
+
+def copy_part(source: Path, destination: str, part: PartEntry, schedule: BandwidthSchedule, rclone: str = 'rclone',
+              on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """Upload one part of a file with `rclone rcat`, streaming it from the file; returns the bytes sent"""
+    (part_path, length, _), path, offset = part
+
+    def feed(stdin: BinaryIO):
+        with open(source / path, 'rb') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise OSError(f"{path} ended {remaining} bytes short of {part_path}")
+                stdin.write(data)
+                remaining -= len(data)
+
+    return run_rclone([rclone, 'rcat', f"{destination}/{part_path}", *rclone_log_args(schedule)], on_progress, feed)
+
+
+def with_retries(action: Callable[[], int], what: str, attempts: int, retry_delay: float) -> int:
+    """Run `action`, retrying it on UploadError up to `attempts` tries in all"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return action()
+        except UploadError as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"{what} failed (attempt {attempt}/{attempts}): {e}; "
+                           f"retrying in {retry_delay * attempt:.0f}s")
+            time.sleep(retry_delay * attempt)
+
+
+def upload(source: Path, destination: str, files: List[FileEntry], name: str, stage: str = 'backup',
+           catalog: Optional[BackupCatalog] = None, transfers: int = 4, schedule: Optional[BandwidthSchedule] = None,
+           batch_size: int = DEFAULT_BATCH_SIZE, batch_files: int = DEFAULT_BATCH_FILES, attempts: int = 3,
+           retry_delay: float = 30, rclone: str = 'rclone', part_size: int = DEFAULT_PART_SIZE) -> Dict:
+    """Upload `files` from `source` to the rclone path `destination` in batches
+
+    Files larger than `part_size` are uploaded part by part after the
+    batches, one part at a time so the bandwidth schedule holds. With a
+    catalog, every finished batch and part is recorded under (name, stage)
+    and whatever an earlier run already uploaded unchanged is skipped, so a
+    rerun after an interruption only sends what is missing. A failing batch
+    or part is retried `attempts` times in all before UploadError is raised.
+    """
+    schedule = schedule or BandwidthSchedule()
+    started = time.monotonic()
+    whole, parts = split_parts(files, part_size)
+    entries = whole + [part for part, _, _ in parts]
+    uploaded = catalog.begin_upload(name, stage, destination, entries) if catalog else set()
+    pending = [entry for entry in whole if entry[0] not in uploaded]
+    pending_parts = [part for part in parts if part[0][0] not in uploaded]
+    batches = plan_batches(pending, batch_size, batch_files)
+
+    total_bytes = sum(size for _, size, _ in files)
+    pending_bytes = sum(size for _, size, _ in pending) + sum(part[0][1] for part in pending_parts)
+    rate = schedule.rate_at(datetime.now())
+    logger.info(f"Uploading {name} ({stage}): {len(pending)} of {len(whole)} file(s) in {len(batches)} batch(es) "
+                f"and {len(pending_parts)} of {len(parts)} part(s), {format_bytes(pending_bytes)} of "
+                f"{format_bytes(total_bytes)}; bandwidth now {format_bytes(rate) + '/s' if rate else 'unlimited'} "
+                f"(schedule: {schedule})")
+
+    def on_progress(bytes_sent: int):
+        if catalog:
+            catalog.record_upload_in_flight(name, stage, bytes_sent)
+
+    bytes_sent = 0
+    try:
+        for number, batch in enumerate(batches, start=1):
+            batch_bytes = sum(size for _, size, _ in batch)
+            sent = with_retries(lambda: copy_batch(source, destination, [path for path, _, _ in batch], transfers,
+                                                   schedule, rclone, on_progress),
+                                f"Batch {number}/{len(batches)}", attempts, retry_delay)
+            bytes_sent += sent
+            if catalog:
+                catalog.record_upload_batch(name, stage, batch, sent)
+            elapsed = time.monotonic() - started
+            logger.info(f"  ✓ batch {number}/{len(batches)}: {len(batch)} file(s), {format_bytes(batch_bytes)} "
+                        f"({format_bytes(bytes_sent / elapsed if elapsed else 0)}/s so far)")
+        for part in pending_parts:
+            entry = part[0]
+            sent = with_retries(lambda: copy_part(source, destination, part, schedule, rclone, on_progress),
+                                f"Part {entry[0]}", attempts, retry_delay)
+            bytes_sent += sent
+            if catalog:
+                catalog.record_upload_batch(name, stage, [entry], sent)
+            elapsed = time.monotonic() - started
+            logger.info(f"  ✓ {entry[0]}: {format_bytes(entry[1])} "
+                        f"({format_bytes(bytes_sent / elapsed if elapsed else 0)}/s so far)")
+    except BaseException:
+        if catalog:
+            catalog.end_upload(name, stage, ok=False)
+        raise
+    if catalog:
+        catalog.end_upload(name, stage, ok=True)
+
+    seconds = time.monotonic() - started
+    return {
+        'name': name, 'stage': stage, 'files': len(files), 'bytes': total_bytes,
+        'skipped_files': len(whole) - len(pending), 'bytes_sent': bytes_sent,
+        'batches': len(batches), 'parts': len(parts), 'skipped_parts': len(parts) - len(pending_parts),
+        'seconds': seconds,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Upload a backup to cloud storage in resumable batches')
+    parser.add_argument('source', help='Local directory to upload from')
+    parser.add_argument('destination', help='rclone path to upload to, e.g. gdrive-crypt:paperless-backup/backup-...')
+    parser.add_argument('--files-from', help='Upload only the files listed (one path per line, relative to source)')
+    parser.add_argument('--name', help='Backup the upload belongs to (default: the source directory name)')
+    parser.add_argument('--stage', default='backup', help='Upload stage recorded in the catalog (backup, chunks)')
+    parser.add_argument('--catalog', help='Backup catalog to keep progress in (needed to resume)')
+    parser.add_argument('--transfers', type=int, default=4, help='Files uploaded at once')
+    parser.add_argument('--bwlimit', default='off',
+                        help='Bandwidth limit or rclone timetable, e.g. "08:00,512K 23:00,off" (default: off)')
+    parser.add_argument('--batch-size', default='256M', help='Bytes per batch (e.g. 256M)')
+    parser.add_argument('--batch-files', type=int, default=DEFAULT_BATCH_FILES, help='Files per batch')
+    parser.add_argument('--part-size', default='64M',
+                        help='Upload larger files as parts of this size, each resumable on its own (0 = never)')
+    parser.add_argument('--attempts', type=int, default=3, help='Tries per batch before giving up')
+    parser.add_argument('--rclone', default='rclone', help='rclone binary')
+    args = parser.parse_args(argv)
+
+    try:
+        schedule = BandwidthSchedule(args.bwlimit)
+        batch_size = parse_bandwidth(args.batch_size)
+        part_size = parse_bandwidth(args.part_size)
+    except ValueError as e:
+        parser.error(str(e))
+    if part_size < 0:
+        parser.error("--part-size must not be negative")
+    if batch_size <= 0 or args.batch_files <= 0 or args.attempts <= 0 or args.transfers <= 0:
+        parser.error("--batch-size, --batch-files, --attempts and --transfers must be positive")
+
+    source = Path(args.source)
+    name = args.name or source.name
+    try:
+        files_from = None
+        if args.files_from:
+            files_from = [line.rstrip('\n') for line in Path(args.files_from).read_text().splitlines() if line.strip()]
+        files = list_upload_files(source, files_from)
+    except OSError as e:
+        logger.error(f"Cannot list files to upload: {e}")
+        return 1
+
+    catalog = BackupCatalog(args.catalog) if args.catalog else None
+    try:
+        summary = upload(source, args.destination, files, name, args.stage, catalog, args.transfers, schedule,
+                         batch_size, args.batch_files, args.attempts, rclone=args.rclone, part_size=part_size)
+    except UploadError as e:
+        logger.error(f"✗ Upload of {name} ({args.stage}) failed: {e}")
+        if catalog:
+            logger.error("Progress is kept in the catalog; rerun the same command to resume")
+        return 1
+    finally:
+        if catalog:
+            catalog.close()
+
+    logger.info(f"✓ Uploaded {name} ({args.stage}): {summary['files']} file(s), {format_bytes(summary['bytes'])}, "
+                f"{summary['skipped_files']} already uploaded, {summary['parts']} part(s) "
+                f"({summary['skipped_parts']} already uploaded), {summary['bytes_sent']} bytes sent "
+                f"in {summary['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,974 @@
+#!/usr/bin/env python3
+"""
+Backup Verifier for Paperless-ngx
+Streams every artifact of a cloud backup through decompression, a tar member
+walk and sha256 in a single pass, without writing anything to disk, or
+spot-checks a seeded sample of every archive with rotating coverage, or
+checks a fresh upload against the local backup with one remote listing
+"""
+
+import io
+import os
+import re
+import gzip
+import json
+import math
+import zlib
+import time
+import hashlib
+import logging
+import tarfile
+import bisect
+import argparse
+import threading
+import subprocess
+import concurrent.futures
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from backup_pipeline import INDEX_VERSION, index_name
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+CHECKSUMS_FILE = 'checksums.txt'
+BACKUP_INFO_FILE = 'backup-info.txt'
+MANIFEST_FILE = 'manifest.json.gz'
+
+# Artifacts larger than backup_upload.py's part size are stored on the remote
+# as <file>.part00000, <file>.part00001, ...; sources read them back as one file
+PART_PATTERN = re.compile(r'^(?P<file>.+)\.part(?P<number>\d{5})$')
+
+# Header of every gzip member backup_pipeline.py writes (deflate, no flags, mtime=0)
+GZIP_MEMBER_MAGIC = b'\x1f\x8b\x08\x00\x00\x00\x00\x00'
+# Slot size of the sample plan, and the room read past a range for its last
+# member; holds a whole member of a 1 MiB block even if incompressible
+SAMPLE_READ_SIZE = 2 * 1024 * 1024
+# Largest single ranged read; longer ranges are read in pieces
+MAX_SAMPLE_READ_SIZE = 32 * 1024 * 1024
+# Compressed bytes fed to zlib at a time, so finding a member's end copies little
+INFLATE_FEED_SIZE = 64 * 1024
+
+
+class VerifyError(Exception):
+    """Raised when an artifact cannot be read from the backup source"""
+
+
+class RateLimiter:
+    """Caps the combined read rate of every verification thread
+
+    Each read reserves its share of the budget in arrival order and sleeps
+    until that reservation starts, so concurrent readers split the bandwidth
+    instead of each getting the full cap.
+    """
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self._next_free = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int):
+        if self.bytes_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+class VerifyingReader(io.RawIOBase):
+    """Reads through to a stream while computing its sha256, under a rate limit"""
+
+    def __init__(self, raw: BinaryIO, limiter: Optional[RateLimiter] = None):
+        self.raw = raw
+        self.limiter = limiter
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(min(len(buffer), CHUNK_SIZE))
+        if self.limiter:
+            self.limiter.consume(len(data))
+        buffer[:len(data)] = data
+        self.sha256.update(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+
+def part_name(file_name: str, number: int) -> str:
+    return f"{file_name}.part{number:05d}"
+
+
+def fold_parts(entries: Dict[str, Dict]) -> Tuple[Dict[str, Dict], Dict[str, List[int]]]:
+    """Merge the listed parts of each artifact stored in parts into one entry
+
+    Returns the entries, with each complete set of parts (numbered from 0
+    without gaps, with no whole file of the same name) replaced by one entry
+    for the artifact, and the part sizes of each such artifact. The merged
+    entry has the total size, the newest part's mtime, no sha256 and the
+    number of parts; incomplete sets stay listed as separate files.
+    """
+    numbers: Dict[str, Dict[int, str]] = {}
+    for name in entries:
+        match = PART_PATTERN.match(name)
+        if match:
+            numbers.setdefault(match.group('file'), {})[int(match.group('number'))] = name
+    folded = dict(entries)
+    parts: Dict[str, List[int]] = {}
+    for file_name, names in numbers.items():
+        if file_name in entries or sorted(names) != list(range(len(names))):
+            continue
+        members = [folded.pop(names[number]) for number in range(len(names))]
+        parts[file_name] = [member['size'] for member in members]
+        folded[file_name] = {'size': sum(parts[file_name]), 'sha256': None, 'parts': len(members)}
+        if all('mtime' in member for member in members):
+            folded[file_name]['mtime'] = max(member['mtime'] for member in members)
+    return folded, parts
+
+
+def part_spans(sizes: List[int], offset: int, count: int) -> Iterator[Tuple[int, int, int]]:
+    """(part number, offset in the part, bytes) of each part overlapping [offset, offset + count)"""
+    start = 0
+    for number, size in enumerate(sizes):
+        if count <= 0:
+            return
+        if offset < start + size:
+            length = min(count, start + size - offset)
+            yield number, offset - start, length
+            offset += length
+            count -= length
+        start += size
+
+
+class PartsReader(io.RawIOBase):
+    """Reads the parts of an artifact one after another as one stream
+
+    Each part is opened when the previous one is exhausted and closed (which
+    raises if its download failed) before the next one is opened.
+    """
+
+    def __init__(self, open_part: Callable[[str], ContextManager[BinaryIO]], names: List[str]):
+        self._open_part = open_part
+        self._names = list(names)
+        self._current: Optional[BinaryIO] = None
+        self._stack = ExitStack()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if self._current is None:
+                if not self._names:
+                    return 0
+                self._current = self._stack.enter_context(self._open_part(self._names.pop(0)))
+            data = self._current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+            self._current = None
+            self._stack.close()
+
+    def abort(self, error: BaseException):
+        """Close the part being read as if `error` had been raised while reading it"""
+        self._current = None
+        self._stack.__exit__(type(error), error, error.__traceback__)
+
+    def close(self):
+        if not self.closed:
+            self._current = None
+            self._stack.close()
+        super().close()
+
+
+@contextmanager
+def open_parts(open_part: Callable[[str], ContextManager[BinaryIO]], names: List[str]) -> Iterator[BinaryIO]:
+    reader = PartsReader(open_part, names)
+    try:
+        yield io.BufferedReader(reader, CHUNK_SIZE)
+    except BaseException as e:
+        reader.abort(e)
+        raise
+    reader.close()
+
+
+class RcloneSource:
+    """Reads backups straight from the rclone remote with `rclone cat`
+
+    Artifacts stored in parts are found by list_files and list_entries, so
+    a backup is listed before its files are read.
+    """
+
+    def __init__(self, remote: str, binary: str = 'rclone'):
+        self.remote = remote.rstrip('/')
+        self.binary = binary
+        # Part sizes of each artifact stored in parts, by (backup, file)
+        self.parts: Dict[Tuple[str, str], List[int]] = {}
+
+    def _remember_parts(self, backup_name: str, entries: Dict[str, Dict]) -> Dict[str, Dict]:
+        entries, parts = fold_parts(entries)
+        for key in [key for key in self.parts if key[0] == backup_name]:
+            del self.parts[key]
+        for file_name, sizes in parts.items():
+            self.parts[(backup_name, file_name)] = sizes
+        return entries
+
+    def _lsf(self, path: str, *args: str) -> List[str]:
+        result = subprocess.run([self.binary, 'lsf', *args, path], capture_output=True, text=True, timeout=300)
+        if result.returncode != 0:
+            raise VerifyError(f"rclone lsf {path} failed: {result.stderr.strip()}")
+        return [line.rstrip('/') for line in result.stdout.splitlines() if line]
+
+    def list_backups(self) -> List[str]:
+        return sorted(name for name in self._lsf(f"{self.remote}/", '--dirs-only') if name.startswith('backup-'))
+
+    def list_files(self, backup_name: str) -> Dict[str, int]:
+        lines = self._lsf(f"{self.remote}/{backup_name}/", '--files-only', '--format', 'sp')
+        entries = self._remember_parts(backup_name, dict((name, {'size': int(size)})
+                                                         for size, name in (line.split(';', 1) for line in lines)))
+        return {name: entry['size'] for name, entry in entries.items()}
+
+    def list_entries(self, backup_name: str) -> Dict[str, Dict]:
+        """Size, mtime and any sha256 the backend keeps, per file, from one listing
+
+        Backends that store hashes (e.g. Drive) return them without reading
+        the file; crypt remotes have none for the plaintext, so entries come
+        back without a hash there.
+        """
+        path = f"{self.remote}/{backup_name}/"
+        result = subprocess.run([self.binary, 'lsjson', '--files-only', '--no-mimetype', '--hash',
+                                 '--hash-type', 'sha256', path], capture_output=True, text=True, timeout=300)
+        if result.returncode != 0:
+            raise VerifyError(f"rclone lsjson {path} failed: {result.stderr.strip()}")
+        return self._remember_parts(backup_name, {
+            item['Path']: {'size': item['Size'], 'mtime': parse_rclone_time(item['ModTime']),
+                           'sha256': (item.get('Hashes') or {}).get('sha256')}
+            for item in json.loads(result.stdout)})
+
+    def list_tree(self, path: str) -> List[str]:
+        """Every file below a directory of the remote, relative to it (one listing)"""
+        try:
+            return self._lsf(f"{self.remote}/{path}/", '--files-only', '-R')
+        except VerifyError:
+            # A directory that was never created (e.g. no chunks uploaded yet)
+            return []
+
+    def read_range(self, backup_name: str, file_name: str, offset: int, count: int) -> bytes:
+        sizes = self.parts.get((backup_name, file_name))
+        if sizes is not None:
+            return b''.join(self.read_range(backup_name, part_name(file_name, number), part_offset, length)
+                            for number, part_offset, length in part_spans(sizes, offset, count))
+        path = f"{self.remote}/{backup_name}/{file_name}"
+        result = subprocess.run([self.binary, 'cat', '--offset', str(offset), '--count', str(count), path],
+                                capture_output=True, timeout=300)
+        if result.returncode != 0:
+            raise VerifyError(f"rclone cat {path} failed: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    def open(self, backup_name: str, file_name: str) -> ContextManager[BinaryIO]:
+        sizes = self.parts.get((backup_name, file_name))
+        if sizes is not None:
+            return open_parts(lambda name: self._cat(backup_name, name),
+                              [part_name(file_name, number) for number in range(len(sizes))])
+        return self._cat(backup_name, file_name)
+
+    @contextmanager
+    def _cat(self, backup_name: str, file_name: str) -> Iterator[BinaryIO]:
+        path = f"{self.remote}/{backup_name}/{file_name}"
+        proc = subprocess.Popen([self.binary, 'cat', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            yield proc.stdout
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors='replace').strip()
+        if proc.wait() != 0:
+            raise VerifyError(f"rclone cat {path} failed: {stderr}")
+
+
+class LocalSource:
+    """Reads backups from a local directory laid out like the remote"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        # Part sizes of each artifact stored in parts, by (backup, file)
+        self.parts: Dict[Tuple[str, str], List[int]] = {}
+
+    def _remember_parts(self, backup_name: str, entries: Dict[str, Dict]) -> Dict[str, Dict]:
+        entries, parts = fold_parts(entries)
+        for key in [key for key in self.parts if key[0] == backup_name]:
+            del self.parts[key]
+        for file_name, sizes in parts.items():
+            self.parts[(backup_name, file_name)] = sizes
+        return entries
+
+    def list_backups(self) -> List[str]:
+        return sorted(p.name for p in self.root.glob('backup-*') if p.is_dir())
+
+    def list_files(self, backup_name: str) -> Dict[str, int]:
+        backup_path = self.root / backup_name
+        if not backup_path.is_dir():
+            raise VerifyError(f"Backup {backup_name} not found in {self.root}")
+        entries = self._remember_parts(backup_name, {p.name: {'size': p.stat().st_size}
+                                                     for p in backup_path.iterdir() if p.is_file()})
+        return {name: entry['size'] for name, entry in entries.items()}
+
+    def list_entries(self, backup_name: str) -> Dict[str, Dict]:
+        """Size and mtime per file; a plain directory keeps no hashes"""
+        backup_path = self.root / backup_name
+        if not backup_path.is_dir():
+            raise VerifyError(f"Backup {backup_name} not found in {self.root}")
+        entries = {}
+        for entry in os.scandir(backup_path):
+            if entry.is_file():
+                file_stat = entry.stat()
+                entries[entry.name] = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime, 'sha256': None}
+        return self._remember_parts(backup_name, entries)
+
+    def list_tree(self, path: str) -> List[str]:
+        """Every file below a directory of the source, relative to it"""
+        root = self.root / path
+        return [str(p.relative_to(root)) for p in root.rglob('*') if p.is_file()]
+
+    def read_range(self, backup_name: str, file_name: str, offset: int, count: int) -> bytes:
+        sizes = self.parts.get((backup_name, file_name))
+        if sizes is not None:
+            return b''.join(self.read_range(backup_name, part_name(file_name, number), part_offset, length)
+                            for number, part_offset, length in part_spans(sizes, offset, count))
+        with self._open_file(backup_name, file_name) as f:
+            f.seek(offset)
+            return f.read(count)
+
+    def open(self, backup_name: str, file_name: str) -> ContextManager[BinaryIO]:
+        sizes = self.parts.get((backup_name, file_name))
+        if sizes is not None:
+            return open_parts(lambda name: self._open_file(backup_name, name),
+                              [part_name(file_name, number) for number in range(len(sizes))])
+        return self._open_file(backup_name, file_name)
+
+    @contextmanager
+    def _open_file(self, backup_name: str, file_name: str) -> Iterator[BinaryIO]:
+        try:
+            f = open(self.root / backup_name / file_name, 'rb')
+        except OSError as e:
+            raise VerifyError(str(e)) from e
+        with f:
+            yield f
+
+
+def parse_bandwidth(value: str) -> int:
+    """Parse an rclone-style bandwidth (e.g. 512K, 20M, 1G) into bytes per second"""
+    value = value.strip().upper().rstrip('B')
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(float(value or 0))
+
+
+def parse_rclone_time(value: str) -> float:
+    """Unix time of an rclone RFC 3339 ModTime (nanoseconds trimmed for fromisoformat)"""
+    value = value.replace('Z', '+00:00')
+    if '.' in value:
+        head, _, tail = value.partition('.')
+        digits = len(tail) - len(tail.lstrip('0123456789'))
+        value = f"{head}.{tail[:min(digits, 6)]}{tail[digits:]}"
+    return datetime.fromisoformat(value).timestamp()
+
+
+def parse_checksums(data: bytes) -> Dict[str, str]:
+    """Parse a sha256sum-format file into {file name: digest}"""
+    checksums = {}
+    for line in data.decode().splitlines():
+        digest, _, file_name = line.partition('  ')
+        if file_name:
+            checksums[file_name[2:] if file_name.startswith('./') else file_name] = digest
+    return checksums
+
+
+def drain(stream: BinaryIO):
+    while stream.read(CHUNK_SIZE):
+        pass
+
+
+def verify_file(source, backup_name: str, file_name: str, expected: Optional[str],
+                limiter: Optional[RateLimiter] = None) -> Dict:
+    """Verify one artifact in a single streaming pass
+
+    Archives are gunzipped (every gzip member's CRC is checked) and every tar
+    member is walked; all artifacts are hashed on the way through.
+    """
+    started = time.monotonic()
+    result = {'file': file_name, 'ok': False, 'members': None, 'bytes': 0, 'bytes_checked': 0, 'error': None}
+    try:
+        with source.open(backup_name, file_name) as raw:
+            reader = VerifyingReader(raw, limiter)
+            buffered = io.BufferedReader(reader, CHUNK_SIZE)
+            if file_name.endswith('.tar.gz'):
+                # GzipFile handles the multi-member archives backup_pipeline.py writes
+                with gzip.GzipFile(fileobj=buffered, mode='rb') as gz:
+                    with tarfile.open(fileobj=gz, mode='r|') as tar:
+                        result['members'] = sum(1 for _ in tar)
+                    drain(gz)
+            drain(buffered)
+        result['sha256'] = reader.sha256.hexdigest()
+        result['bytes'] = result['bytes_checked'] = reader.bytes_read
+        if expected is not None and result['sha256'] != expected:
+            result['error'] = f"checksum mismatch (expected {expected}, got {result['sha256']})"
+        else:
+            result['ok'] = True
+    except (VerifyError, OSError, EOFError, tarfile.TarError, gzip.BadGzipFile, zlib.error) as e:
+        result['error'] = str(e) or type(e).__name__
+    result['seconds'] = time.monotonic() - started
+    return result
+
+
+def stable_hash(*parts: str) -> int:
+    """Hash that, unlike hash(), is the same in every process"""
+    return int.from_bytes(hashlib.sha256(':'.join(parts).encode()).digest()[:8], 'big')
+
+
+class SamplePlan:
+    """Decides which parts of each artifact a sampled run checks
+
+    An archive is divided into slots of SAMPLE_READ_SIZE bytes and each run
+    checks the gzip members starting in a run of consecutive slots: at least
+    `fraction` of them, and never fewer than a `window_days` share. The next
+    day continues where the previous one stopped (from a starting slot
+    seeded by the seed, backup and file), so any `window_days` consecutive
+    daily runs check every member (each once until the walk wraps around),
+    and a run can be repeated exactly. Files that can only be checked whole (e.g. database.sql) get a
+    full pass on one day per window unless they are small enough to check
+    every time.
+    """
+
+    def __init__(self, fraction: float, window_days: int = 7, seed: str = '',
+                 full_threshold: int = 64 * 1024 * 1024, day: Optional[int] = None):
+        self.fraction = fraction
+        self.window_days = max(window_days, 1)
+        self.seed = seed
+        self.full_threshold = full_threshold
+        self.day = int(time.time() // 86400) if day is None else day
+
+    def turn(self, backup_name: str, file_name: str) -> int:
+        return (self.day + stable_hash(backup_name, file_name)) % self.window_days
+
+    def check_whole(self, backup_name: str, file_name: str, size: int) -> bool:
+        if size <= self.full_threshold:
+            return True
+        return not file_name.endswith('.tar.gz') and self.turn(backup_name, file_name) == 0
+
+    def offsets(self, backup_name: str, file_name: str, size: int) -> List[int]:
+        """Start offsets of the slots this run checks, in file order"""
+        slots = math.ceil(size / SAMPLE_READ_SIZE)
+        if not slots:
+            return []
+        count = min(slots, max(math.ceil(self.fraction * slots), math.ceil(slots / self.window_days)))
+        first = stable_hash(self.seed, backup_name, file_name) + self.day * count
+        return sorted((first + k) % slots * SAMPLE_READ_SIZE for k in range(count))
+
+    def ranges(self, backup_name: str, file_name: str, size: int) -> List[Tuple[int, int]]:
+        """The planned slots as [start, end) byte ranges, adjacent slots merged
+
+        A run's slots are consecutive, so this is one range, or two where
+        the walk wraps around the end of the file.
+        """
+        ranges: List[Tuple[int, int]] = []
+        for offset in self.offsets(backup_name, file_name, size):
+            end = min(offset + SAMPLE_READ_SIZE, size)
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((offset, end))
+        return ranges
+
+
+def count_tar_headers(block: bytes) -> int:
+    """Count valid tar headers in a decompressed block
+
+    Blocks are compressed at 1 MiB boundaries of the tar stream, a multiple
+    of the 512 byte record size, so records line up with the block start.
+    """
+    headers = 0
+    for offset in range(0, len(block) - 511, 512):
+        record = block[offset:offset + 512]
+        if record[257:262] != b'ustar':
+            continue
+        try:
+            tarfile.TarInfo.frombuf(record, 'utf-8', 'surrogateescape')
+            headers += 1
+        except tarfile.HeaderError:
+            pass
+    return headers
+
+
+def inflate_member(data: memoryview, position: int, base: int) -> Optional[Tuple[int, int]]:
+    """Decompress the gzip member starting at data[position] (`data` was read from byte `base`)
+
+    zlib checks the member's CRC32 and length trailer, so any bit-rot inside
+    the member is caught. Returns the member's compressed size and the tar
+    headers found in it, or None if it runs past the end of `data`.
+    """
+    if len(data) - position < len(GZIP_MEMBER_MAGIC):
+        return None
+    if data[position:position + len(GZIP_MEMBER_MAGIC)] != GZIP_MEMBER_MAGIC:
+        raise VerifyError(f"expected a gzip member at byte {base + position}")
+    decompressor = zlib.decompressobj(wbits=31)
+    blocks, consumed = [], position
+    try:
+        while not decompressor.eof and consumed < len(data):
+            piece = data[consumed:consumed + INFLATE_FEED_SIZE]
+            blocks.append(decompressor.decompress(piece))
+            consumed += len(piece)
+    except zlib.error as e:
+        raise VerifyError(f"corrupt gzip member at byte {base + position}: {e}") from e
+    if not decompressor.eof:
+        return None
+    return consumed - len(decompressor.unused_data) - position, count_tar_headers(b''.join(blocks))
+
+
+def check_members_between(source, backup_name: str, file_name: str, start: int, end: int,
+                          limiter: Optional[RateLimiter] = None) -> Dict:
+    """Decompress every gzip member that starts in [start, end) of an archive without an index
+
+    The first member is found by its header bytes. Members are contiguous, so
+    each one after it must start where the previous one ended. Reads run up
+    to SAMPLE_READ_SIZE past `end` so the last member can finish, in pieces
+    of at most MAX_SAMPLE_READ_SIZE. Each piece starts where the previous
+    one's last whole member ended, so only a member cut off by a piece's
+    end is read twice.
+    """
+    result = {'bytes': 0, 'bytes_checked': 0, 'members': 0}
+    offset = start
+    # Start of the next member, once the first header was found
+    position: Optional[int] = None
+    count = min(end - start + SAMPLE_READ_SIZE, MAX_SAMPLE_READ_SIZE)
+    while True:
+        read_from = offset if position is None else position
+        raw = source.read_range(backup_name, file_name, read_from, count)
+        if limiter:
+            limiter.consume(len(raw))
+        result['bytes'] += len(raw)
+        at = 0
+        if position is None:
+            at = raw.find(GZIP_MEMBER_MAGIC)
+            if at == -1:
+                if len(raw) < count:
+                    return result
+                # Skip ahead, keeping enough overlap not to miss a header split across reads
+                offset += len(raw) - len(GZIP_MEMBER_MAGIC) + 1
+                if offset >= end:
+                    return result
+                continue
+            position = read_from + at
+        data = memoryview(raw)
+        checked = 0
+        while read_from + at < end and at < len(data):
+            inflated = inflate_member(data, at, read_from)
+            if inflated is None:
+                break
+            member_size, members = inflated
+            result['bytes_checked'] += member_size
+            result['members'] += members
+            at += member_size
+            checked += 1
+        position = read_from + at
+        if position >= end or (at == len(data) and len(data) < count):
+            return result
+        if checked:
+            count = min(end - position + SAMPLE_READ_SIZE, MAX_SAMPLE_READ_SIZE)
+        elif len(data) < count:
+            raise VerifyError(f"truncated gzip member at byte {position}")
+        elif count >= MAX_SAMPLE_READ_SIZE:
+            raise VerifyError(f"gzip member at byte {position} is larger than {MAX_SAMPLE_READ_SIZE} bytes")
+        else:
+            # The member runs past what was read; read again from its header with more room
+            count = min(count * 2, MAX_SAMPLE_READ_SIZE)
+
+
+def check_indexed_members(source, backup_name: str, file_name: str, boundaries: List[int], first: int,
+                          last: int, limiter: Optional[RateLimiter] = None) -> Dict:
+    """Decompress members first..last-1 of an indexed archive, reading exactly their bytes
+
+    `boundaries` holds every member's offset followed by the archive size.
+    Consecutive members share reads of up to MAX_SAMPLE_READ_SIZE, and each
+    one must end where the index says the next one starts.
+    """
+    result = {'bytes': 0, 'bytes_checked': 0, 'members': 0}
+    member = first
+    while member < last:
+        stop = member + 1
+        while stop < last and boundaries[stop + 1] - boundaries[member] <= MAX_SAMPLE_READ_SIZE:
+            stop += 1
+        start = boundaries[member]
+        raw = source.read_range(backup_name, file_name, start, boundaries[stop] - start)
+        if limiter:
+            limiter.consume(len(raw))
+        result['bytes'] += len(raw)
+        data = memoryview(raw)
+        for number in range(member, stop):
+            member_end = boundaries[number + 1] - start
+            inflated = inflate_member(data[:member_end], boundaries[number] - start, start)
+            if inflated is None:
+                raise VerifyError(f"truncated gzip member at byte {boundaries[number]}")
+            member_size, members = inflated
+            if member_size != boundaries[number + 1] - boundaries[number]:
+                raise VerifyError(f"gzip member at byte {boundaries[number]} does not end where the index says")
+            result['bytes_checked'] += member_size
+            result['members'] += members
+        member = stop
+    return result
+
+
+def load_archive_index(source, backup_name: str, archive_name: str, size: int,
+                       expected: Optional[str] = None) -> Tuple[Optional[Dict], int]:
+    """An archive's member index, if it can be trusted, and the bytes read for it
+
+    An index that is unreadable, does not match checksums.txt or describes a
+    different archive is not used; the archive is then scanned for member
+    headers instead (the whole-file check of the index reports the problem).
+    """
+    name = index_name(archive_name)
+    try:
+        with source.open(backup_name, name) as raw:
+            data = raw.read()
+        if expected is not None and hashlib.sha256(data).hexdigest() != expected:
+            raise VerifyError("does not match checksums.txt")
+        index = json.loads(gzip.decompress(data))
+        if index.get('version') != INDEX_VERSION or index.get('compressed_size') != size:
+            raise VerifyError("does not describe the archive")
+    except (VerifyError, OSError, EOFError, ValueError, zlib.error) as e:
+        logger.warning(f"Not using {name} to sample {archive_name}: {e}")
+        return None, 0
+    return index, len(data)
+
+
+def sample_archive(source, backup_name: str, file_name: str, size: int, plan: SamplePlan,
+                   limiter: Optional[RateLimiter] = None, indexed: bool = False,
+                   index_sha256: Optional[str] = None) -> Dict:
+    """Spot-check an archive by decompressing the gzip members in the planned slots
+
+    With `indexed` the member offsets come from the archive's index, so each
+    planned range is read exactly; otherwise members are found by scanning
+    for their headers.
+    """
+    started = time.monotonic()
+    result = {'file': file_name, 'ok': False, 'members': 0, 'bytes': 0, 'bytes_checked': 0, 'error': None}
+    try:
+        index = None
+        if indexed:
+            index, index_bytes = load_archive_index(source, backup_name, file_name, size, index_sha256)
+            result['bytes'] += index_bytes
+        for start, end in plan.ranges(backup_name, file_name, size):
+            if index is not None:
+                blocks = index['blocks']
+                sample = check_indexed_members(source, backup_name, file_name, blocks + [size],
+                                               bisect.bisect_left(blocks, start), bisect.bisect_left(blocks, end),
+                                               limiter)
+            else:
+                sample = check_members_between(source, backup_name, file_name, start, end, limiter)
+            result['bytes'] += sample['bytes']
+            result['bytes_checked'] += sample['bytes_checked']
+            result['members'] += sample['members']
+        result['ok'] = True
+    except (VerifyError, OSError) as e:
+        result['error'] = str(e) or type(e).__name__
+    result['seconds'] = time.monotonic() - started
+    return result
+
+
+def verify_backup(source, backup_name: str, jobs: int = 4, limiter: Optional[RateLimiter] = None,
+                  plan: Optional[SamplePlan] = None) -> Dict:
+    """Verify every artifact of a backup concurrently (sampled when a plan is given)"""
+    started = time.monotonic()
+    files = source.list_files(backup_name)
+
+    checksums: Dict[str, str] = {}
+    if CHECKSUMS_FILE in files:
+        with source.open(backup_name, CHECKSUMS_FILE) as raw:
+            checksums = parse_checksums(raw.read())
+    else:
+        logger.warning(f"{backup_name} has no {CHECKSUMS_FILE}; only checking archives can be read")
+
+    results = [{'file': name, 'ok': False, 'error': 'listed in checksums.txt but missing'}
+               for name in sorted(set(checksums) - set(files))]
+    if plan and BACKUP_INFO_FILE not in files:
+        results.append({'file': BACKUP_INFO_FILE, 'ok': False, 'error': 'missing'})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = []
+        for name, size in sorted(files.items()):
+            if name == CHECKSUMS_FILE:
+                continue
+            if plan is None or plan.check_whole(backup_name, name, size):
+                futures.append(executor.submit(verify_file, source, backup_name, name, checksums.get(name), limiter))
+            elif name.endswith('.tar.gz'):
+                futures.append(executor.submit(sample_archive, source, backup_name, name, size, plan, limiter,
+                                               index_name(name) in files, checksums.get(index_name(name))))
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+
+    bytes_total = sum(size for name, size in files.items() if name != CHECKSUMS_FILE)
+    if MANIFEST_FILE in files:
+        chunks_result, chunk_bytes = verify_chunked(source, backup_name, jobs, limiter, plan)
+        results.append(chunks_result)
+        bytes_total += chunk_bytes
+
+    return {
+        'name': backup_name,
+        'mode': 'sampled' if plan else 'full',
+        'ok': all(r['ok'] for r in results),
+        'results': sorted(results, key=lambda r: r['file']),
+        'bytes': sum(r.get('bytes', 0) for r in results),
+        'bytes_checked': sum(r.get('bytes_checked', 0) for r in results),
+        'bytes_total': bytes_total,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def verify_chunked(source, backup_name: str, jobs: int, limiter: Optional[RateLimiter],
+                   plan: Optional[SamplePlan]) -> Tuple[Dict, int]:
+    """Check the chunks an incremental backup's manifest references
+
+    Returns the result and the manifest's logical size, which counts towards
+    the bytes a full verification covers.
+    """
+    # Only incremental backups need the chunk code
+    from backup_chunks import ChunkError, read_manifest, verify_chunks
+
+    result = {'file': 'chunks', 'ok': False, 'bytes': 0, 'bytes_checked': 0, 'error': None}
+    try:
+        with source.open(backup_name, MANIFEST_FILE) as raw:
+            manifest = read_manifest(raw.read())
+    except (VerifyError, OSError, EOFError, ValueError, ChunkError) as e:
+        result['error'] = f"cannot read {MANIFEST_FILE}: {e}"
+        return result, 0
+    size = sum(entry.get('size', 0) for entries in manifest['volumes'].values() for entry in entries)
+
+    checked = verify_chunks(source, manifest, jobs, limiter, plan)
+    result.update(bytes=checked['bytes_checked'], bytes_checked=checked['bytes_checked'],
+                  chunks=(checked['checked'], checked['referenced']), seconds=checked['seconds'])
+    errors = [f"{len(checked['missing'])} of {checked['referenced']} chunk(s) missing"] if checked['missing'] else []
+    errors += checked['corrupt']
+    if errors:
+        result['error'] = '; '.join(errors)
+    else:
+        result['ok'] = True
+    return result, size
+
+
+def check_upload(source, backup_dir: Path, modify_window: float = 1.0) -> Dict:
+    """Check an upload against the local backup it was copied from
+
+    The remote side is one listing; the local side is the checksums.txt the
+    backup wrote and a stat of each file, so nothing is read back or hashed.
+    A file is compared by sha256 when the remote keeps one and the backup
+    recorded one, otherwise by size and mtime (rclone copy keeps mtimes).
+    A file stored in parts is compared by its total size and must have all
+    its parts, uploaded after the local file was last written.
+    Extra files on the remote are ignored, like `rclone check --one-way`.
+    """
+    started = time.monotonic()
+    backup_name = backup_dir.name
+    checksums_path = backup_dir / CHECKSUMS_FILE
+    checksums = parse_checksums(checksums_path.read_bytes()) if checksums_path.exists() else {}
+    remote = source.list_entries(backup_name)
+
+    results = []
+    for entry in sorted(os.scandir(backup_dir), key=lambda e: e.name):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        local_stat = entry.stat()
+        result = {'file': entry.name, 'ok': False, 'method': None, 'bytes': local_stat.st_size, 'error': None}
+        remote_entry = remote.get(entry.name)
+        if remote_entry is None:
+            result['error'] = 'missing from remote'
+        elif remote_entry['size'] != local_stat.st_size:
+            result['error'] = f"size differs (local {local_stat.st_size}, remote {remote_entry['size']})"
+        elif remote_entry.get('parts'):
+            # Parts are written by `rclone rcat`, which stamps them with the upload time
+            result['method'] = 'parts'
+            if remote_entry['mtime'] >= local_stat.st_mtime - modify_window:
+                result['ok'] = True
+            else:
+                result['error'] = "parts on the remote are older than the local file"
+        elif remote_entry['sha256'] and entry.name in checksums:
+            result['method'] = 'hash'
+            if remote_entry['sha256'] == checksums[entry.name]:
+                result['ok'] = True
+            else:
+                result['error'] = f"checksum mismatch (expected {checksums[entry.name]}, remote {remote_entry['sha256']})"
+        else:
+            result['method'] = 'size_mtime'
+            if abs(remote_entry['mtime'] - local_stat.st_mtime) <= modify_window:
+                result['ok'] = True
+            else:
+                result['error'] = (f"modification time differs by "
+                                   f"{abs(remote_entry['mtime'] - local_stat.st_mtime):.3f}s")
+        results.append(result)
+    if not results:
+        results.append({'file': '*', 'ok': False, 'method': None, 'bytes': 0, 'error': 'no files in the local backup'})
+
+    methods = {'hash': 0, 'size_mtime': 0, 'parts': 0}
+    for r in results:
+        if r['method']:
+            methods[r['method']] += 1
+    return {
+        'name': backup_name,
+        'mode': 'upload',
+        'ok': all(r['ok'] for r in results),
+        'results': results,
+        # Nothing is read; hash matches count as checked since the remote hashed the stored bytes
+        'bytes': 0,
+        'bytes_checked': sum(r['bytes'] for r in results if r['ok'] and r['method'] == 'hash'),
+        'bytes_total': sum(r['bytes'] for r in results),
+        'methods': methods,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def record_result(catalog_path: str, summary: Dict):
+    """Record the outcome in the backup catalog for the exporter to publish"""
+    from backup_catalog import BackupCatalog
+
+    failures = [f"{r['file']}: {r['error']}" for r in summary['results'] if not r['ok']]
+    if failures:
+        detail = '; '.join(failures)
+    elif summary.get('mode') == 'upload':
+        detail = (f"upload: {summary['methods']['hash']} file(s) by hash, "
+                  f"{summary['methods']['size_mtime']} by size and mtime, "
+                  f"{summary['methods'].get('parts', 0)} in parts")
+    else:
+        detail = f"{summary.get('mode', 'full')}: read {summary['bytes']} bytes, checked {summary.get('bytes_checked', 0)}"
+    catalog = BackupCatalog(catalog_path)
+    try:
+        catalog.record_verification(summary['name'], summary['ok'], detail, mode=summary.get('mode', 'full'),
+                                    bytes_checked=summary.get('bytes_checked'), bytes_total=summary.get('bytes_total'),
+                                    seconds=summary.get('seconds'),
+                                    mismatches=failures if summary.get('mode') == 'upload' else None,
+                                    methods=summary.get('methods'))
+    finally:
+        catalog.close()
+
+
+def run_upload_check(source, backup_dir: Path, modify_window: float, catalog_path: Optional[str]) -> int:
+    logger.info(f"Checking upload of {backup_dir.name}")
+    try:
+        summary = check_upload(source, backup_dir, modify_window)
+    except (VerifyError, OSError, ValueError) as e:
+        logger.error(f"✗ {backup_dir.name}: {e}")
+        summary = {'name': backup_dir.name, 'mode': 'upload', 'ok': False, 'bytes': 0,
+                   'results': [{'file': '*', 'ok': False, 'error': str(e)}]}
+    else:
+        for r in summary['results']:
+            if not r['ok']:
+                logger.error(f"  ✗ {r['file']}: {r['error']}")
+        methods = summary['methods']
+        logger.info(f"{'✓' if summary['ok'] else '✗'} {backup_dir.name}: {len(summary['results'])} file(s) "
+                    f"({summary['bytes_total']} bytes), "
+                    f"{methods['hash']} by hash, {methods['size_mtime']} by size and mtime, "
+                    f"in {summary['seconds']:.1f}s")
+        # For record-upload, so the backup script needs no du
+        print(summary['bytes_total'])
+
+    if catalog_path:
+        try:
+            record_result(catalog_path, summary)
+        except Exception as e:
+            logger.warning(f"Failed to record verification in backup catalog: {e}")
+    return 0 if summary['ok'] else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Verify Paperless-ngx backups by streaming them')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--remote', help='rclone path holding the backups (e.g. remote:paperless-backup)')
+    source_group.add_argument('--source-dir', help='Local directory holding the backups instead of a remote')
+    parser.add_argument('--rclone', default='rclone', help='rclone binary')
+    parser.add_argument('--jobs', type=int, default=4, help='Artifacts to verify at once')
+    parser.add_argument('--bwlimit', type=parse_bandwidth, default=0,
+                        help='Combined bandwidth cap, e.g. 20M (default: unlimited)')
+    parser.add_argument('--catalog', default=os.environ.get('BACKUP_CATALOG'),
+                        help='Backup catalog to record the result in')
+    parser.add_argument('--sample', type=float, metavar='FRACTION',
+                        help='Spot-check at least this fraction of each archive instead of reading it whole')
+    parser.add_argument('--window-days', type=int, default=7,
+                        help='Sampled mode: consecutive daily runs that together check every part of every archive')
+    parser.add_argument('--seed', default='', help='Sampled mode: seed for choosing sample offsets')
+    parser.add_argument('--full-threshold', type=parse_bandwidth, default=64 * 1024 * 1024,
+                        help='Sampled mode: files up to this size (e.g. 64M) are always checked whole')
+    parser.add_argument('--local-dir', type=Path,
+                        help='Check the upload of this local backup against one remote listing instead of reading '
+                             'it back; prints the local size in bytes')
+    parser.add_argument('--modify-window', type=float, default=1.0,
+                        help='Upload check: mtime difference in seconds still counted as equal')
+    parser.add_argument('--all', action='store_true', help='Verify every backup')
+    parser.add_argument('backups', nargs='*', help='Backups to verify (default: the latest)')
+    args = parser.parse_args(argv)
+    if args.local_dir and (args.all or args.backups or args.sample):
+        parser.error("--local-dir checks a single upload; it takes no backups, --all or --sample")
+
+    source = RcloneSource(args.remote, args.rclone) if args.remote else LocalSource(args.source_dir)
+    if args.local_dir:
+        return run_upload_check(source, args.local_dir, args.modify_window, args.catalog)
+    limiter = RateLimiter(args.bwlimit) if args.bwlimit else None
+    plan = SamplePlan(args.sample, args.window_days, args.seed, args.full_threshold) if args.sample else None
+
+    try:
+        if args.all:
+            backups = source.list_backups()
+        else:
+            backups = args.backups or source.list_backups()[-1:]
+    except VerifyError as e:
+        logger.error(str(e))
+        return 1
+    if not backups:
+        logger.error("No backups found")
+        return 1
+
+    all_ok = True
+    for backup_name in backups:
+        logger.info(f"Verifying {backup_name}")
+        try:
+            summary = verify_backup(source, backup_name, args.jobs, limiter, plan)
+        except VerifyError as e:
+            logger.error(f"✗ {backup_name}: {e}")
+            summary = {'name': backup_name, 'ok': False, 'bytes': 0,
+                       'results': [{'file': '*', 'ok': False, 'error': str(e)}]}
+        else:
+            for r in summary['results']:
+                members = f", {r['members']} tar members" if r.get('members') is not None else ''
+                if r['ok']:
+                    checked = f"{r['bytes']} bytes" if r.get('sha256') else f"sampled {r['bytes_checked']} bytes"
+                    if r.get('chunks'):
+                        checked = f"hashed {r['chunks'][0]} of {r['chunks'][1]} chunks, {r['bytes_checked']} bytes"
+                    logger.info(f"  ✓ {r['file']} ({checked}{members})")
+                else:
+                    logger.error(f"  ✗ {r['file']}: {r['error']}")
+            rate = summary['bytes'] / summary['seconds'] / 1024 / 1024 if summary['seconds'] else 0
+            coverage = summary['bytes_checked'] / summary['bytes_total'] * 100 if summary['bytes_total'] else 100
+            logger.info(f"{'✓' if summary['ok'] else '✗'} {backup_name}: read {summary['bytes']} bytes "
+                        f"in {summary['seconds']:.1f}s ({rate:.1f} MiB/s), checked {coverage:.1f}%")
+
+        if args.catalog:
+            try:
+                record_result(args.catalog, summary)
+            except Exception as e:
+                logger.warning(f"Failed to record verification in backup catalog: {e}")
+        all_ok = all_ok and summary['ok']
+
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
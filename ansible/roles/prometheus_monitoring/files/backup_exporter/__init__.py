@@ -0,0 +1,27 @@
+"""
+Backup Exporter for Prometheus
+Monitors local and cloud backups for Paperless-ngx
+
+Local backups are scanned once per change through a shared BackupScan that
+pluggable collectors (timestamps, sizes, disk usage, per-type breakdown,
+checksum coverage) read from. Served over HTTP, or written for node_exporter's
+textfile collector. Run with `python3 -m backup_exporter`.
+"""
+
+from .collectors import (BackupTimestamp, ChecksumCoverage, DiskUsage, ScanCollector, TIMESTAMP_STRATEGIES,
+                         TotalSize, TypeBreakdown, default_collectors)
+from .exporter import BackupCollector, BackupExporter
+from .exposition import ExpositionWriter, Histogram, MetricFamily, encode_metrics
+from .rclone import AsyncRcloneRunner, RcloneError, RcloneTimeout
+from .scan import BackupScan, BackupScanIndex
+from .server import serve
+from .state import ExporterState
+from .textfile import TextfileWriter, render_textfile, write_textfile
+
+__all__ = [
+    'AsyncRcloneRunner', 'BackupCollector', 'BackupExporter', 'BackupScan', 'BackupScanIndex',
+    'BackupTimestamp', 'ChecksumCoverage', 'DiskUsage', 'ExporterState', 'ExpositionWriter', 'Histogram', 'MetricFamily',
+    'RcloneError', 'RcloneTimeout', 'ScanCollector', 'TIMESTAMP_STRATEGIES', 'TotalSize',
+    'TextfileWriter', 'TypeBreakdown', 'default_collectors', 'encode_metrics', 'render_textfile', 'serve',
+    'write_textfile',
+]
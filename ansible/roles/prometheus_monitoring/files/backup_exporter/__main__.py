@@ -0,0 +1,121 @@
+"""
+Command line entry point: python3 -m backup_exporter
+"""
+
+import logging
+import argparse
+from typing import List, Optional
+
+from .collectors import TIMESTAMP_STRATEGIES, default_collectors
+from .exporter import BackupCollector, BackupExporter
+from .inotify import InotifyWatcher
+from .rclone import AsyncRcloneRunner
+from .server import serve
+from .textfile import TextfileWriter, render_textfile, write_textfile
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Backup Exporter for Prometheus')
+    parser.add_argument('--backup-dir', default='/opt/backups/paperless', help='Local backup directory')
+    parser.add_argument('--rclone-remote', default='gdrive-crypt', help='Rclone remote name')
+    parser.add_argument('--port', type=int, default=9116, help='Port to serve metrics on (0 to write --textfile only)')
+    parser.add_argument('--mode', choices=['background', 'inline'], default='background',
+                        help='Collect in background workers (default) or inline on every scrape')
+    parser.add_argument('--local-interval', type=int, default=60, help='Seconds between local backup refreshes in background mode')
+    parser.add_argument('--cloud-interval', type=int, default=3600, help='Seconds between cloud backup refreshes in background mode')
+    parser.add_argument('--watch', action='store_true',
+                        help='Use inotify to rescan only changed backups as soon as they change (background mode)')
+    parser.add_argument('--rclone-concurrency', type=int, default=4, help='Maximum number of concurrent rclone processes')
+    parser.add_argument('--rclone-timeout', type=float, default=30, help='Deadline in seconds for a single rclone call')
+    parser.add_argument('--rclone-total-timeout', type=float, default=120, help='Deadline in seconds for a whole cloud refresh')
+    parser.add_argument('--catalog', help='Backup catalog database to read recorded sizes and uploads from')
+    parser.add_argument('--cloud-source', choices=['rclone', 'catalog'], default='rclone',
+                        help='List cloud backups with rclone or read them from the backup catalog')
+    parser.add_argument('--verify-window-days', type=int, default=7,
+                        help='Days of verification history that count towards backup_cloud_verify_coverage_ratio')
+    parser.add_argument('--timestamp-source', default='name,mtime',
+                        help=f"Comma-separated order of ways to date a local backup ({', '.join(TIMESTAMP_STRATEGIES)})")
+    parser.add_argument('--no-type-breakdown', action='store_true',
+                        help='Skip backup_local_type_size_bytes (per artifact sizes of each local backup)')
+    parser.add_argument('--disk-usage', action='store_true',
+                        help='Publish backup_local_allocated_bytes (disk space from st_blocks; walks every backup even '
+                             'when the catalog records its size)')
+    parser.add_argument('--scan-workers', type=int, default=4, help='Maximum number of backups scanned in parallel')
+    parser.add_argument('--logs-dir', help='Backup script logs to tail for stage durations (default: <backup-dir>/logs)')
+    parser.add_argument('--no-run-logs', action='store_true', help='Skip the backup_run_* metrics from the backup logs')
+    parser.add_argument('--state-dir',
+                        help='Writable directory to keep log offsets, stage histograms and the last snapshot '
+                             '(served at once after a restart) in')
+    parser.add_argument('--textfile',
+                        help='Also write the backup metrics to this node_exporter textfile collector file after every refresh')
+    parser.add_argument('--once', action='store_true',
+                        help='Collect once, write --textfile and exit (for cron jobs and timers)')
+    parser.add_argument('--enable-profiling', action='store_true',
+                        help='Serve /debug/profile?seconds=N&mode=cpu|memory for on-demand profiling')
+    
+    args = parser.parse_args(argv)
+    if args.once and not args.textfile:
+        parser.error("--once needs --textfile")
+    if args.textfile and not args.once and args.mode != 'background':
+        parser.error("--textfile needs --mode=background, or --once")
+    if args.port == 0 and not args.textfile:
+        parser.error("--port=0 needs --textfile")
+    
+    try:
+        collectors = default_collectors(args.timestamp_source.split(','), not args.no_type_breakdown,
+                                        args.disk_usage)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    # Create a single instance of BackupExporter for caching
+    rclone = AsyncRcloneRunner(max_concurrency=args.rclone_concurrency,
+                               call_timeout=args.rclone_timeout,
+                               total_timeout=args.rclone_total_timeout)
+    exporter = BackupExporter(args.backup_dir, args.rclone_remote, rclone,
+                              catalog_path=args.catalog, cloud_source=args.cloud_source,
+                              verify_window=args.verify_window_days * 86400, collectors=collectors,
+                              scan_workers=args.scan_workers,
+                              run_logs_dir=None if args.no_run_logs else args.logs_dir or f"{args.backup_dir}/logs",
+                              state_dir=args.state_dir)
+    if args.once:
+        snapshot = exporter.collect_snapshot()
+        exporter.save_state(snapshot)
+        try:
+            write_textfile(args.textfile, render_textfile(exporter, snapshot))
+        except OSError as e:
+            logger.error(f"Could not write {args.textfile}: {e}")
+            return 1
+        logger.info(f"Wrote {args.textfile}")
+        return 0
+    
+    source = exporter
+    if args.mode == 'background':
+        source = BackupCollector(exporter, args.local_interval, args.cloud_interval)
+        if args.textfile:
+            source.add_listener(TextfileWriter(exporter, args.textfile))
+        if exporter.state is not None:
+            source.add_listener(exporter.save_state)
+        if args.watch and InotifyWatcher.available() and exporter.backup_dir.is_dir():
+            def on_change(backup_path: Optional[str]):
+                exporter.scan_index.invalidate(backup_path)
+                source.request_refresh('local')
+            InotifyWatcher(exporter.backup_dir, on_change).start()
+            logger.info(f"Watching {exporter.backup_dir} for changes with inotify")
+        elif args.watch:
+            logger.warning("inotify is not available, falling back to polling")
+        source.start()
+    
+    if args.port:
+        serve(source, args.port, profiling=args.enable_profiling)
+    else:
+        logger.info(f"Writing {args.textfile} after every refresh, not serving HTTP")
+        source.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+"""
+Collectors that derive per-backup fields from a shared BackupScan
+
+A collector declares the fields it produces and computes them from the scan
+when the backup is (re)scanned; the results are kept in the scan index until
+the directory changes. Collectors only touch the parts of the scan they need,
+so one that reads the directory name never causes a walk.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .scan import BackupScan
+
+logger = logging.getLogger(__name__)
+
+# sha256sum-format digests recorded by backup_pipeline.py while writing
+CHECKSUMS_FILE = 'checksums.txt'
+
+# Metadata written by the backup script next to the artifacts
+BACKUP_INFO_FILE = 'backup-info.txt'
+
+# Map file names inside a backup directory to backup types
+FILE_TYPE_MAP = {
+    'database.sql': 'Database',
+    'media.tar.gz': 'Media',
+    'data.tar.gz': 'Data',
+    'export.tar.gz': 'Export',
+    'static.tar.gz': 'Static'
+}
+
+
+class ScanCollector:
+    """Base class: produce `fields` for one backup from its scan"""
+    
+    fields: Tuple[str, ...] = ()
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        raise NotImplementedError
+
+
+class TotalSize(ScanCollector):
+    """Total apparent size of the backup (walks subdirectories)"""
+    
+    fields = ('size_bytes',)
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        return {'size_bytes': scan.size_bytes}
+
+
+class DiskUsage(ScanCollector):
+    """Disk space allocated to the backup, from the same walk as TotalSize
+    
+    Differs from the apparent size for sparse files, filesystem compression
+    and block rounding, and is not recorded in the catalog, so it always
+    needs a walk.
+    """
+    
+    fields = ('allocated_bytes',)
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        return {'allocated_bytes': scan.allocated_bytes}
+
+
+class TypeBreakdown(ScanCollector):
+    """Size of each known artifact by backup type, from the top-level listing"""
+    
+    fields = ('type_sizes',)
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        return {'type_sizes': {backup_type: scan.artifacts[file_name].st_size
+                               for file_name, backup_type in FILE_TYPE_MAP.items()
+                               if file_name in scan.artifacts}}
+
+
+class ChecksumCoverage(ScanCollector):
+    """Check checksums.txt lists every artifact and none changed after it was written
+    
+    Digests are recorded while the backup is written, so this only compares
+    names and mtimes; nothing is hashed during a scrape.
+    """
+    
+    fields = ('checksum_ok',)
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        artifacts = scan.artifacts
+        checksums = artifacts.get(CHECKSUMS_FILE)
+        if checksums is None:
+            return {'checksum_ok': False}
+        try:
+            recorded = set()
+            with open(os.path.join(scan.path, CHECKSUMS_FILE)) as f:
+                for line in f:
+                    _, _, file_name = line.rstrip('\n').partition('  ')
+                    recorded.add(file_name[2:] if file_name.startswith('./') else file_name)
+        except OSError:
+            return {'checksum_ok': False}
+        return {'checksum_ok': all(name in recorded and file_stat.st_mtime_ns <= checksums.st_mtime_ns
+                                   for name, file_stat in artifacts.items()
+                                   if name != CHECKSUMS_FILE and not name.startswith('.'))}
+
+
+def timestamp_from_name(scan: BackupScan) -> Optional[datetime]:
+    """backup-YYYYMMDD_HHMMSS, as named by the backup script"""
+    try:
+        return datetime.strptime(scan.name.replace('backup-', '', 1), '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+
+
+def timestamp_from_backup_info(scan: BackupScan) -> Optional[datetime]:
+    """The `Backup Date:` line of backup-info.txt (`date` output)"""
+    try:
+        with open(os.path.join(scan.path, BACKUP_INFO_FILE)) as f:
+            for line in f:
+                if line.startswith('Backup Date:'):
+                    return datetime.strptime(line.split(':', 1)[1].strip(), '%a %b %d %H:%M:%S %Z %Y')
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def timestamp_from_mtime(scan: BackupScan) -> Optional[datetime]:
+    """Modification time of the backup directory"""
+    return datetime.fromtimestamp(scan.dir_stat.st_mtime)
+
+
+# Ways to tell when a backup was taken, tried in the configured order
+TIMESTAMP_STRATEGIES: Dict[str, Callable[[BackupScan], Optional[datetime]]] = {
+    'name': timestamp_from_name,
+    'info': timestamp_from_backup_info,
+    'mtime': timestamp_from_mtime,
+}
+
+
+class BackupTimestamp(ScanCollector):
+    """When the backup was taken, from the first strategy that yields a time"""
+    
+    fields = ('backup_time',)
+    
+    def __init__(self, strategies: Iterable[str] = ('name', 'mtime')):
+        self.strategies = list(strategies)
+        unknown = [name for name in self.strategies if name not in TIMESTAMP_STRATEGIES]
+        if unknown or not self.strategies:
+            raise ValueError(f"Unknown timestamp strategies {unknown}, choose from {', '.join(TIMESTAMP_STRATEGIES)}")
+    
+    def collect(self, scan: BackupScan) -> Dict:
+        for index, strategy in enumerate(self.strategies):
+            backup_time = TIMESTAMP_STRATEGIES[strategy](scan)
+            if backup_time is not None:
+                if index:
+                    logger.warning(f"Could not get a timestamp for {scan.name} from "
+                                   f"{', '.join(self.strategies[:index])}, using {strategy}")
+                return {'backup_time': backup_time}
+        logger.warning(f"Could not get a timestamp for {scan.name}, using the directory mtime")
+        return {'backup_time': timestamp_from_mtime(scan)}
+
+
+def default_collectors(timestamp_strategies: Iterable[str] = ('name', 'mtime'),
+                       type_breakdown: bool = True, disk_usage: bool = False) -> List[ScanCollector]:
+    """The collectors the exporter runs for every local backup
+    
+    DiskUsage is opt-in: it walks every backup, even those whose size the
+    catalog already recorded.
+    """
+    collectors = [BackupTimestamp(timestamp_strategies), TotalSize(), ChecksumCoverage()]
+    if disk_usage:
+        collectors.append(DiskUsage())
+    if type_breakdown:
+        collectors.append(TypeBreakdown())
+    return collectors
@@ -0,0 +1,678 @@
+"""
+The backup exporter: collects local and cloud backup state and renders it
+as Prometheus metrics, inline per scrape or from background snapshots
+"""
+
+import os
+import sys
+import stat
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .collectors import ScanCollector, default_collectors
+from .exposition import ExpositionWriter, Histogram, encode_metrics
+from .metrics import (BACKUP_LOCAL_COUNT, BACKUP_LOCAL_TOTAL_SIZE, BACKUP_LOCAL_SIZE, BACKUP_LOCAL_AGE,
+    BACKUP_LOCAL_TOTAL_ALLOCATED, BACKUP_LOCAL_ALLOCATED,
+    BACKUP_LOCAL_TIMESTAMP, BACKUP_LOCAL_IS_RECENT, BACKUP_LOCAL_CHECKSUM_OK, BACKUP_LOCAL_TYPE_SIZE,
+    BACKUP_UPLOAD_BYTES, BACKUP_UPLOAD_REMAINING, BACKUP_UPLOAD_THROUGHPUT, BACKUP_UPLOAD_RUNNING,
+    BACKUP_UPLOAD_UPDATED,
+    BACKUP_CLOUD_COUNT, BACKUP_CLOUD_TOTAL_SIZE, BACKUP_CLOUD_SIZE, BACKUP_CLOUD_AGE, BACKUP_CLOUD_IS_RECENT,
+    BACKUP_CLOUD_FILE_COUNT, BACKUP_CLOUD_VERIFIED_TIMESTAMP, BACKUP_CLOUD_VERIFY_COVERAGE,
+    BACKUP_CLOUD_UPLOAD_CHECK_OK, BACKUP_CLOUD_UPLOAD_CHECK_SECONDS, BACKUP_CLOUD_UPLOAD_CHECK_MISMATCHES,
+    BACKUP_CLOUD_UPLOAD_CHECK_FILES,
+    BACKUP_CLOUD_TYPE_SIZE, BACKUP_RUN_STAGE_SECONDS, BACKUP_RUN_LAST_SUCCESS, BACKUP_RUN_LAST_TIMESTAMP,
+    BACKUP_RUN_LAST_DURATION, BACKUP_RUN_LAST_STAGE_SECONDS, BACKUP_RUN_LAST_STAGE_SUCCESS,
+    BACKUP_RUN_LAST_STAGE_THROUGHPUT, BACKUP_LATEST_LOCAL_AGE, BACKUP_LATEST_CLOUD_AGE, BACKUP_LOCAL_SUCCESS,
+    BACKUP_CLOUD_SUCCESS, BACKUP_CLOUD_REFRESH_SUCCESS, EXPORTER_SIZE_CACHE_LOOKUPS, EXPORTER_SNAPSHOT_AGE,
+    EXPORTER_SNAPSHOT_RESTORED, EXPORTER_GENERATE_SECONDS, EXPORTER_PHASE_SECONDS, EXPORTER_SCAN_FILES,
+    EXPORTER_SCAN_FILES_TOTAL,
+    EXPORTER_RCLONE_CALLS, EXPORTER_RCLONE_SECONDS, EXPORTER_RUN_LOG_BYTES, EXPORTER_CLOUD_CACHE_AGE, PROCESS_RESIDENT_MEMORY,
+    PROCESS_OPEN_FDS, PROCESS_CPU_SECONDS, PROCESS_START_TIME, PROCESS_STARTED_AT)
+from .rclone import AsyncRcloneRunner, CloudInventory, StaleWhileRevalidate
+from .runlog import STAGES, RunLogTailer
+from .scan import BackupScanIndex
+from .state import ExporterState
+
+logger = logging.getLogger(__name__)
+
+
+def process_stats() -> Dict[str, float]:
+    """Resident memory, open file descriptors and CPU time of this process
+    
+    Memory and descriptors come from /proc and are left out where it is not
+    available.
+    """
+    times = os.times()
+    stats = {'cpu_seconds': times.user + times.system}
+    try:
+        with open('/proc/self/statm') as f:
+            stats['resident_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        stats['open_fds'] = len(os.listdir('/proc/self/fd'))
+    except (OSError, ValueError, IndexError):
+        pass
+    return stats
+
+
+def open_catalog(catalog_path: str, scripts_dir: str):
+    """Open the backup catalog read-only, or return None if it isn't available
+    
+    The catalog module ships with the backup scripts, so it is imported from
+    their directory rather than installed alongside the exporter.
+    """
+    if scripts_dir not in sys.path:
+        sys.path.append(scripts_dir)
+    try:
+        from backup_catalog import BackupCatalog
+        return BackupCatalog(catalog_path, readonly=True)
+    except (ImportError, sqlite3.Error) as e:
+        logger.warning(f"Backup catalog {catalog_path} not available: {e}")
+        return None
+
+
+class BackupExporter:
+    def __init__(self, backup_dir: str = "/opt/backups/paperless", rclone_remote: str = "gdrive-crypt",
+                 rclone: Optional[AsyncRcloneRunner] = None, catalog_path: Optional[str] = None,
+                 cloud_source: str = "rclone", verify_window: int = 7 * 86400,
+                 collectors: Optional[List[ScanCollector]] = None, scan_workers: int = 4,
+                 run_logs_dir: Optional[str] = None, state_dir: Optional[str] = None):
+        self.backup_dir = Path(backup_dir)
+        self.rclone_remote = rclone_remote
+        
+        # Optional backup catalog; sizes and uploads recorded there need no I/O here
+        self.catalog_path = catalog_path
+        self.cloud_source = cloud_source
+        # Window over which sampled verifications add up to the coverage gauge
+        self.verify_window = verify_window
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        
+        # Collectors share one scan per backup, and the index keeps their
+        # results so unchanged backups are not scanned on every scrape;
+        # changed ones are walked in parallel by up to `scan_workers` threads
+        self.collectors = collectors if collectors is not None else default_collectors()
+        self.scan_index = BackupScanIndex(workers=scan_workers)
+        
+        # Stage durations tailed from the backup script's logs; with a state
+        # directory the offsets and histograms survive restarts
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.run_logs = None
+        if run_logs_dir:
+            self.run_logs = RunLogTailer(Path(run_logs_dir),
+                                         self.state_dir / 'run_logs.json' if self.state_dir else None)
+        
+        # Self-instrumentation: where scrape and collection time goes
+        self.generate_seconds = Histogram()
+        self.phase_seconds = {phase: Histogram() for phase in ('local_scan', 'cloud_fetch', 'run_logs', 'serialize')}
+        self.scan_files = 0
+        self.scan_files_total = 0
+        
+        # Cloud backups are fetched off-thread and cached (refresh every hour)
+        self.rclone = rclone or AsyncRcloneRunner()
+        self.cloud_cache = StaleWhileRevalidate(
+            lambda: self.rclone.submit(self._fetch_cloud_backups), ttl=3600, initial=[])
+        
+        # Warm start: the last snapshot, scan index and cloud listing saved by
+        # the previous process, so a restart neither walks every backup nor
+        # waits for rclone before the first useful response
+        self.state = None
+        self.restored_snapshot: Optional[Dict] = None
+        self._scan_entries: Dict[str, Dict] = {}
+        if self.state_dir:
+            fields = sorted({field for collector in self.collectors for field in collector.fields})
+            self.state = ExporterState(self.state_dir / 'snapshot.json.gz', {
+                'backup_dir': str(self.backup_dir), 'rclone_remote': rclone_remote,
+                'cloud_source': cloud_source, 'fields': fields,
+            })
+            self._restore_state(set(fields))
+    
+    def _restore_state(self, fields: set):
+        state = self.state.load()
+        if state is None:
+            return
+        self.scan_index.load(state['scan_index'], fields)
+        self._scan_entries = self.scan_index.dump()
+        if state['cloud']['fetched_at'] is not None:
+            self.cloud_cache.value = state['cloud']['backups']
+            self.cloud_cache.fetched_at = state['cloud']['fetched_at']
+        self.restored_snapshot = {family: dict(state['snapshot'][family], restored=True)
+                                  for family in ('local', 'cloud')}
+        logger.info(f"Restored {len(state['snapshot']['local']['backups'])} local and "
+                    f"{len(state['snapshot']['cloud']['backups'])} cloud backup(s) saved at "
+                    f"{datetime.fromtimestamp(state['saved_at']):%Y-%m-%d %H:%M:%S}")
+    
+    def save_state(self, snapshot: Dict):
+        """Save a snapshot with the scan index and cloud listing behind it"""
+        if self.state is None or snapshot['local']['collected_at'] is None:
+            return
+        cloud = {'backups': self.cloud_cache.value, 'fetched_at': self.cloud_cache.fetched_at}
+        self.state.save(snapshot, self._scan_entries, cloud)
+    
+    def get_local_backups(self) -> List[Dict]:
+        """Get information about local backups"""
+        started = time.monotonic()
+        files_stat_before = self.scan_index.files_stat
+        backups = self._scan_local_backups()
+        if self.state is not None:
+            # Copied here, on the scanning thread, for the next save
+            self._scan_entries = self.scan_index.dump()
+        scan_files = self.scan_index.files_stat - files_stat_before + len(backups)
+        self.scan_files = scan_files
+        self.scan_files_total += scan_files
+        self.phase_seconds['local_scan'].observe(time.monotonic() - started)
+        return backups
+    
+    def poll_run_logs(self):
+        """Read whatever the backup script logged since the last poll"""
+        if self.run_logs is None:
+            return
+        started = time.monotonic()
+        self.run_logs.poll()
+        self.phase_seconds['run_logs'].observe(time.monotonic() - started)
+    
+    def _scan_local_backups(self) -> List[Dict]:
+        backups = []
+        
+        try:
+            entries = list(os.scandir(self.backup_dir))
+        except FileNotFoundError:
+            return backups
+        
+        # Sizes and checksum coverage already recorded by the backup script
+        recorded_sizes, recorded_checksums = self._query_catalog(
+            lambda catalog: (catalog.local_sizes(), catalog.local_checksums())) or ({}, {})
+        # Progress backup_upload.py keeps while a backup is being uploaded
+        uploads = self._query_catalog(lambda catalog: catalog.upload_progress()) or {}
+        
+        live = []
+        for dir_entry in entries:
+            if not dir_entry.name.startswith('backup-'):
+                continue
+            try:
+                dir_stat = dir_entry.stat()
+            except OSError:
+                continue
+            if not stat.S_ISDIR(dir_stat.st_mode):
+                continue
+            
+            # Fields the catalog recorded win; collectors only run for the rest
+            known = {}
+            if recorded_sizes.get(dir_entry.name) is not None:
+                known['size_bytes'] = recorded_sizes[dir_entry.name]
+            if recorded_checksums.get(dir_entry.name) is not None:
+                known['checksum_ok'] = recorded_checksums[dir_entry.name]
+            needed = [collector for collector in self.collectors
+                      if any(field not in known for field in collector.fields)]
+            live.append((dir_entry, dir_stat, known, needed))
+        
+        # Backups that changed are scanned in parallel; the rest are index hits
+        fields = self.scan_index.lookup_many([(dir_entry.path, dir_stat, needed)
+                                              for dir_entry, dir_stat, _, needed in live])
+        
+        now = datetime.now()
+        for (dir_entry, _, known, _), backup_fields in zip(live, fields):
+            if backup_fields is None:
+                continue
+            try:
+                backup_name = dir_entry.name
+                backup = dict(backup_fields)
+                backup.update(known)
+                if backup_name in uploads:
+                    backup['uploads'] = uploads[backup_name]
+                
+                backup_time = backup['backup_time']
+                backup.update({
+                    'name': backup_name,
+                    'path': dir_entry.path,
+                    # Convert backup_time to Unix timestamp for Prometheus
+                    'backup_timestamp': int(backup_time.timestamp()),
+                    'age_hours': (now - backup_time).total_seconds() / 3600,
+                    'is_recent': (now - backup_time).total_seconds() < 25 * 3600  # Within 25 hours
+                })
+                backups.append(backup)
+            except Exception as e:
+                logger.error(f"Error processing backup {dir_entry.path}: {e}")
+        
+        self.scan_index.prune([dir_entry.path for dir_entry, _, _, _ in live])
+        return sorted(backups, key=lambda x: x['backup_time'], reverse=True)
+    
+    def get_cloud_backups(self, wait: Optional[float] = None) -> List[Dict]:
+        """Get information about cloud backups using rclone with caching
+        
+        Never blocks for longer than `wait` seconds. By default it only waits
+        (up to the rclone total deadline) when nothing has been fetched yet.
+        """
+        if self.cloud_source == 'catalog':
+            backups = self._get_catalog_cloud_backups()
+        else:
+            if wait is None:
+                wait = self.rclone.total_timeout if self.cloud_cache.fetched_at is None else 0.0
+            backups = self.cloud_cache.get(wait)
+        
+        # Verification results recorded by backup_verify.py (copies; the cached list is shared)
+        verified, coverage, upload_checks = self._query_catalog(
+            lambda catalog: (catalog.verified_timestamps(), catalog.verify_coverage(self.verify_window),
+                             catalog.upload_checks())) or ({}, {}, {})
+        if verified or coverage or upload_checks:
+            backups = [dict(backup, verified_timestamp=verified.get(backup['name']),
+                            verify_coverage=coverage.get(backup['name'], 0.0),
+                            upload_check=upload_checks.get(backup['name'])) for backup in backups]
+        return backups
+    
+    def _query_catalog(self, query: Callable):
+        """Run a read-only query against the backup catalog, or return None"""
+        if not self.catalog_path:
+            return None
+        with self._catalog_lock:
+            if self._catalog is None:
+                self._catalog = open_catalog(self.catalog_path, str(self.backup_dir / "scripts"))
+                if self._catalog is None:
+                    return None
+            try:
+                return query(self._catalog)
+            except sqlite3.Error as e:
+                logger.error(f"Error querying backup catalog: {e}")
+                self._catalog.close()
+                self._catalog = None
+                return None
+    
+    def _get_catalog_cloud_backups(self) -> List[Dict]:
+        """Get information about cloud backups recorded in the backup catalog"""
+        started = time.monotonic()
+        backups = []
+        for entry in self._query_catalog(lambda catalog: catalog.live_cloud_backups()) or []:
+            backup_time = datetime.fromtimestamp(entry['uploaded_at'])
+            backups.append({
+                'name': entry['name'],
+                'size_bytes': entry['size_bytes'] or 0,
+                'backup_time': backup_time,
+                'backup_timestamp': entry['uploaded_at'],
+            })
+        self.phase_seconds['cloud_fetch'].observe(time.monotonic() - started)
+        return backups
+    
+    async def _fetch_cloud_backups(self) -> List[Dict]:
+        """Fetch cloud backups from rclone (runs on the rclone loop)"""
+        logger.info("Fetching fresh cloud backup data from rclone")
+        started = time.monotonic()
+        backups = []
+        
+        # One recursive listing for everything; failures propagate so the cache keeps its last value
+        inventory = CloudInventory()
+        await self.rclone.run("lsjson", "-R", "--files-only", "--no-mimetype",
+                              f"{self.rclone_remote}:paperless-backup", on_line=inventory.feed)
+        
+        for backup_name, entry in inventory.backups.items():
+            # rclone keeps the local mtimes, so the newest file marks when the backup finished
+            backup_time = entry['newest_mtime']
+            
+            # Convert backup_time to naive datetime for comparison
+            backup_time_naive = backup_time.replace(tzinfo=None)
+            
+            backups.append({
+                'name': backup_name,
+                'size_bytes': entry['size_bytes'],
+                'file_count': entry['file_count'],
+                'type_sizes': entry['types'],
+                'backup_time': backup_time,
+                'backup_timestamp': int(backup_time.timestamp()),
+                'age_hours': (datetime.now() - backup_time_naive).total_seconds() / 3600,
+                'is_recent': (datetime.now() - backup_time_naive).total_seconds() < 25 * 3600
+            })
+        
+        self.phase_seconds['cloud_fetch'].observe(time.monotonic() - started)
+        return sorted(backups, key=lambda x: x['backup_time'], reverse=True)
+    
+    def collect_snapshot(self) -> Dict:
+        """Collect local and cloud state into a snapshot that can be rendered later"""
+        now = time.time()
+        self.poll_run_logs()
+        return {
+            'local': {'backups': self.get_local_backups(), 'collected_at': now},
+            'cloud': {'backups': self.get_cloud_backups(), 'collected_at': now},
+        }
+    
+    def generate_metrics(self) -> str:
+        """Generate Prometheus metrics"""
+        started = time.monotonic()
+        snapshot = self.collect_snapshot()
+        metrics = self.render_metrics(snapshot)
+        self.save_state(snapshot)
+        self.generate_seconds.observe(time.monotonic() - started)
+        return metrics
+    
+    def render(self) -> bytes:
+        """Collect and render inline, encoded for the HTTP server"""
+        return self.generate_metrics().encode('utf-8')
+    
+    def is_ready(self) -> bool:
+        """Inline mode collects on demand, so it is always ready"""
+        return True
+    
+    def render_metrics(self, snapshot: Dict) -> str:
+        """Render Prometheus metrics from a snapshot without touching storage"""
+        started = time.monotonic()
+        def render(writer: ExpositionWriter):
+            self.write_backup_metrics(snapshot, writer)
+            self.write_freshness_metrics(snapshot, writer)
+            self.write_self_metrics(writer)
+        body = encode_metrics(render).decode('utf-8')
+        self.phase_seconds['serialize'].observe(time.monotonic() - started)
+        return body
+    
+    def write_backup_metrics(self, snapshot: Dict, writer: ExpositionWriter):
+        """Write the metrics that only change when the snapshot changes"""
+        now = time.time()
+        
+        local_backups = snapshot['local']['backups']
+        cloud_backups = snapshot['cloud']['backups']
+        
+        # Ages are derived at render time so they keep moving between refreshes
+        def age_hours(backup: Dict) -> float:
+            return (now - backup['backup_timestamp']) / 3600
+        
+        def is_recent(backup: Dict) -> int:
+            return 1 if age_hours(backup) < 25 else 0  # Within 25 hours
+        
+        # Local backup metrics
+        writer.sample(BACKUP_LOCAL_COUNT, len(local_backups))
+        writer.sample(BACKUP_LOCAL_TOTAL_SIZE, sum(b.get('size_bytes', 0) for b in local_backups))
+        if any('allocated_bytes' in b for b in local_backups):
+            writer.sample(BACKUP_LOCAL_TOTAL_ALLOCATED, sum(b.get('allocated_bytes', 0) for b in local_backups))
+        
+        # Individual local backup metrics (each family written contiguously)
+        for backup in local_backups:
+            if 'size_bytes' in backup:
+                writer.sample(BACKUP_LOCAL_SIZE, backup['size_bytes'], backup['name'])
+        for backup in local_backups:
+            if 'allocated_bytes' in backup:
+                writer.sample(BACKUP_LOCAL_ALLOCATED, backup['allocated_bytes'], backup['name'])
+        for backup in local_backups:
+            writer.sample(BACKUP_LOCAL_AGE, age_hours(backup), backup['name'])
+        for backup in local_backups:
+            writer.sample(BACKUP_LOCAL_TIMESTAMP, backup['backup_timestamp'], backup['name'])
+        for backup in local_backups:
+            writer.sample(BACKUP_LOCAL_IS_RECENT, is_recent(backup), backup['name'])
+        for backup in local_backups:
+            writer.sample(BACKUP_LOCAL_CHECKSUM_OK, 1 if backup.get('checksum_ok') else 0, backup['name'])
+        for backup in local_backups:
+            for backup_type, size_bytes in backup.get('type_sizes', {}).items():
+                writer.sample(BACKUP_LOCAL_TYPE_SIZE, size_bytes, backup['name'], backup_type)
+        
+        # Upload progress per stage, as of the uploader's last report
+        upload_stages = [(backup['name'], stage, progress) for backup in local_backups
+                         for stage, progress in sorted(backup.get('uploads', {}).items())]
+        for name, stage, progress in upload_stages:
+            writer.sample(BACKUP_UPLOAD_BYTES, progress['bytes_total'], name, stage)
+        for name, stage, progress in upload_stages:
+            remaining = progress['bytes_total'] - progress['bytes_done'] - progress['bytes_in_flight']
+            writer.sample(BACKUP_UPLOAD_REMAINING, max(remaining, 0), name, stage)
+        for name, stage, progress in upload_stages:
+            elapsed = progress['updated_at'] - progress['run_started_at']
+            sent = progress['run_bytes_sent'] + progress['bytes_in_flight']
+            writer.sample(BACKUP_UPLOAD_THROUGHPUT, sent / elapsed if elapsed > 0 else 0, name, stage)
+        for name, stage, progress in upload_stages:
+            writer.sample(BACKUP_UPLOAD_RUNNING, 1 if progress['status'] == 'running' else 0, name, stage)
+        for name, stage, progress in upload_stages:
+            writer.sample(BACKUP_UPLOAD_UPDATED, progress['updated_at'], name, stage)
+        
+        # Cloud backup metrics
+        writer.sample(BACKUP_CLOUD_COUNT, len(cloud_backups))
+        writer.sample(BACKUP_CLOUD_TOTAL_SIZE, sum(b['size_bytes'] for b in cloud_backups))
+        
+        # Individual cloud backup metrics
+        for backup in cloud_backups:
+            writer.sample(BACKUP_CLOUD_SIZE, backup['size_bytes'], backup['name'])
+        for backup in cloud_backups:
+            writer.sample(BACKUP_CLOUD_AGE, age_hours(backup), backup['name'])
+        for backup in cloud_backups:
+            writer.sample(BACKUP_CLOUD_IS_RECENT, is_recent(backup), backup['name'])
+        for backup in cloud_backups:
+            if 'file_count' in backup:
+                writer.sample(BACKUP_CLOUD_FILE_COUNT, backup['file_count'], backup['name'])
+        for backup in cloud_backups:
+            if backup.get('verified_timestamp') is not None:
+                writer.sample(BACKUP_CLOUD_VERIFIED_TIMESTAMP, backup['verified_timestamp'], backup['name'])
+        for backup in cloud_backups:
+            if 'verify_coverage' in backup:
+                writer.sample(BACKUP_CLOUD_VERIFY_COVERAGE, backup['verify_coverage'], backup['name'])
+        for backup in cloud_backups:
+            for backup_type, size_bytes in backup.get('type_sizes', {}).items():
+                writer.sample(BACKUP_CLOUD_TYPE_SIZE, size_bytes, backup['name'], backup_type)
+        
+        # Post-upload checks, as recorded by backup_verify.py --local-dir
+        checked = [(backup['name'], backup['upload_check']) for backup in cloud_backups if backup.get('upload_check')]
+        for name, check in checked:
+            writer.sample(BACKUP_CLOUD_UPLOAD_CHECK_OK, 1 if check['ok'] else 0, name)
+        for name, check in checked:
+            if check['seconds'] is not None:
+                writer.sample(BACKUP_CLOUD_UPLOAD_CHECK_SECONDS, check['seconds'], name)
+        for name, check in checked:
+            writer.sample(BACKUP_CLOUD_UPLOAD_CHECK_MISMATCHES, len(check['mismatches']), name)
+        for name, check in checked:
+            for method, files in sorted(check['methods'].items()):
+                writer.sample(BACKUP_CLOUD_UPLOAD_CHECK_FILES, files, name, method)
+        
+        # Backup runs, from the backup script's logs
+        if self.run_logs is not None:
+            self.write_run_metrics(writer)
+        
+        # Backup health metrics
+        latest_local = local_backups[0] if local_backups else None
+        latest_cloud = cloud_backups[0] if cloud_backups else None
+        
+        writer.sample(BACKUP_LATEST_LOCAL_AGE, age_hours(latest_local) if latest_local else -1)
+        writer.sample(BACKUP_LATEST_CLOUD_AGE, age_hours(latest_cloud) if latest_cloud else -1)
+        
+        # Backup success indicators
+        writer.sample(BACKUP_LOCAL_SUCCESS, is_recent(latest_local) if latest_local else 0)
+        writer.sample(BACKUP_CLOUD_SUCCESS, is_recent(latest_cloud) if latest_cloud else 0)
+        
+        if self.cloud_source == 'catalog':
+            cloud_ok = self._catalog is not None
+        else:
+            cloud_ok = self.cloud_cache.fetched_at is not None and self.cloud_cache.last_error is None
+        writer.sample(BACKUP_CLOUD_REFRESH_SUCCESS, 1 if cloud_ok else 0)
+        
+        # Scan index effectiveness
+        writer.sample(EXPORTER_SIZE_CACHE_LOOKUPS, self.scan_index.hits, 'hit')
+        writer.sample(EXPORTER_SIZE_CACHE_LOOKUPS, self.scan_index.misses, 'miss')
+    
+    def write_run_metrics(self, writer: ExpositionWriter):
+        """Write stage histograms and the outcome of the last finished backup run"""
+        runs = self.run_logs.snapshot()
+        for stage in STAGES:
+            writer.histogram(BACKUP_RUN_STAGE_SECONDS, runs['histograms'][stage], stage)
+        last_run = runs['last_run']
+        if last_run is None:
+            return
+        writer.sample(BACKUP_RUN_LAST_SUCCESS, 1 if last_run['success'] else 0)
+        writer.sample(BACKUP_RUN_LAST_TIMESTAMP, last_run['finished_at'])
+        writer.sample(BACKUP_RUN_LAST_DURATION, last_run['finished_at'] - last_run['started_at'])
+        stages = [(stage, last_run['stages'][stage]) for stage in STAGES if stage in last_run['stages']]
+        for stage, result in stages:
+            writer.sample(BACKUP_RUN_LAST_STAGE_SECONDS, result['seconds'], stage)
+        for stage, result in stages:
+            writer.sample(BACKUP_RUN_LAST_STAGE_SUCCESS, 1 if result['ok'] else 0, stage)
+        for stage, result in stages:
+            if result['bytes'] and result['seconds'] > 0:
+                writer.sample(BACKUP_RUN_LAST_STAGE_THROUGHPUT, result['bytes'] / result['seconds'], stage)
+    
+    def write_freshness_metrics(self, snapshot: Dict, writer: ExpositionWriter):
+        """Write the metrics that must stay live even if no new snapshot arrives"""
+        now = time.time()
+        
+        # Snapshot freshness per family (-1 until the first collection finished)
+        for family in ('local', 'cloud'):
+            collected_at = snapshot[family]['collected_at']
+            writer.sample(EXPORTER_SNAPSHOT_AGE, now - collected_at if collected_at is not None else -1, family)
+        for family in ('local', 'cloud'):
+            writer.sample(EXPORTER_SNAPSHOT_RESTORED, 1 if snapshot[family].get('restored') else 0, family)
+    
+    def write_self_metrics(self, writer: ExpositionWriter):
+        """Write the exporter's own timings, scan cost, rclone usage and process stats"""
+        writer.histogram(EXPORTER_GENERATE_SECONDS, self.generate_seconds)
+        for phase, histogram in self.phase_seconds.items():
+            writer.histogram(EXPORTER_PHASE_SECONDS, histogram, phase)
+        writer.sample(EXPORTER_SCAN_FILES, self.scan_files)
+        writer.sample(EXPORTER_SCAN_FILES_TOTAL, self.scan_files_total)
+        
+        rclone_stats = self.rclone.stats()
+        for (command, result), count in sorted(rclone_stats['calls'].items()):
+            writer.sample(EXPORTER_RCLONE_CALLS, count, command, result)
+        for command, histogram in sorted(rclone_stats['durations'].items()):
+            writer.histogram(EXPORTER_RCLONE_SECONDS, histogram, command)
+        if self.run_logs is not None:
+            writer.sample(EXPORTER_RUN_LOG_BYTES, self.run_logs.snapshot()['bytes_read'])
+        
+        if self.cloud_source == 'rclone' and self.cloud_cache.fetched_at is not None:
+            writer.sample(EXPORTER_CLOUD_CACHE_AGE, time.time() - self.cloud_cache.fetched_at)
+        else:
+            writer.sample(EXPORTER_CLOUD_CACHE_AGE, -1)
+        
+        stats = process_stats()
+        if 'resident_bytes' in stats:
+            writer.sample(PROCESS_RESIDENT_MEMORY, stats['resident_bytes'])
+        if 'open_fds' in stats:
+            writer.sample(PROCESS_OPEN_FDS, stats['open_fds'])
+        writer.sample(PROCESS_CPU_SECONDS, stats['cpu_seconds'])
+        writer.sample(PROCESS_START_TIME, PROCESS_STARTED_AT)
+
+
+class BackupCollector:
+    """Refreshes backup state in the background so scrapes never touch storage
+    
+    Local and cloud state are refreshed by separate worker threads on their own
+    schedules. Each refresh builds a new snapshot and swaps it in with a single
+    reference assignment, so /metrics only ever renders a complete snapshot.
+    
+    Every published snapshot gets a new generation number. The backup metrics
+    are rendered once per generation (and at least every `max_render_age`
+    seconds, so ages keep moving) and reused in between; only the snapshot age
+    is rendered per request.
+    
+    request_refresh() wakes a worker early, which is how the inotify watcher
+    gets changes published within seconds without polling the disk.
+    
+    Listeners added with add_listener() are called with every published
+    snapshot, which is how the textfile output and the saved state are kept
+    current.
+    
+    A snapshot the exporter restored from its state directory is served from
+    the start, so the exporter is ready before its first refresh; each family
+    stays marked as restored until that refresh publishes over it.
+    """
+    
+    def __init__(self, exporter: BackupExporter, local_interval: int = 60, cloud_interval: int = 3600,
+                 max_render_age: float = 60, debounce: float = 2.0):
+        self.exporter = exporter
+        self.local_interval = local_interval
+        self.cloud_interval = cloud_interval
+        self.max_render_age = max_render_age
+        self.debounce = debounce
+        self._wake = {'local': threading.Event(), 'cloud': threading.Event()}
+        self.snapshot = {
+            'generation': 0,
+            'local': {'backups': [], 'collected_at': None},
+            'cloud': {'backups': [], 'collected_at': None},
+        }
+        if exporter.restored_snapshot is not None:
+            self.snapshot = dict(exporter.restored_snapshot, generation=1)
+        # (generation, rendered at, encoded backup metrics) for the latest rendered snapshot
+        self._rendered: Optional[Tuple[int, float, bytes]] = None
+        # Serializes writers; readers just take the current reference
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._listeners: List[Callable[[Dict], None]] = []
+    
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Call `listener` with each snapshot after it is published"""
+        self._listeners.append(listener)
+    
+    def _publish(self, family: str, backups: List[Dict]):
+        with self._swap_lock:
+            snapshot = dict(self.snapshot)
+            snapshot[family] = {'backups': backups, 'collected_at': time.time()}
+            snapshot['generation'] += 1
+            self.snapshot = snapshot
+            # Under the lock so listeners see snapshots in generation order
+            for listener in self._listeners:
+                listener(snapshot)
+    
+    def refresh_local(self):
+        """Read new backup log lines, rescan local backups and publish them"""
+        self.exporter.poll_run_logs()
+        self._publish('local', self.exporter.get_local_backups())
+    
+    def refresh_cloud(self):
+        """Refresh cloud backups and publish them"""
+        # Off the scrape path, so it is fine to wait for the bounded reload
+        self._publish('cloud', self.exporter.get_cloud_backups(wait=self.exporter.rclone.total_timeout))
+    
+    def request_refresh(self, family: str):
+        """Wake the worker for `family` instead of waiting for its next interval"""
+        self._wake[family].set()
+    
+    def _run(self, refresh, interval: int, wake: threading.Event):
+        while not self._stop.is_set():
+            try:
+                refresh()
+            except Exception as e:
+                logger.error(f"Background refresh {refresh.__name__} failed: {e}")
+            if wake.wait(interval) and not self._stop.is_set():
+                # Let a burst of change notifications settle into one refresh
+                self._stop.wait(self.debounce)
+            wake.clear()
+    
+    def start(self):
+        """Start the background refresh workers"""
+        for family, refresh, interval in (('local', self.refresh_local, self.local_interval),
+                                          ('cloud', self.refresh_cloud, self.cloud_interval)):
+            thread = threading.Thread(target=self._run, args=(refresh, interval, self._wake[family]),
+                                      name=refresh.__name__, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self):
+        """Ask the background workers to exit after their current refresh"""
+        self._stop.set()
+        for wake in self._wake.values():
+            wake.set()
+    
+    def wait(self):
+        """Block until stop() is called (daemon mode without the HTTP server)"""
+        self._stop.wait()
+    
+    def generate_metrics(self) -> str:
+        """Render metrics from the latest published snapshot"""
+        return self.render().decode('utf-8')
+    
+    def render(self) -> bytes:
+        """Return the encoded metrics for the latest snapshot"""
+        started = time.monotonic()
+        snapshot = self.snapshot
+        rendered = self._rendered
+        now = time.time()
+        if (rendered is None or rendered[0] != snapshot['generation'] or
+            now - rendered[1] >= self.max_render_age):
+            body = encode_metrics(lambda writer: self.exporter.write_backup_metrics(snapshot, writer))
+            rendered = self._rendered = (snapshot['generation'], now, body)
+        
+        def render_live(writer: ExpositionWriter):
+            self.exporter.write_freshness_metrics(snapshot, writer)
+            self.exporter.write_self_metrics(writer)
+        live = encode_metrics(render_live)
+        # Background mode collects off the scrape path, so serializing is the whole response
+        elapsed = time.monotonic() - started
+        self.exporter.phase_seconds['serialize'].observe(elapsed)
+        self.exporter.generate_seconds.observe(elapsed)
+        return rendered[2] + live
+    
+    def is_ready(self) -> bool:
+        """Ready once local backups have been collected at least once"""
+        return self.snapshot['local']['collected_at'] is not None
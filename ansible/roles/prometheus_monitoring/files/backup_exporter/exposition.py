@@ -0,0 +1,149 @@
+"""
+Prometheus text exposition format: metric families, histograms and a writer
+that streams samples into a buffer or socket
+"""
+
+import io
+import math
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def escape_label_value(value: str) -> str:
+    """Escape a label value as required by the text exposition format"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample_value(value) -> str:
+    """Format a sample value the way Prometheus parses it"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class MetricFamily:
+    """A metric family declared once with its HELP, TYPE and label names
+    
+    The HELP/TYPE header and the label-name part of every sample are encoded
+    up front, so writing a sample only formats the label values and the value.
+    """
+    
+    def __init__(self, name: str, help_text: str, metric_type: str = 'gauge', labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.labelnames = labelnames
+        help_text = help_text.replace('\\', '\\\\').replace('\n', '\\n')
+        self.header = f"# HELP {name} {help_text}\n# TYPE {name} {metric_type}\n".encode('utf-8')
+        self._label_prefixes = [f'{label}="' for label in labelnames]
+    
+    def encode_sample(self, value, labelvalues: Tuple = (), suffix: str = '', le: Optional[float] = None) -> bytes:
+        """Encode one sample line (`suffix` and `le` are for histogram series)"""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        labels = [prefix + escape_label_value(str(labelvalue)) + '"'
+                  for prefix, labelvalue in zip(self._label_prefixes, labelvalues)]
+        if le is not None:
+            labels.append(f'le="{format_sample_value(float(le))}"')
+        if labels:
+            return f"{self.name}{suffix}{{{','.join(labels)}}} {format_sample_value(value)}\n".encode('utf-8')
+        return f"{self.name}{suffix} {format_sample_value(value)}\n".encode('utf-8')
+
+
+# Default buckets for the exporter's own timings, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    """Cumulative histogram of observations, safe to update from any thread"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        # Bucket i counts values <= buckets[i]; larger values only reach +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self._counts):
+                self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+    
+    def snapshot(self) -> Tuple[List[Tuple[float, int]], float, int]:
+        """Return ([(upper bound, cumulative count)] ending with +Inf, sum, count)"""
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        cumulative.append((math.inf, count))
+        return cumulative, total, count
+    
+    def dump(self) -> Dict:
+        """The histogram's state as JSON-serializable data, for load()"""
+        with self._lock:
+            return {'buckets': list(self.buckets), 'counts': list(self._counts), 'sum': self._sum, 'count': self._count}
+    
+    def load(self, data: Dict) -> bool:
+        """Restore a dump() taken with the same buckets; returns whether it was"""
+        if tuple(data.get('buckets', ())) != self.buckets or len(data.get('counts', ())) != len(self.buckets):
+            return False
+        with self._lock:
+            self._counts = [int(count) for count in data['counts']]
+            self._sum = float(data['sum'])
+            self._count = int(data['count'])
+        return True
+
+
+class ExpositionWriter:
+    """Writes metric families incrementally in the Prometheus text format
+    
+    `write` can be a socket/file write method or BytesIO.write for a buffer
+    that is reused per snapshot. A family's header is written before its first
+    sample, and a family can't be reopened once another one has started, so
+    the output never carries duplicate HELP/TYPE lines or split families.
+    """
+    
+    def __init__(self, write: Callable[[bytes], object]):
+        self._write = write
+        self._current: Optional[MetricFamily] = None
+        self._written = set()
+    
+    def _open(self, family: MetricFamily):
+        if family is not self._current:
+            if family.name in self._written:
+                raise ValueError(f"Metric family {family.name} was already written")
+            self._written.add(family.name)
+            self._current = family
+            self._write(family.header)
+    
+    def sample(self, family: MetricFamily, value, *labelvalues):
+        """Write one sample, opening its family first if needed"""
+        self._open(family)
+        self._write(family.encode_sample(value, labelvalues))
+    
+    def histogram(self, family: MetricFamily, histogram: Histogram, *labelvalues):
+        """Write the _bucket, _sum and _count series of one histogram"""
+        self._open(family)
+        buckets, total, count = histogram.snapshot()
+        for bound, cumulative in buckets:
+            self._write(family.encode_sample(cumulative, labelvalues, '_bucket', bound))
+        self._write(family.encode_sample(total, labelvalues, '_sum'))
+        self._write(family.encode_sample(count, labelvalues, '_count'))
+
+
+def encode_metrics(render: Callable[[ExpositionWriter], None]) -> bytes:
+    """Run a render function against a fresh buffer and return the bytes"""
+    buffer = io.BytesIO()
+    render(ExpositionWriter(buffer.write))
+    return buffer.getvalue()
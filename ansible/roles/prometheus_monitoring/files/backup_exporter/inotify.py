@@ -0,0 +1,129 @@
+"""
+Change notifications for the backup directory through Linux inotify
+"""
+
+import os
+import sys
+import ctypes
+import select
+import struct
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InotifyWatcher:
+    """Watches the backup directory with Linux inotify (through ctypes)
+    
+    The backup directory is watched for backup-* directories being created,
+    removed or renamed, and every backup-* directory for files being created,
+    removed, renamed or closed after writing. `on_change` is called with the
+    affected backup path, or None when the kernel queue overflowed and
+    everything has to be considered changed.
+    """
+    
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+    BACKUP_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct('iIII')
+    
+    def __init__(self, backup_dir: Path, on_change: Callable[[Optional[str]], None]):
+        self.backup_dir = backup_dir
+        self.on_change = on_change
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+        # Watch descriptor -> watched path
+        self._watches: Dict[int, str] = {}
+        self._root_wd = self._add_watch(str(backup_dir), self.ROOT_MASK)
+        for backup_path in backup_dir.glob("backup-*"):
+            if backup_path.is_dir():
+                self._add_watch(str(backup_path), self.BACKUP_MASK)
+        self._stop = threading.Event()
+    
+    @classmethod
+    def available(cls) -> bool:
+        """inotify needs Linux and a libc that exports it"""
+        try:
+            return sys.platform.startswith('linux') and hasattr(ctypes.CDLL(None), 'inotify_init1')
+        except OSError:
+            return False
+    
+    def _add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {path} failed: {os.strerror(errno)}")
+        self._watches[wd] = path
+        return wd
+    
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & self.IN_Q_OVERFLOW:
+            logger.warning("inotify queue overflowed, invalidating all backups")
+            self.on_change(None)
+            return
+        if mask & self.IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        
+        path = self._watches.get(wd)
+        if path is None:
+            return
+        if wd == self._root_wd:
+            if not name.startswith('backup-'):
+                return
+            backup_path = os.path.join(path, name)
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO) and mask & self.IN_ISDIR:
+                try:
+                    self._add_watch(backup_path, self.BACKUP_MASK)
+                except OSError as e:
+                    # Already gone again; the rescan will notice
+                    logger.debug(f"Could not watch {backup_path}: {e}")
+            self.on_change(backup_path)
+        else:
+            self.on_change(path)
+    
+    def run(self):
+        """Read and dispatch events until stopped"""
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            if not poller.poll(1000):
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+                offset += length
+                self._handle(wd, mask, name)
+    
+    def start(self) -> threading.Thread:
+        """Dispatch events on a daemon thread"""
+        thread = threading.Thread(target=self.run, name="inotify-watcher", daemon=True)
+        thread.start()
+        return thread
+    
+    def stop(self):
+        self._stop.set()
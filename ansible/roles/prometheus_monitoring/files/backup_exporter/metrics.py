@@ -0,0 +1,66 @@
+"""
+Metric families exposed by the backup exporter
+"""
+
+import time
+
+from .exposition import MetricFamily
+
+
+BACKUP_LOCAL_COUNT = MetricFamily('backup_local_count', 'Number of local backups')
+BACKUP_LOCAL_TOTAL_SIZE = MetricFamily('backup_local_total_size_bytes', 'Total size of all local backups in bytes')
+BACKUP_LOCAL_SIZE = MetricFamily('backup_local_size_bytes', 'Size of each local backup in bytes', labelnames=('name',))
+BACKUP_LOCAL_TOTAL_ALLOCATED = MetricFamily('backup_local_total_allocated_bytes', 'Disk space allocated to all local backups in bytes')
+BACKUP_LOCAL_ALLOCATED = MetricFamily('backup_local_allocated_bytes', 'Disk space allocated to each local backup in bytes (st_blocks; less than the size for sparse or compressed files)', labelnames=('name',))
+BACKUP_LOCAL_AGE = MetricFamily('backup_local_age_hours', 'Age of each local backup in hours', labelnames=('name',))
+BACKUP_LOCAL_TIMESTAMP = MetricFamily('backup_local_timestamp', 'Unix time each local backup was taken', labelnames=('name',))
+BACKUP_LOCAL_IS_RECENT = MetricFamily('backup_local_is_recent', '1 if the local backup is less than 25 hours old', labelnames=('name',))
+BACKUP_LOCAL_CHECKSUM_OK = MetricFamily('backup_local_checksum_ok', '1 if checksums.txt covers every artifact of the local backup unchanged since it was hashed', labelnames=('name',))
+BACKUP_LOCAL_TYPE_SIZE = MetricFamily('backup_local_type_size_bytes', 'Size of each local backup by file type in bytes', labelnames=('name', 'type'))
+BACKUP_UPLOAD_BYTES = MetricFamily('backup_upload_bytes', 'Bytes to upload for each stage (backup, chunks) of a local backup\'s upload', labelnames=('name', 'stage'))
+BACKUP_UPLOAD_REMAINING = MetricFamily('backup_upload_remaining_bytes', 'Bytes of each upload stage not yet uploaded as of its last progress report', labelnames=('name', 'stage'))
+BACKUP_UPLOAD_THROUGHPUT = MetricFamily('backup_upload_throughput_bytes_per_second', 'Average rate of the latest run of each upload stage', labelnames=('name', 'stage'))
+BACKUP_UPLOAD_RUNNING = MetricFamily('backup_upload_running', '1 while an upload stage is running (or was killed without finishing)', labelnames=('name', 'stage'))
+BACKUP_UPLOAD_UPDATED = MetricFamily('backup_upload_updated_timestamp', 'Unix time each upload stage last reported progress', labelnames=('name', 'stage'))
+BACKUP_CLOUD_COUNT = MetricFamily('backup_cloud_count', 'Number of cloud backups')
+BACKUP_CLOUD_TOTAL_SIZE = MetricFamily('backup_cloud_total_size_bytes', 'Total size of all cloud backups in bytes')
+BACKUP_CLOUD_SIZE = MetricFamily('backup_cloud_size_bytes', 'Size of each cloud backup in bytes', labelnames=('name',))
+BACKUP_CLOUD_AGE = MetricFamily('backup_cloud_age_hours', 'Age of each cloud backup in hours', labelnames=('name',))
+BACKUP_CLOUD_IS_RECENT = MetricFamily('backup_cloud_is_recent', '1 if the cloud backup is less than 25 hours old', labelnames=('name',))
+BACKUP_CLOUD_FILE_COUNT = MetricFamily('backup_cloud_file_count', 'Number of files in each cloud backup', labelnames=('name',))
+BACKUP_CLOUD_VERIFIED_TIMESTAMP = MetricFamily('backup_cloud_verified_timestamp', 'Unix time each cloud backup was last verified successfully', labelnames=('name',))
+BACKUP_CLOUD_VERIFY_COVERAGE = MetricFamily('backup_cloud_verify_coverage_ratio', 'Estimated share of each cloud backup checked by verifications within the coverage window', labelnames=('name',))
+BACKUP_CLOUD_UPLOAD_CHECK_OK = MetricFamily('backup_cloud_upload_check_ok', '1 if the last post-upload check found every local file intact on the remote', labelnames=('name',))
+BACKUP_CLOUD_UPLOAD_CHECK_SECONDS = MetricFamily('backup_cloud_upload_check_seconds', 'Duration of the last post-upload check of each cloud backup', labelnames=('name',))
+BACKUP_CLOUD_UPLOAD_CHECK_MISMATCHES = MetricFamily('backup_cloud_upload_check_mismatches', 'Files the last post-upload check found missing or different on the remote', labelnames=('name',))
+BACKUP_CLOUD_UPLOAD_CHECK_FILES = MetricFamily('backup_cloud_upload_check_files', 'Files compared by the last post-upload check, by method (hash, size_mtime or parts)', labelnames=('name', 'method'))
+BACKUP_CLOUD_TYPE_SIZE = MetricFamily('backup_cloud_type_size_bytes', 'Size of each cloud backup by file type in bytes', labelnames=('name', 'type'))
+BACKUP_RUN_STAGE_SECONDS = MetricFamily('backup_run_stage_duration_seconds', 'Duration of each successful stage of the backup runs (export, pg_dump, checksum, upload, verify), from the backup logs', 'histogram', ('stage',))
+BACKUP_RUN_LAST_SUCCESS = MetricFamily('backup_run_last_success', '1 if the last finished backup run completed with no failed stage')
+BACKUP_RUN_LAST_TIMESTAMP = MetricFamily('backup_run_last_timestamp', 'Unix time the last finished backup run ended')
+BACKUP_RUN_LAST_DURATION = MetricFamily('backup_run_last_duration_seconds', 'Duration of the last finished backup run')
+BACKUP_RUN_LAST_STAGE_SECONDS = MetricFamily('backup_run_last_stage_duration_seconds', 'Duration of each stage of the last finished backup run', labelnames=('stage',))
+BACKUP_RUN_LAST_STAGE_SUCCESS = MetricFamily('backup_run_last_stage_success', '1 if the stage succeeded in the last finished backup run', labelnames=('stage',))
+BACKUP_RUN_LAST_STAGE_THROUGHPUT = MetricFamily('backup_run_last_stage_throughput_bytes_per_second', 'Bytes per second each stage of the last finished backup run processed (stages whose tools log byte counts)', labelnames=('stage',))
+BACKUP_LATEST_LOCAL_AGE = MetricFamily('backup_latest_local_age_hours', 'Age of latest local backup in hours')
+BACKUP_LATEST_CLOUD_AGE = MetricFamily('backup_latest_cloud_age_hours', 'Age of latest cloud backup in hours')
+BACKUP_LOCAL_SUCCESS = MetricFamily('backup_local_success', '1 if recent local backup exists, 0 otherwise')
+BACKUP_CLOUD_SUCCESS = MetricFamily('backup_cloud_success', '1 if recent cloud backup exists, 0 otherwise')
+BACKUP_CLOUD_REFRESH_SUCCESS = MetricFamily('backup_cloud_refresh_success', '1 if the last cloud refresh succeeded, 0 if cloud data is stale or missing')
+EXPORTER_SIZE_CACHE_LOOKUPS = MetricFamily('backup_exporter_size_cache_lookups_total', 'Local backup size lookups by result (hit served from index, miss walked the directory)', 'counter', ('result',))
+EXPORTER_SNAPSHOT_AGE = MetricFamily('backup_exporter_snapshot_age_seconds', 'Seconds since the data for each family was collected', labelnames=('family',))
+EXPORTER_SNAPSHOT_RESTORED = MetricFamily('backup_exporter_snapshot_restored', '1 while the family is served from the snapshot saved before the last restart, until the first refresh replaces it', labelnames=('family',))
+EXPORTER_GENERATE_SECONDS = MetricFamily('backup_exporter_generate_seconds', 'Time spent producing a /metrics response', 'histogram')
+EXPORTER_PHASE_SECONDS = MetricFamily('backup_exporter_phase_seconds', 'Time spent in each collection phase (local_scan, cloud_fetch, run_logs, serialize)', 'histogram', ('phase',))
+EXPORTER_SCAN_FILES = MetricFamily('backup_exporter_scan_files_stat', 'Files and directories stat\'ed by the most recent local scan')
+EXPORTER_SCAN_FILES_TOTAL = MetricFamily('backup_exporter_scan_files_stat_total', 'Files and directories stat\'ed by all local scans', 'counter')
+EXPORTER_RCLONE_CALLS = MetricFamily('backup_exporter_rclone_calls_total', 'rclone subprocesses run, by command and result (ok, error, timeout, cancelled)', 'counter', ('command', 'result'))
+EXPORTER_RCLONE_SECONDS = MetricFamily('backup_exporter_rclone_duration_seconds', 'Wall time of rclone subprocesses by command', 'histogram', ('command',))
+EXPORTER_RUN_LOG_BYTES = MetricFamily('backup_exporter_run_log_bytes_read_total', 'Bytes of backup logs read (each byte once, across restarts with --state-dir)', 'counter')
+EXPORTER_CLOUD_CACHE_AGE = MetricFamily('backup_exporter_cloud_cache_age_seconds', 'Seconds since the cached cloud listing was fetched (-1 before the first fetch)')
+PROCESS_RESIDENT_MEMORY = MetricFamily('process_resident_memory_bytes', 'Resident memory size in bytes')
+PROCESS_OPEN_FDS = MetricFamily('process_open_fds', 'Number of open file descriptors')
+PROCESS_CPU_SECONDS = MetricFamily('process_cpu_seconds_total', 'Total user and system CPU time spent in seconds', 'counter')
+PROCESS_START_TIME = MetricFamily('process_start_time_seconds', 'Start time of the process since unix epoch in seconds')
+
+PROCESS_STARTED_AT = time.time()
@@ -0,0 +1,278 @@
+"""
+rclone access for the exporter: a bounded async runner, a streaming parser
+for `rclone lsjson -R` and a stale-while-revalidate cache for its results
+"""
+
+import os
+import re
+import json
+import time
+import signal
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from .collectors import FILE_TYPE_MAP
+from .exposition import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Parts of an artifact backup_upload.py uploaded in pieces: <file>.part00000, ...
+PART_PATTERN = re.compile(r'^(?P<file>.+)\.part(?P<number>\d{5})$')
+
+
+def parse_rclone_time(value: str) -> datetime:
+    """Parse an rclone ModTime (RFC 3339, possibly with nanoseconds)"""
+    value = value.replace('Z', '+00:00')
+    # Python < 3.11 only understands up to microseconds
+    if '.' in value:
+        head, rest = value.split('.', 1)
+        digits = len(rest) - len(rest.lstrip('0123456789'))
+        value = f"{head}.{rest[:digits][:6].ljust(6, '0')}{rest[digits:]}"
+    return datetime.fromisoformat(value)
+
+
+class CloudInventory:
+    """Aggregates a streamed `rclone lsjson -R` listing into per-backup totals
+    
+    rclone prints one JSON object per line, so each line is parsed and folded
+    into the running totals as it arrives; the full listing is never held in
+    memory. The parts of an artifact uploaded in pieces count as that one
+    file.
+    """
+    
+    def __init__(self):
+        self.backups: Dict[str, Dict] = {}
+    
+    def feed(self, line: bytes):
+        """Fold one line of lsjson output into the totals"""
+        line = line.strip().rstrip(b',')
+        if not line.startswith(b'{'):
+            # Opening/closing brackets of the JSON array
+            return
+        data = json.loads(line)
+        if data.get('IsDir', False):
+            return
+        
+        backup_name, _, file_path = data['Path'].partition('/')
+        if not file_path or not backup_name.startswith('backup-'):
+            return
+        
+        entry = self.backups.get(backup_name)
+        if entry is None:
+            entry = self.backups[backup_name] = {'size_bytes': 0, 'file_count': 0, 'newest_mtime': None, 'types': {}}
+        
+        size_bytes = max(data.get('Size', 0), 0)
+        entry['size_bytes'] += size_bytes
+        part = PART_PATTERN.match(file_path)
+        if part:
+            file_path = part.group('file')
+        if not part or int(part.group('number')) == 0:
+            entry['file_count'] += 1
+        backup_type = FILE_TYPE_MAP.get(file_path)
+        if backup_type:
+            entry['types'][backup_type] = entry['types'].get(backup_type, 0) + size_bytes
+        
+        mtime = parse_rclone_time(data['ModTime'])
+        if entry['newest_mtime'] is None or mtime > entry['newest_mtime']:
+            entry['newest_mtime'] = mtime
+
+
+class RcloneError(Exception):
+    """rclone exited with a non-zero status"""
+
+
+class RcloneTimeout(RcloneError):
+    """rclone did not finish within its deadline and was killed"""
+
+
+class AsyncRcloneRunner:
+    """Runs rclone commands on a private asyncio loop
+    
+    All calls share one event loop thread and one semaphore, which gives a
+    process-wide concurrency limit. Every call has its own deadline and every
+    submitted job has a total deadline; when either expires the whole rclone
+    process group is killed so no child is left behind holding a connection.
+    """
+    
+    def __init__(self, binary: str = "rclone", max_concurrency: int = 4,
+                 call_timeout: float = 30.0, total_timeout: float = 120.0):
+        self.binary = binary
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self.total_timeout = total_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop_lock = threading.Lock()
+        # Per-command call counts by result and durations, for self-instrumentation
+        self._calls: Counter = Counter()
+        self._durations: Dict[str, Histogram] = {}
+        self._stats_lock = threading.Lock()
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="rclone-loop", daemon=True)
+                thread.start()
+            return self._loop
+    
+    def _record(self, command: str, result: str, seconds: float):
+        with self._stats_lock:
+            self._calls[(command, result)] += 1
+            histogram = self._durations.get(command)
+            if histogram is None:
+                histogram = self._durations[command] = Histogram()
+        histogram.observe(seconds)
+    
+    def stats(self) -> Dict:
+        """Call counts by (command, result) and duration histograms by command, for rendering
+        
+        The dicts are copies taken under the lock; the histograms are shared
+        and safe to read while calls keep recording into them.
+        """
+        with self._stats_lock:
+            return {'calls': dict(self._calls), 'durations': dict(self._durations)}
+    
+    @staticmethod
+    def _kill(proc: asyncio.subprocess.Process):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    
+    async def run(self, *args: str, timeout: Optional[float] = None,
+                  on_line: Optional[Callable[[bytes], None]] = None) -> bytes:
+        """Run one rclone command and return its stdout
+        
+        With `on_line`, stdout is handed over line by line as it arrives
+        instead of being buffered, and an empty result is returned.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.call_timeout if timeout is None else timeout
+        
+        async with self._semaphore:
+            started = time.monotonic()
+            # New session so a timeout can take down rclone and anything it spawned
+            proc = await asyncio.create_subprocess_exec(
+                self.binary, *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True)
+            async def read_stdout() -> bytes:
+                if on_line is None:
+                    return await proc.stdout.read()
+                async for line in proc.stdout:
+                    on_line(line)
+                return b""
+            
+            try:
+                stdout, stderr, _ = await asyncio.wait_for(
+                    asyncio.gather(read_stdout(), proc.stderr.read(), proc.wait()), timeout)
+            except asyncio.TimeoutError:
+                self._kill(proc)
+                await proc.wait()
+                self._record(args[0], 'timeout', time.monotonic() - started)
+                raise RcloneTimeout(f"rclone {' '.join(args)} timed out after {timeout}s")
+            except asyncio.CancelledError:
+                # Total deadline hit; don't wait around for the reaper
+                self._kill(proc)
+                self._record(args[0], 'cancelled', time.monotonic() - started)
+                raise
+            except BaseException:
+                # on_line failed
+                self._kill(proc)
+                self._record(args[0], 'error', time.monotonic() - started)
+                raise
+            self._record(args[0], 'ok' if proc.returncode == 0 else 'error', time.monotonic() - started)
+        
+        if proc.returncode != 0:
+            raise RcloneError(f"rclone {' '.join(args)} exited with {proc.returncode}: {stderr.decode(errors='replace').strip()}")
+        return stdout
+    
+    def submit(self, job: Callable[[], Awaitable]) -> concurrent.futures.Future:
+        """Schedule a coroutine function on the rclone loop under the total deadline"""
+        loop = self._ensure_loop()
+        
+        async def bounded():
+            try:
+                return await asyncio.wait_for(job(), self.total_timeout)
+            except asyncio.TimeoutError:
+                raise RcloneTimeout(f"rclone job exceeded total deadline of {self.total_timeout}s")
+        
+        return asyncio.run_coroutine_threadsafe(bounded(), loop)
+
+
+class StaleWhileRevalidate:
+    """Serves the last good value while a refresh runs in the background
+    
+    A value older than `ttl` triggers one background reload; callers keep
+    getting the previous value until it lands. A failed reload keeps the old
+    value and records the error instead of replacing it with nothing, and the
+    next attempt waits `retry_after` seconds so a dead remote isn't hammered.
+    """
+    
+    def __init__(self, loader: Callable[[], concurrent.futures.Future], ttl: float,
+                 initial=None, retry_after: float = 60.0):
+        self.loader = loader
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.value = initial
+        self.fetched_at: Optional[float] = None
+        self.failed_at: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+        self._inflight: Optional[concurrent.futures.Future] = None
+        self._lock = threading.Lock()
+    
+    def _revalidate_if_stale(self) -> Optional[concurrent.futures.Future]:
+        with self._lock:
+            if self._inflight is not None and not self._inflight.done():
+                return self._inflight
+            now = time.time()
+            if self.fetched_at is not None and now - self.fetched_at < self.ttl:
+                return None
+            if self.failed_at is not None and now - self.failed_at < self.retry_after:
+                return None
+            # Freshness counts from when the reload started, not when it landed
+            started_at = time.time()
+            # Waiters on a future wake before its done-callbacks run, so they
+            # wait on this one instead, resolved once the value is stored
+            stored = concurrent.futures.Future()
+            
+            def on_done(future: concurrent.futures.Future):
+                try:
+                    self._store(future, started_at)
+                finally:
+                    stored.set_result(None)
+            
+            self.loader().add_done_callback(on_done)
+            self._inflight = stored
+            return stored
+    
+    def _store(self, future: concurrent.futures.Future, started_at: float):
+        try:
+            value = future.result()
+        except BaseException as e:
+            logger.error(f"Background revalidation failed, keeping previous value: {e}")
+            with self._lock:
+                self.last_error = e
+                self.failed_at = time.time()
+            return
+        with self._lock:
+            self.value = value
+            self.fetched_at = started_at
+            self.failed_at = None
+            self.last_error = None
+    
+    def get(self, wait: float = 0.0):
+        """Return the cached value, waiting up to `wait` seconds for a pending reload"""
+        future = self._revalidate_if_stale()
+        if future is not None and wait > 0:
+            concurrent.futures.wait([future], timeout=wait)
+        return self.value
@@ -0,0 +1,260 @@
+"""
+Backup run logs: stage durations and outcomes tailed from the backup
+script's logs/backup-*.log
+
+Every poll reads each log from where the previous one stopped. Offsets,
+runs still in progress and the accumulated histograms are saved to a state
+file, so a restart neither reads a log twice nor forgets what it counted.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from .exposition import Histogram
+from .textfile import write_textfile
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+STAGES = ('export', 'pg_dump', 'checksum', 'upload', 'verify')
+# Stages take seconds to hours
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+
+LINE_PATTERN = re.compile(r'^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (.*)$')
+RUN_END = 'Backup process completed successfully'
+# Messages of backup_paperless.sh that start a stage; a start of the
+# stage already running (chunks, then the backup upload) continues it
+STAGE_STARTS = {
+    'Exporting Docker volumes...': 'export',
+    'Chunking Docker volumes...': 'export',
+    'Backing up PostgreSQL database...': 'pg_dump',
+    'Creating backup metadata...': 'checksum',
+    'Uploading new chunks to cloud storage...': 'upload',
+    'Uploading backup to cloud storage...': 'upload',
+    'Verifying backup upload...': 'verify',
+}
+# ... and prefixes of the messages that end the running stage, with its outcome
+STAGE_ENDS = (
+    ('Database backup completed', 'ok'),
+    ('WARNING: Could not extract database credentials', 'skipped'),
+    ('WARNING: Database container not running', 'skipped'),
+    ('Backup uploaded successfully', 'ok'),
+    ('ERROR: Failed to upload backup to cloud storage', 'failed'),
+    ('Backup verification successful', 'ok'),
+    ('WARNING: Backup verification failed', 'failed'),
+    ('Writing cloud backup metadata...', 'ok'),
+    ('Cleaning up old local backups', 'ok'),
+)
+# Byte counts the backup tools log, per stage, for throughput
+STAGE_BYTES = {
+    'export': (re.compile(r'^Archived \S+: (\d+) -> \d+ bytes'),
+               re.compile(r'^Backed up \S+: .* of (\d+) bytes')),
+    'pg_dump': (re.compile(r'^Wrote database\.sql: (\d+) bytes'),),
+    'upload': (re.compile(r'^✓ Uploaded .*?(\d+) bytes sent'),),
+    'verify': (re.compile(r'^✓ backup-\S+: \d+ file\(s\) \((\d+) bytes\)'),),
+}
+
+
+class RunParser:
+    """Follows one backup run through the lines of its log
+    
+    `state` is plain data so it can be saved between polls. feed() returns
+    the run's summary once the run is over: at the completion message, or
+    at an ERROR the script exits on (error_exit).
+    """
+    
+    def __init__(self, state: Optional[Dict] = None):
+        self.state = state or {'started_at': None, 'last_at': None, 'stage': None, 'stage_started_at': None,
+                               'stage_bytes': 0, 'stages': {}, 'failed': False, 'ended': False}
+    
+    def feed(self, line: str) -> Optional[Dict]:
+        match = LINE_PATTERN.match(line)
+        state = self.state
+        if not match or state['ended']:
+            return None
+        at = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp()
+        message = match.group(2).strip()
+        if state['started_at'] is None:
+            state['started_at'] = at
+        state['last_at'] = at
+        
+        stage = state['stage']
+        if stage in STAGE_BYTES:
+            for pattern in STAGE_BYTES[stage]:
+                bytes_match = pattern.match(message)
+                if bytes_match:
+                    state['stage_bytes'] += int(bytes_match.group(1))
+        
+        if message in STAGE_STARTS:
+            if STAGE_STARTS[message] != stage:
+                self._end_stage(at, 'ok')
+                state.update(stage=STAGE_STARTS[message], stage_started_at=at, stage_bytes=0)
+            return None
+        for prefix, outcome in STAGE_ENDS:
+            if message.startswith(prefix):
+                self._end_stage(at, outcome)
+                return None
+        if message == RUN_END:
+            return self.finish(at)
+        if message.startswith('ERROR: '):
+            # Any other ERROR comes from error_exit, which ends the script
+            self._end_stage(at, 'failed')
+            state['failed'] = True
+            return self.finish(at)
+        return None
+    
+    def _end_stage(self, at: float, outcome: str):
+        state = self.state
+        if state['stage'] is not None:
+            if outcome != 'skipped':
+                state['stages'][state['stage']] = {'seconds': at - state['stage_started_at'],
+                                                   'bytes': state['stage_bytes'], 'ok': outcome == 'ok'}
+            if outcome == 'failed':
+                state['failed'] = True
+        state.update(stage=None, stage_started_at=None, stage_bytes=0)
+    
+    def finish(self, at: Optional[float] = None) -> Optional[Dict]:
+        """End the run (a superseded log ends where it stops) and return its summary"""
+        state = self.state
+        if state['ended']:
+            return None
+        state['ended'] = True
+        if state['started_at'] is None:
+            return None
+        at = at if at is not None else state['last_at']
+        if state['stage'] is not None:
+            # Cut off mid-stage: the script died
+            self._end_stage(at, 'failed')
+            state['failed'] = True
+        return {'started_at': state['started_at'], 'finished_at': at, 'success': not state['failed'],
+                'stages': state['stages']}
+
+
+class RunLogTailer:
+    """Incrementally reads the backup logs into per-stage histograms
+    
+    Logs are matched by name (backup-*.log, one per run) and followed by
+    inode and offset; a log that was replaced or truncated is read again
+    from the start. Runs are counted once, when they end. A run that never
+    ended in a log that is no longer the newest is counted as failed.
+    """
+    
+    def __init__(self, logs_dir: Path, state_path: Optional[Path] = None):
+        self.logs_dir = logs_dir
+        self.state_path = state_path
+        self.histograms = {stage: Histogram(STAGE_BUCKETS) for stage in STAGES}
+        self.last_run: Optional[Dict] = None
+        self.bytes_read = 0
+        # name -> {'inode', 'offset', 'run'}
+        self._files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if state_path:
+            self._load()
+    
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {self.state_path}, reading the backup logs from the start: {e}")
+            return
+        if state.get('version') != STATE_VERSION:
+            return
+        self._files = state.get('files', {})
+        self.last_run = state.get('last_run')
+        self.bytes_read = state.get('bytes_read', 0)
+        for stage, data in state.get('histograms', {}).items():
+            if stage in self.histograms and not self.histograms[stage].load(data):
+                logger.warning(f"Stage buckets changed, {stage} histogram restarts from zero")
+    
+    def _save(self):
+        state = {
+            'version': STATE_VERSION, 'files': self._files, 'last_run': self.last_run,
+            'bytes_read': self.bytes_read,
+            'histograms': {stage: histogram.dump() for stage, histogram in self.histograms.items()},
+        }
+        try:
+            write_textfile(str(self.state_path), json.dumps(state).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Could not save {self.state_path}: {e}")
+    
+    def _record(self, run: Dict):
+        for stage, result in run['stages'].items():
+            if result['ok'] and stage in self.histograms:
+                self.histograms[stage].observe(result['seconds'])
+        if self.last_run is None or run['finished_at'] >= self.last_run['finished_at']:
+            self.last_run = run
+    
+    def poll(self) -> bool:
+        """Read whatever was appended to the logs since the last poll; returns whether anything was"""
+        try:
+            entries = sorted((entry for entry in os.scandir(self.logs_dir)
+                              if entry.name.startswith('backup-') and entry.name.endswith('.log')),
+                             key=lambda entry: entry.name)
+        except FileNotFoundError:
+            entries = []
+        
+        changed = False
+        with self._lock:
+            seen = set()
+            for entry in entries:
+                try:
+                    changed |= self._read(entry)
+                except OSError as e:
+                    logger.warning(f"Could not read {entry.path}: {e}")
+                seen.add(entry.name)
+            # Rotated or deleted logs
+            for name in set(self._files) - seen:
+                del self._files[name]
+                changed = True
+            # Runs whose log stopped before the end while a newer run started
+            for entry in entries[:-1]:
+                tracked = self._files.get(entry.name)
+                if tracked and tracked['run'] and not tracked['run']['ended']:
+                    run = RunParser(tracked['run']).finish()
+                    if run:
+                        run['success'] = False
+                        self._record(run)
+                    changed = True
+            if changed and self.state_path:
+                self._save()
+        return changed
+    
+    def _read(self, entry: os.DirEntry) -> bool:
+        entry_stat = entry.stat()
+        tracked = self._files.get(entry.name)
+        new = tracked is None or tracked['inode'] != entry_stat.st_ino or entry_stat.st_size < tracked['offset']
+        if new:
+            tracked = self._files[entry.name] = {'inode': entry_stat.st_ino, 'offset': 0, 'run': None}
+        if entry_stat.st_size == tracked['offset']:
+            return new
+        
+        with open(entry.path, 'rb') as f:
+            f.seek(tracked['offset'])
+            data = f.read(entry_stat.st_size - tracked['offset'])
+        # Only whole lines; a partly written one is read again next time
+        complete = data.rfind(b'\n') + 1
+        if complete == 0:
+            return new
+        parser = RunParser(tracked['run'])
+        for line in data[:complete].decode('utf-8', errors='replace').splitlines():
+            run = parser.feed(line)
+            if run:
+                self._record(run)
+        tracked['run'] = parser.state
+        tracked['offset'] += complete
+        self.bytes_read += complete
+        return True
+    
+    def snapshot(self) -> Dict:
+        """The histograms, last finished run and bytes read, for rendering"""
+        with self._lock:
+            return {'histograms': self.histograms, 'last_run': self.last_run, 'bytes_read': self.bytes_read}
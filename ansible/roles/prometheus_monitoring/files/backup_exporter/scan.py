@@ -0,0 +1,266 @@
+"""
+One shared pass over a backup directory, and an index that keeps what the
+collectors derived from it until the directory changes
+"""
+
+import os
+import stat
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# st_blocks is counted in 512-byte units whatever the filesystem block size
+STAT_BLOCK_SIZE = 512
+
+
+class BackupScan:
+    """A lazily walked backup directory shared by every collector
+    
+    Nothing is read until a collector asks for it. The top level is listed
+    once with os.scandir for `artifacts`; asking for `size_bytes` continues
+    into the subdirectories from there. Either way each file is stat'ed at
+    most once per scan, no matter how many collectors look at it: the walk
+    works from the DirEntry stat data and never builds a Path per file.
+    
+    The walk totals both the apparent size (st_size) and the allocated
+    blocks (st_blocks), so sparse and filesystem-compressed files show
+    their real footprint. Hard-linked files count once towards the latter.
+    """
+    
+    def __init__(self, path: str, dir_stat: os.stat_result):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.dir_stat = dir_stat
+        # Files stat'ed so far, for the scan cost metrics
+        self.stat_calls = 0
+        self._artifacts: Optional[Dict[str, os.stat_result]] = None
+        self._subdirs: List[str] = []
+        self._size_bytes: Optional[int] = None
+        self._allocated_bytes: Optional[int] = None
+        self._newest_mtime = dir_stat.st_mtime
+    
+    def _scan_top(self):
+        self._artifacts = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self._subdirs.append(entry.path)
+                    continue
+                file_stat = entry.stat(follow_symlinks=False)
+                self.stat_calls += 1
+                if stat.S_ISREG(file_stat.st_mode):
+                    self._artifacts[entry.name] = file_stat
+                    self._newest_mtime = max(self._newest_mtime, file_stat.st_mtime)
+    
+    def _walk(self):
+        if self._artifacts is None:
+            self._scan_top()
+        size_bytes = allocated_blocks = 0
+        linked: Set[Tuple[int, int]] = set()
+        
+        def add(file_stat: os.stat_result):
+            nonlocal size_bytes, allocated_blocks
+            size_bytes += file_stat.st_size
+            if file_stat.st_nlink > 1:
+                inode = (file_stat.st_dev, file_stat.st_ino)
+                if inode in linked:
+                    return
+                linked.add(inode)
+            allocated_blocks += file_stat.st_blocks
+        
+        for file_stat in self._artifacts.values():
+            add(file_stat)
+        pending = list(self._subdirs)
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except OSError:
+                # Removed while walking; the next scan will see the new state
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    file_stat = entry.stat(follow_symlinks=False)
+                    self.stat_calls += 1
+                    if stat.S_ISREG(file_stat.st_mode):
+                        add(file_stat)
+                        self._newest_mtime = max(self._newest_mtime, file_stat.st_mtime)
+        self._size_bytes = size_bytes
+        self._allocated_bytes = allocated_blocks * STAT_BLOCK_SIZE
+    
+    @property
+    def artifacts(self) -> Dict[str, os.stat_result]:
+        """Regular files directly inside the backup directory by name"""
+        if self._artifacts is None:
+            self._scan_top()
+        return self._artifacts
+    
+    @property
+    def size_bytes(self) -> int:
+        """Total size of every regular file in the backup"""
+        if self._size_bytes is None:
+            self._walk()
+        return self._size_bytes
+    
+    @property
+    def allocated_bytes(self) -> int:
+        """Disk space allocated to the backup's regular files"""
+        if self._allocated_bytes is None:
+            self._walk()
+        return self._allocated_bytes
+    
+    @property
+    def scanned(self) -> bool:
+        """Whether any file was looked at (and results may depend on file state)"""
+        return self._artifacts is not None
+    
+    @property
+    def newest_mtime(self) -> float:
+        """Newest mtime seen so far, starting from the directory's own"""
+        return self._newest_mtime
+
+
+class BackupScanIndex:
+    """Collector results per backup, keyed by directory path plus mtime/inode
+    
+    A backup is scanned again only when its own mtime or inode changes (a file
+    was created, removed or renamed inside it), when a file was still being
+    written during the last scan, or when a collector whose fields are not in
+    the index yet is asked for. Everything else is served straight from the
+    index.
+    
+    Backups that do need a scan are walked in parallel on a bounded pool of
+    `workers` threads. On a warm page cache the walk is bound by the Python
+    work per DirEntry and the pool gains little; on a cold or slow backup
+    disk each walk mostly waits in scandir and stat, which release the GIL,
+    so the waits overlap.
+    """
+    
+    def __init__(self, settle_seconds: int = 300, workers: int = 4):
+        # Files modified within this window are treated as still being written
+        self.settle_seconds = settle_seconds
+        self.workers = workers
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        # Files stat'ed by scans, for the scan cost metrics
+        self.files_stat = 0
+        # Guards `entries`: the inotify thread invalidates while the collector
+        # thread looks up and dumps, and inline scrapes look up concurrently.
+        # Scans run outside it and merge their fields back afterwards.
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def _entry(self, backup_path: str, dir_stat: os.stat_result) -> Dict:
+        """The current entry for a backup, reset if it went stale (call holding the lock)"""
+        entry = self.entries.get(backup_path)
+        if (entry is None or
+            entry['mtime_ns'] != dir_stat.st_mtime_ns or
+            entry['inode'] != dir_stat.st_ino or
+            (entry['newest_mtime'] is not None and time.time() - entry['newest_mtime'] < self.settle_seconds)):
+            entry = self.entries[backup_path] = {
+                'mtime_ns': dir_stat.st_mtime_ns,
+                'inode': dir_stat.st_ino,
+                'newest_mtime': None,
+                'fields': {},
+            }
+        return entry
+    
+    @staticmethod
+    def _scan(backup_path: str, dir_stat: os.stat_result, collectors: List) -> Tuple[Dict, Optional[float], int]:
+        """Run `collectors` over one scan: (fields, newest mtime if any file was read, files stat'ed)"""
+        scan = BackupScan(backup_path, dir_stat)
+        fields = {}
+        for collector in collectors:
+            fields.update(collector.collect(scan))
+        return fields, scan.newest_mtime if scan.scanned else None, scan.stat_calls
+    
+    def lookup(self, backup_path: str, dir_stat: os.stat_result, collectors: List) -> Optional[Dict]:
+        """Return the fields of `collectors` for a backup, scanning it only if needed"""
+        return self.lookup_many([(backup_path, dir_stat, collectors)])[0]
+    
+    def lookup_many(self, requests: List[Tuple[str, os.stat_result, List]]) -> List[Optional[Dict]]:
+        """Fields for several (backup path, dir stat, collectors) requests, in order
+        
+        Each result is a copy. Backups that fail to scan are logged, dropped
+        from the index and come back as None. A backup invalidated while it
+        was being scanned still gets this scan's fields, but they are not
+        kept: the next lookup scans it again.
+        """
+        results: List[Optional[Dict]] = []
+        scans = []
+        with self._lock:
+            for backup_path, dir_stat, collectors in requests:
+                entry = self._entry(backup_path, dir_stat)
+                missing = [collector for collector in collectors
+                           if any(field not in entry['fields'] for field in collector.fields)]
+                if missing:
+                    scans.append((len(results), backup_path, dir_stat, entry, missing))
+                results.append(dict(entry['fields']))
+            self.hits += len(requests) - len(scans)
+            self.misses += len(scans)
+        
+        if len(scans) > 1 and self.workers > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='backup-scan')
+            pending = [(scan, self._executor.submit(self._scan, scan[1], scan[2], scan[4])) for scan in scans]
+        else:
+            pending = [(scan, None) for scan in scans]
+        for (index, backup_path, dir_stat, entry, missing), future in pending:
+            try:
+                if future is not None:
+                    fields, newest_mtime, stat_calls = future.result()
+                else:
+                    fields, newest_mtime, stat_calls = self._scan(backup_path, dir_stat, missing)
+            except Exception as e:
+                logger.error(f"Error scanning backup {backup_path}: {e}")
+                with self._lock:
+                    if self.entries.get(backup_path) is entry:
+                        del self.entries[backup_path]
+                results[index] = None
+                continue
+            with self._lock:
+                self.files_stat += stat_calls
+                # An entry dropped meanwhile is no longer in the index; updating it is harmless
+                entry['fields'].update(fields)
+                if newest_mtime is not None:
+                    entry['newest_mtime'] = max(entry['newest_mtime'] or 0, newest_mtime)
+                results[index] = dict(entry['fields'])
+        return results
+    
+    def dump(self) -> Dict[str, Dict]:
+        """A copy of the entries to save"""
+        with self._lock:
+            return {path: dict(entry, fields=dict(entry['fields'])) for path, entry in self.entries.items()}
+    
+    def load(self, entries: Dict[str, Dict], fields: Set[str]):
+        """Seed the index with saved entries, keeping only `fields`
+        
+        Entries are still checked against the directory's mtime and inode on
+        their first lookup, so a backup that changed while the exporter was
+        down is scanned again.
+        """
+        with self._lock:
+            for path, entry in entries.items():
+                self.entries[path] = dict(entry, fields={name: value for name, value in entry['fields'].items()
+                                                         if name in fields})
+    
+    def prune(self, live_paths: List[str]):
+        """Forget backups that no longer exist on disk"""
+        with self._lock:
+            for key in set(self.entries) - set(live_paths):
+                del self.entries[key]
+    
+    def invalidate(self, backup_path: Optional[str] = None):
+        """Force a rescan of one backup, or of every backup when no path is given"""
+        with self._lock:
+            if backup_path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(backup_path, None)
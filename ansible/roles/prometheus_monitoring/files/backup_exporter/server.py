@@ -0,0 +1,183 @@
+"""
+HTTP front end: /metrics with keep-alive and gzip, health endpoints
+and the opt-in /debug/profile endpoint
+"""
+
+import os
+import sys
+import gzip
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+# Only one profile at a time; sampling is process-wide
+_profile_lock = threading.Lock()
+
+
+def profile_cpu(seconds: float, interval: float = 0.005, limit: int = 25) -> str:
+    """Sample the stacks of every other thread for `seconds`
+
+    cProfile only sees the thread that enables it, while the exporter's work
+    happens on collector, rclone and handler threads, so this samples
+    sys._current_frames() instead. Reports the hottest frames by self and
+    cumulative samples, then every stack in collapsed (flamegraph) format.
+    """
+    me = threading.get_ident()
+    own: Counter = Counter()
+    cumulative: Counter = Counter()
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.reverse()
+            own[stack[-1]] += 1
+            for location in set(stack):
+                cumulative[location] += 1
+            stacks[';'.join(stack)] += 1
+        samples += 1
+        time.sleep(interval)
+    
+    lines = [f"# cpu profile: {samples} samples over {seconds}s, every {interval * 1000:.0f}ms", '',
+             f"{'self':>8} {'total':>8}  frame"]
+    for location, count in own.most_common(limit):
+        lines.append(f"{count:>8} {cumulative[location]:>8}  {location}")
+    lines += ['', f"{'total':>8}  frame"]
+    for location, count in cumulative.most_common(limit):
+        lines.append(f"{count:>8}  {location}")
+    lines += ['', '# collapsed stacks']
+    lines += [f"{stack} {count}" for stack, count in stacks.most_common()]
+    return '\n'.join(lines) + '\n'
+
+
+def profile_memory(seconds: float, limit: int = 25) -> str:
+    """Trace allocations for `seconds` and report growth and the largest live blocks
+
+    Allocations made before tracing started are invisible, so the live list
+    only covers what is held from objects created during the window.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(10)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    own_frames = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    before, after = before.filter_traces(own_frames), after.filter_traces(own_frames)
+    
+    lines = [f"# memory profile over {seconds}s", '', '# growth by line']
+    lines += [str(diff) for diff in after.compare_to(before, 'lineno')[:limit]]
+    lines += ['', '# largest live allocations by line']
+    lines += [str(statistic) for statistic in after.statistics('lineno')[:limit]]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics plus health endpoints that never touch the disk
+    
+    Speaks HTTP/1.1 with keep-alive and gzips /metrics for clients that
+    accept it. /metrics carries no validator: freshness ages and the
+    exporter's own metrics change on every request, so no earlier response
+    can stand in for a new one.
+    """
+    
+    protocol_version = 'HTTP/1.1'
+    # Drop idle keep-alive connections instead of holding a thread forever
+    timeout = 30
+    # Headers and body go out as separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK (~40ms per keep-alive request)
+    disable_nagle_algorithm = True
+    
+    def _send(self, status: int, body: bytes, content_type: str = 'text/plain; charset=utf-8', headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def _accepts_gzip(self) -> bool:
+        for coding in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = coding.strip().partition(';')
+            if name.strip().lower() in ('gzip', '*') and params.replace(' ', '') != 'q=0':
+                return True
+        return False
+    
+    def _profile(self, query: str):
+        params = parse_qs(query)
+        try:
+            seconds = min(max(float(params.get('seconds', ['10'])[0]), 1), 60)
+        except ValueError:
+            self._send(400, b'seconds must be a number\n')
+            return
+        mode = params.get('mode', ['cpu'])[0]
+        if mode not in ('cpu', 'memory'):
+            self._send(400, b'mode must be cpu or memory\n')
+            return
+        if not _profile_lock.acquire(blocking=False):
+            self._send(409, b'a profile is already running\n')
+            return
+        try:
+            logger.info(f"Profiling {mode} for {seconds}s")
+            report = profile_cpu(seconds) if mode == 'cpu' else profile_memory(seconds)
+        finally:
+            _profile_lock.release()
+        self._send(200, report.encode('utf-8'))
+    
+    def do_GET(self):
+        source = self.server.source
+        path, _, query = self.path.partition('?')
+        
+        if path == '/metrics':
+            body = source.render()
+            headers = {'Vary': 'Accept-Encoding'}
+            if self._accepts_gzip():
+                body = gzip.compress(body, compresslevel=6)
+                headers['Content-Encoding'] = 'gzip'
+            self._send(200, body, 'text/plain; version=0.0.4; charset=utf-8', headers)
+        elif path == '/healthz':
+            self._send(200, b'ok\n')
+        elif path == '/-/ready':
+            if source.is_ready():
+                self._send(200, b'ready\n')
+            else:
+                self._send(503, b'waiting for first collection\n')
+        elif path == '/debug/profile' and self.server.profiling:
+            self._profile(query)
+        else:
+            self._send(404, b'not found\n')
+    
+    do_HEAD = do_GET
+
+
+def serve(source, port: int, profiling: bool = False):
+    """Serve metrics from `source` on a thread-per-connection HTTP server"""
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    server.source = source
+    server.profiling = profiling
+    if profiling:
+        logger.warning("Profiling endpoint enabled at /debug/profile")
+    logger.info(f"Starting backup exporter on port {port}")
+    server.serve_forever()
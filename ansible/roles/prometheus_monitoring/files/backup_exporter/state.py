@@ -0,0 +1,106 @@
+"""
+Warm start: the last published snapshot, the scan index and the cloud
+listing, saved across restarts
+
+On startup the saved snapshot is served at once, marked as restored, while
+the first refresh revalidates it in the background. The restored scan index
+makes that refresh a stat of each backup directory rather than a walk, and
+the restored cloud listing keeps its age, so rclone is only asked again once
+its TTL has run out.
+"""
+
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from .textfile import write_textfile
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+# An unchanged state is still rewritten this often, so the saved collection
+# times don't fall far behind
+REWRITE_INTERVAL = 900
+# Derived from the clock at collection time; they don't make a state changed
+VOLATILE_FIELDS = ('age_hours', 'is_recent')
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: Dict):
+    if len(obj) == 1 and '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
+
+
+class ExporterState:
+    """Saves and restores the exporter's collected state in one gzipped JSON file
+    
+    `config` identifies what the state was collected for (backup directory,
+    remote, collector fields); a state saved under a different configuration
+    is ignored rather than served. Writes replace the file atomically and are
+    skipped while nothing but the collection times changed.
+    """
+    
+    def __init__(self, path: Path, config: Dict):
+        self.path = path
+        self.config = config
+        self._digest: Optional[str] = None
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+    
+    def load(self) -> Optional[Dict]:
+        """Return the saved {'snapshot', 'scan_index', 'cloud'}, or None"""
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.loads(gzip.decompress(f.read()), object_hook=_decode)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f"Could not read {self.path}, starting cold: {e}")
+            return None
+        if state.get('version') != STATE_VERSION or state.get('config') != self.config:
+            logger.info(f"{self.path} was saved by another version or configuration, starting cold")
+            return None
+        return state
+    
+    def save(self, snapshot: Dict, scan_index: Dict, cloud: Dict):
+        """Write the state if it changed (or was last written REWRITE_INTERVAL ago)"""
+        def stable(backups):
+            return [{key: value for key, value in backup.items() if key not in VOLATILE_FIELDS}
+                    for backup in backups]
+        content = json.dumps({
+            'local': stable(snapshot['local']['backups']), 'cloud': stable(snapshot['cloud']['backups']),
+            'scan_index': scan_index, 'cloud_listing': stable(cloud['backups']),
+        }, default=_encode, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        with self._lock:
+            now = time.time()
+            if digest == self._digest and now - self._saved_at < REWRITE_INTERVAL:
+                return
+            state = {
+                'version': STATE_VERSION, 'config': self.config, 'saved_at': now,
+                'snapshot': {family: {'backups': snapshot[family]['backups'],
+                                      'collected_at': snapshot[family]['collected_at']}
+                             for family in ('local', 'cloud')},
+                'scan_index': scan_index, 'cloud': cloud,
+            }
+            body = gzip.compress(json.dumps(state, default=_encode, separators=(',', ':')).encode('utf-8'),
+                                 mtime=0)
+            try:
+                write_textfile(str(self.path), body)
+            except OSError as e:
+                logger.error(f"Could not save {self.path}: {e}")
+                return
+            self._digest = digest
+            self._saved_at = now
@@ -0,0 +1,68 @@
+"""
+Push mode: backup metrics for node_exporter's textfile collector
+
+The file is written next to its destination under a dot-prefixed name that
+does not end in .prom, then renamed over it, so the collector only ever
+reads a complete file.
+"""
+
+import os
+import logging
+from typing import Dict
+
+from .exposition import encode_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def render_textfile(exporter, snapshot: Dict) -> bytes:
+    """Backup and freshness metrics of a snapshot
+    
+    The exporter's own and process_* metrics are left out: node_exporter
+    exports its own process metrics, and duplicate series fail its scrape.
+    """
+    def render(writer):
+        exporter.write_backup_metrics(snapshot, writer)
+        exporter.write_freshness_metrics(snapshot, writer)
+    return encode_metrics(render)
+
+
+def write_textfile(path: str, body: bytes):
+    """Atomically replace `path` with `body`"""
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        # node_exporter usually runs as another user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class TextfileWriter:
+    """Rewrites the textfile whenever a BackupCollector publishes a snapshot
+    
+    Each write reuses the collector's snapshot, so the file costs no scan of
+    its own; the daemon refresh interval is the write interval.
+    """
+    
+    def __init__(self, exporter, path: str):
+        self.exporter = exporter
+        self.path = path
+    
+    def __call__(self, snapshot: Dict):
+        if snapshot['local']['collected_at'] is None:
+            # Nothing scanned yet; keep the previous file rather than an empty one
+            return
+        try:
+            write_textfile(self.path, render_textfile(self.exporter, snapshot))
+        except OSError as e:
+            logger.error(f"Could not write {self.path}: {e}")
@@ -0,0 +1,74 @@
+"""
+Shared fixtures for the exporter and backup script benchmarks
+
+The synthetic backup tree is expensive to build (a million files at the
+default size), so it is built once per session, or reused from
+BENCH_TREE_DIR when that points at a tree built with the same shape.
+"""
+
+import os
+import sys
+import pytest
+from pathlib import Path
+from typing import Callable, List
+
+from synthetic_tree import ensure_tree
+
+BENCH_DIR = Path(__file__).resolve().parent
+# The exporter package ships as role files rather than an installed package
+EXPORTER_DIR = BENCH_DIR.parent / 'ansible' / 'roles' / 'prometheus_monitoring' / 'files'
+sys.path.insert(0, str(EXPORTER_DIR))
+# So do the backup scripts
+SCRIPTS_DIR = BENCH_DIR.parent / 'ansible' / 'roles' / 'paperless_backup' / 'files'
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+BENCH_BACKUPS = int(os.environ.get('BENCH_BACKUPS', 100))
+BENCH_FILES = int(os.environ.get('BENCH_FILES', 10000))
+
+
+@pytest.fixture(scope='session')
+def backup_tree(tmp_path_factory) -> Path:
+    cached = os.environ.get('BENCH_TREE_DIR')
+    root = Path(cached) if cached else tmp_path_factory.mktemp('backups')
+    try:
+        return ensure_tree(root, BENCH_BACKUPS, BENCH_FILES)
+    except ValueError as e:
+        pytest.fail(str(e))
+
+
+@pytest.fixture
+def fake_remote(tmp_path, monkeypatch) -> Path:
+    """An empty remote served by fake_rclone.py, installed as `rclone` on PATH"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'rclone').symlink_to(BENCH_DIR / 'fake_rclone.py')
+    remote_root = tmp_path / 'remote'
+    remote_root.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('FAKE_RCLONE_ROOT', str(remote_root))
+    return remote_root
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch) -> Path:
+    """A docker host served by fake_docker.py, installed as `docker` and `docker-compose` on PATH"""
+    bin_dir = tmp_path / 'docker-bin'
+    bin_dir.mkdir()
+    for name in ('docker', 'docker-compose'):
+        (bin_dir / name).symlink_to(BENCH_DIR / 'fake_docker.py')
+    docker_root = tmp_path / 'docker'
+    (docker_root / 'volumes').mkdir(parents=True)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('FAKE_DOCKER_ROOT', str(docker_root))
+    return docker_root
+
+
+@pytest.fixture
+def report(capsys) -> Callable[[str, List[str]], None]:
+    """Print a titled block of timings past pytest's output capture"""
+    def write(title: str, lines: List[str]):
+        with capsys.disabled():
+            print(f"\n{title}")
+            for line in lines:
+                print(f"  {line}")
+    return write
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Load harness for the backup exporter
+
+Starts the exporter against a synthetic backup tree (also served as the
+cloud remote by fake_rclone.py), waits for it to become ready, then drives
+/metrics with concurrent keep-alive scrapers and reports:
+
+- scrape latency (p50/p90/p99/max) and throughput
+- the exporter's CPU time, read/write syscalls and context switches during
+  the measured window (from /proc; every syscall with --strace)
+- resident and peak memory
+- the exporter's own counters: rclone calls by result, files stat'ed
+
+    python3 benchmarks/exporter_load.py --tree /tmp/bench-tree --backups 100 --files 10000 \\
+        --scrapers 8 --duration 30 --rclone-latency 0.5:2 --rclone-hang-rate 0.2
+
+Run it before and after a change with the same arguments; --json gives a
+machine-readable result to diff.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from synthetic_tree import ensure_tree
+
+BENCH_DIR = Path(__file__).resolve().parent
+EXPORTER_DIR = BENCH_DIR.parent / 'ansible' / 'roles' / 'prometheus_monitoring' / 'files'
+
+# Self-metrics read back from the exporter after the run
+SELF_METRICS = re.compile(r'^(backup_exporter_rclone_calls_total|backup_exporter_scan_files_stat_total|'
+                          r'backup_exporter_size_cache_lookups_total)(\{[^}]*\})? (\S+)$', re.M)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def proc_counters(pid: int) -> Dict[str, float]:
+    """CPU seconds, read/write syscalls, context switches and memory of a process"""
+    counters: Dict[str, float] = {}
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        counters['cpu_seconds'] = (int(fields[11]) + int(fields[12])) / ticks
+        with open(f'/proc/{pid}/io') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('syscr', 'syscw'):
+                    counters[name] = int(value)
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'VmHWM'):
+                    counters[name] = int(value.split()[0]) * 1024
+                elif name in ('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches'):
+                    counters[name] = int(value)
+    except (OSError, IndexError, ValueError):
+        pass
+    return counters
+
+
+def exporter_pid(proc: subprocess.Popen, traced: bool) -> int:
+    """The exporter's own pid (strace forks it as a child)"""
+    if not traced:
+        return proc.pid
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with open(f'/proc/{proc.pid}/task/{proc.pid}/children') as f:
+                children = f.read().split()
+            if children:
+                return int(children[0])
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return proc.pid
+
+
+def wait_ready(port: int, proc: subprocess.Popen, timeout: float) -> float:
+    """Poll /-/ready until it answers 200; returns the seconds it took"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"exporter exited with {proc.returncode} before becoming ready")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/-/ready')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return time.monotonic() - started
+            conn.close()
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"exporter not ready after {timeout}s")
+
+
+def scrape(port: int, until: float, use_gzip: bool, timeout: float, results: Dict):
+    """Scrape /metrics on one keep-alive connection until `until`"""
+    latencies, errors, response_bytes = [], 0, 0
+    headers = {'Accept-Encoding': 'gzip'} if use_gzip else {}
+    conn = None
+    while time.monotonic() < until:
+        if conn is None:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        started = time.perf_counter()
+        try:
+            conn.request('GET', '/metrics', headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            elapsed = time.perf_counter() - started
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = None
+            continue
+        if response.status != 200:
+            errors += 1
+            continue
+        latencies.append(elapsed)
+        response_bytes += len(body)
+    if conn is not None:
+        conn.close()
+    with results['lock']:
+        results['latencies'].extend(latencies)
+        results['errors'] += errors
+        results['bytes'] += response_bytes
+
+
+def read_self_metrics(port: int) -> Dict[str, float]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/metrics')
+    body = conn.getresponse().read().decode('utf-8')
+    conn.close()
+    return {name + labels: float(value) for name, labels, value in
+            ((m.group(1), m.group(2) or '', m.group(3)) for m in SELF_METRICS.finditer(body))}
+
+
+def parse_strace_summary(path: str) -> Dict[str, int]:
+    """Calls per syscall from an `strace -c` summary"""
+    calls = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                # % time, seconds, usecs/call, calls, [errors], syscall
+                if len(parts) >= 5 and parts[0].replace('.', '', 1).isdigit() and parts[-1] != 'total':
+                    calls[parts[-1]] = int(parts[3])
+    except OSError:
+        pass
+    return calls
+
+
+def new_results() -> Dict:
+    return {'lock': threading.Lock(), 'latencies': [], 'errors': 0, 'bytes': 0}
+
+
+def stop(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_load(tree: Path, scrapers: int = 4, duration: float = 10, warmup: float = 2, mode: str = 'background',
+             use_gzip: bool = False, rclone_latency: str = '0', rclone_line_delay: float = 0,
+             rclone_hang_rate: float = 0, rclone_fail_rate: float = 0, rclone_timeout: float = 30,
+             exporter_args: Optional[List[str]] = None, ready_timeout: float = 600,
+             scrape_timeout: float = 120, strace: bool = False) -> Dict:
+    """Run one load test against a fresh exporter process and return the measurements"""
+    workdir = Path(tempfile.mkdtemp(prefix='exporter-load-'))
+    try:
+        bin_dir = workdir / 'bin'
+        bin_dir.mkdir()
+        (bin_dir / 'rclone').symlink_to(BENCH_DIR / 'fake_rclone.py')
+        remote_root = workdir / 'remote'
+        remote_root.mkdir()
+        # The exporter lists <remote>:paperless-backup
+        (remote_root / 'paperless-backup').symlink_to(tree.resolve())
+        rclone_log = workdir / 'rclone.log'
+        strace_out = workdir / 'strace.txt'
+
+        port = free_port()
+        env = dict(os.environ,
+                   PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+                   PYTHONPATH=str(EXPORTER_DIR),
+                   FAKE_RCLONE_ROOT=str(remote_root),
+                   FAKE_RCLONE_LATENCY=rclone_latency,
+                   FAKE_RCLONE_LINE_DELAY=str(rclone_line_delay),
+                   FAKE_RCLONE_HANG_RATE=str(rclone_hang_rate),
+                   FAKE_RCLONE_FAIL_RATE=str(rclone_fail_rate),
+                   FAKE_RCLONE_LOG=str(rclone_log))
+        command = [sys.executable, '-m', 'backup_exporter', f'--backup-dir={tree}', f'--port={port}',
+                   f'--mode={mode}', '--rclone-remote=bench', f'--rclone-timeout={rclone_timeout}',
+                   *(exporter_args or [])]
+        if strace:
+            command = ['strace', '-f', '-c', '-o', str(strace_out)] + command
+
+        started = time.monotonic()
+        proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            pid = exporter_pid(proc, strace)
+            ready_seconds = wait_ready(port, proc, ready_timeout)
+            startup = proc_counters(pid)
+            if warmup > 0:
+                scrape(port, time.monotonic() + warmup, use_gzip, scrape_timeout, new_results())
+
+            results = new_results()
+            before = proc_counters(pid)
+            until = time.monotonic() + duration
+            threads = [threading.Thread(target=scrape, args=(port, until, use_gzip, scrape_timeout, results))
+                       for _ in range(scrapers)]
+            window_started = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            window = time.monotonic() - window_started
+            after = proc_counters(pid)
+            self_metrics = read_self_metrics(port)
+        finally:
+            stop(proc)
+
+        rclone_calls: Dict[str, int] = {}
+        if rclone_log.exists():
+            for line in rclone_log.read_text().splitlines():
+                outcome = line.split()[-1]
+                rclone_calls[outcome] = rclone_calls.get(outcome, 0) + 1
+        syscalls = parse_strace_summary(str(strace_out)) if strace else None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def delta(name: str) -> Optional[float]:
+        if name in before and name in after:
+            return after[name] - before[name]
+        return None
+
+    latencies = sorted(results['latencies'])
+    scrapes = len(latencies)
+    cpu_seconds = delta('cpu_seconds')
+    return {
+        'config': {'tree': str(tree), 'scrapers': scrapers, 'duration': duration, 'mode': mode,
+                   'gzip': use_gzip, 'rclone_latency': rclone_latency, 'rclone_line_delay': rclone_line_delay,
+                   'rclone_hang_rate': rclone_hang_rate, 'rclone_fail_rate': rclone_fail_rate, 'exporter_args': exporter_args or []},
+        'ready_seconds': ready_seconds,
+        'startup_cpu_seconds': startup.get('cpu_seconds'),
+        'scrapes': scrapes,
+        'errors': results['errors'],
+        'throughput': scrapes / window if window else 0.0,
+        'latency_ms': {name: percentile(latencies, fraction) * 1000
+                       for name, fraction in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('max', 1.0))},
+        'bytes_per_scrape': results['bytes'] / scrapes if scrapes else 0,
+        'cpu_seconds': cpu_seconds,
+        'cpu_ms_per_scrape': cpu_seconds * 1000 / scrapes if scrapes and cpu_seconds is not None else None,
+        'read_syscalls': delta('syscr'),
+        'write_syscalls': delta('syscw'),
+        'context_switches': (delta('voluntary_ctxt_switches') or 0) + (delta('nonvoluntary_ctxt_switches') or 0),
+        'rss_bytes': after.get('VmRSS'),
+        'peak_rss_bytes': after.get('VmHWM'),
+        'rclone_calls': rclone_calls,
+        'exporter_metrics': self_metrics,
+        'syscalls': syscalls,
+        'elapsed_seconds': time.monotonic() - started,
+    }
+
+
+def format_report(result: Dict) -> List[str]:
+    latency = result['latency_ms']
+    mib = 1024 * 1024
+    lines = [
+        f"ready after {result['ready_seconds']:.2f}s ({result['startup_cpu_seconds'] or 0:.2f}s CPU)",
+        f"{result['scrapes']} scrapes, {result['errors']} errors, {result['throughput']:.1f}/s, "
+        f"{result['bytes_per_scrape'] / 1024:.1f} KiB each",
+        f"latency p50 {latency['p50']:.2f}ms  p90 {latency['p90']:.2f}ms  p99 {latency['p99']:.2f}ms  "
+        f"max {latency['max']:.2f}ms",
+    ]
+    if result['cpu_seconds'] is not None:
+        lines.append(f"exporter CPU {result['cpu_seconds']:.2f}s ({result['cpu_ms_per_scrape']:.2f}ms per scrape), "
+                     f"{result['read_syscalls']:.0f} read / {result['write_syscalls']:.0f} write syscalls, "
+                     f"{result['context_switches']:.0f} context switches")
+    if result['rss_bytes'] is not None:
+        lines.append(f"memory RSS {result['rss_bytes'] / mib:.1f} MiB, peak {result['peak_rss_bytes'] / mib:.1f} MiB")
+    if result['rclone_calls']:
+        lines.append("rclone " + ', '.join(f"{outcome} {count}" for outcome, count in sorted(result['rclone_calls'].items())))
+    for name, value in sorted(result['exporter_metrics'].items()):
+        lines.append(f"{name} {value:g}")
+    if result['syscalls']:
+        top = sorted(result['syscalls'].items(), key=lambda item: item[1], reverse=True)[:10]
+        lines.append(f"syscalls (whole run) {sum(result['syscalls'].values())}: "
+                     + ', '.join(f"{name} {count}" for name, count in top))
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Drive the backup exporter with concurrent scrapers')
+    parser.add_argument('--tree', required=True, help='Synthetic backup tree (built if empty)')
+    parser.add_argument('--backups', type=int, default=100, help='Backups in the tree')
+    parser.add_argument('--files', type=int, default=10000, help='Files per backup')
+    parser.add_argument('--artifact-scale', type=float, default=1.0, help='Multiplier for the sparse artifact sizes')
+    parser.add_argument('--scrapers', type=int, default=4, help='Concurrent scrapers')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to measure')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of single-scraper warmup before measuring')
+    parser.add_argument('--mode', choices=['background', 'inline'], default='background', help='Exporter collection mode')
+    parser.add_argument('--gzip', action='store_true', help='Ask for gzip-encoded responses')
+    parser.add_argument('--rclone-latency', default='0', help='Fake rclone latency in seconds, or MIN:MAX')
+    parser.add_argument('--rclone-line-delay', type=float, default=0, help='Seconds between streamed listing lines')
+    parser.add_argument('--rclone-hang-rate', type=float, default=0, help='Share of rclone calls that hang until killed')
+    parser.add_argument('--rclone-fail-rate', type=float, default=0, help='Share of rclone calls that fail')
+    parser.add_argument('--rclone-timeout', type=float, default=30, help='Exporter deadline for a single rclone call')
+    parser.add_argument('--exporter-arg', action='append', default=[], help='Extra exporter argument (repeatable)')
+    parser.add_argument('--strace', action='store_true', help='Count every syscall with strace -c (slows the exporter)')
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+    args = parser.parse_args(argv)
+
+    if args.strace and shutil.which('strace') is None:
+        parser.error("--strace needs strace on PATH")
+    try:
+        tree = ensure_tree(Path(args.tree), args.backups, args.files, args.artifact_scale)
+    except ValueError as e:
+        parser.error(str(e))
+
+    result = run_load(tree, args.scrapers, args.duration, args.warmup, args.mode, args.gzip,
+                      args.rclone_latency, args.rclone_line_delay, args.rclone_hang_rate, args.rclone_fail_rate,
+                      args.rclone_timeout, args.exporter_arg, strace=args.strace)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print('\n'.join(format_report(result)))
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Fake docker and docker-compose for running the rendered backup script
+
+Installed under both names on PATH. It covers the calls backup_paperless.sh
+makes:
+
+    docker run --rm -v SOURCE:TARGET[:ro] ... IMAGE COMMAND...
+        runs COMMAND on the host, with every TARGET path in its arguments
+        rewritten to SOURCE; a named volume is FAKE_DOCKER_ROOT/volumes/NAME
+    docker exec paperless-db pg_dump ...
+        writes a dump of FAKE_DOCKER_DUMP_ROWS rows (default 1000)
+    docker-compose ... ps | config | version
+        a running stack whose db service has credentials
+
+FAKE_DOCKER_LOG appends each call's arguments, one line per call.
+"""
+
+import os
+import sys
+import subprocess
+from typing import List
+
+ROOT = os.environ.get('FAKE_DOCKER_ROOT', '.')
+
+COMPOSE_PS = """NAME                 STATUS
+paperless-webserver  Up 3 days
+paperless-db         Up 3 days
+"""
+COMPOSE_CONFIG = """services:
+  db:
+    environment:
+      POSTGRES_DB: paperless
+      POSTGRES_USER: paperless
+      POSTGRES_PASSWORD: paperless
+"""
+
+
+def run(args: List[str]) -> int:
+    mounts = []
+    while args and args[0].startswith('-'):
+        flag = args.pop(0)
+        if flag == '-v':
+            source, target = args.pop(0).split(':')[:2]
+            if not source.startswith('/'):
+                source = os.path.join(ROOT, 'volumes', source)
+            mounts.append((target, source))
+    args.pop(0)  # image
+    # Longest target first, so /volumes/data is not rewritten as /volumes
+    mounts.sort(key=lambda mount: -len(mount[0]))
+
+    def host(arg: str) -> str:
+        for target, source in mounts:
+            if arg == target or arg.startswith(target + '/'):
+                return source + arg[len(target):]
+            if '=' + target in arg:
+                return arg.replace('=' + target, '=' + source, 1)
+        return arg
+
+    command = [host(arg) for arg in args]
+    if command[0] == 'python':
+        command[0] = sys.executable
+    return subprocess.run(command).returncode
+
+
+def exec_(args: List[str]) -> int:
+    if args[1:2] != ['pg_dump']:
+        print(f"fake docker: unsupported exec {args!r}", file=sys.stderr)
+        return 2
+    rows = int(os.environ.get('FAKE_DOCKER_DUMP_ROWS', 1000))
+    out = sys.stdout
+    out.write("CREATE TABLE documents_document (id integer, title text);\n")
+    out.write("COPY documents_document (id, title) FROM stdin;\n")
+    for row in range(rows):
+        out.write(f"{row}\tDocument {row}\n")
+    out.write("\\.\n")
+    return 0
+
+
+def compose(args: List[str]) -> int:
+    while args and args[0].startswith('-'):
+        args = args[2:] if args[0] == '-f' else args[1:]
+    command = args[0] if args else ''
+    if command == 'ps':
+        sys.stdout.write(COMPOSE_PS)
+    elif command == 'config':
+        sys.stdout.write(COMPOSE_CONFIG)
+    elif command == 'version':
+        print('2.20.0')
+    else:
+        print(f"fake docker-compose: unsupported command {command!r}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    path = os.environ.get('FAKE_DOCKER_LOG')
+    if path:
+        with open(path, 'a') as f:
+            f.write(' '.join([os.path.basename(sys.argv[0])] + argv) + '\n')
+    if os.path.basename(sys.argv[0]) == 'docker-compose':
+        return compose(argv)
+    if argv[:1] == ['run']:
+        return run(argv[1:])
+    if argv[:1] == ['exec']:
+        return exec_(argv[1:])
+    print(f"fake docker: unsupported command {argv[:1]!r}", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Fake rclone for the exporter benchmarks
+
+Serves `remote:path` from FAKE_RCLONE_ROOT/path for the commands the exporter
+and backup tools use (lsjson, lsf, size, cat, copy, rcat) and injects trouble:
+
+    FAKE_RCLONE_LATENCY     seconds before answering, or MIN:MAX for a uniform range
+    FAKE_RCLONE_LINE_DELAY  seconds between streamed output lines (slow listings)
+    FAKE_RCLONE_HANG_RATE   probability (0-1) of never answering until killed
+    FAKE_RCLONE_FAIL_RATE   probability (0-1) of exiting 1 after the latency
+    FAKE_RCLONE_LOG         append "<start> <command> <seconds> <outcome>" per call
+    FAKE_RCLONE_HASHES      0 to list no hashes, like a crypt remote (default 1)
+    FAKE_RCLONE_COPY_FAIL_AFTER  copy this many files, then exit 1 (an interrupted upload)
+    FAKE_RCLONE_RCAT_FAIL_PATH   rcat to a path containing this reads its input, then exits 1 storing nothing
+
+Install it as `rclone` on PATH (the load harness symlinks it).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+from datetime import datetime, timezone
+from typing import Iterator, List, Tuple
+
+ROOT = os.environ.get('FAKE_RCLONE_ROOT', '.')
+
+
+def local_path(remote_path: str) -> str:
+    return os.path.join(ROOT, remote_path.split(':', 1)[-1].strip('/'))
+
+
+def option(args: List[str], name: str, default=None):
+    return args[args.index(name) + 1] if name in args else default
+
+
+def walk(path: str, recursive: bool) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Yield (path relative to `path`, entry) for everything below `path`"""
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        with os.scandir(os.path.join(path, relative)) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                name = os.path.join(relative, entry.name)
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(name)
+                yield name, entry
+
+
+def rfc3339(timestamp: float) -> str:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond:06d}000Z"
+
+
+def emit(line: str, line_delay: float):
+    sys.stdout.write(line + '\n')
+    if line_delay:
+        sys.stdout.flush()
+        time.sleep(line_delay)
+
+
+def lsjson(args: List[str], line_delay: float):
+    files_only, dirs_only = '--files-only' in args, '--dirs-only' in args
+    emit('[', line_delay)
+    # rclone ends every record but the last with a comma
+    previous = None
+    for name, entry in walk(local_path(args[-1]), '-R' in args):
+        is_dir = entry.is_dir()
+        if (files_only and is_dir) or (dirs_only and not is_dir):
+            continue
+        entry_stat = entry.stat()
+        item = {'Path': name, 'Name': entry.name, 'Size': -1 if is_dir else entry_stat.st_size,
+                'ModTime': rfc3339(entry_stat.st_mtime), 'IsDir': is_dir}
+        if '--hash' in args and not is_dir and os.environ.get('FAKE_RCLONE_HASHES', '1') != '0':
+            # Like the local backend, which hashes on demand; cloud backends return stored hashes
+            with open(entry.path, 'rb') as f:
+                item['Hashes'] = {'sha256': hashlib.file_digest(f, 'sha256').hexdigest()}
+        if previous is not None:
+            emit(previous + ',', line_delay)
+        previous = json.dumps(item)
+    if previous is not None:
+        emit(previous, line_delay)
+    emit(']', line_delay)
+
+
+def lsf(args: List[str], line_delay: float):
+    for name, entry in walk(local_path(args[-1]), '-R' in args):
+        is_dir = entry.is_dir()
+        if ('--files-only' in args and is_dir) or ('--dirs-only' in args and not is_dir):
+            continue
+        name = name + '/' if is_dir else name
+        emit(f"{entry.stat().st_size};{name}" if option(args, '--format') == 'sp' else name, line_delay)
+
+
+def size(args: List[str], line_delay: float):
+    count = total = 0
+    for _, entry in walk(local_path(args[-1]), True):
+        if entry.is_file():
+            count += 1
+            total += entry.stat().st_size
+    emit(f"Total objects: {count}", line_delay)
+    emit(f"Total size: {total} B ({total} Bytes)", line_delay)
+
+
+def cat(args: List[str], line_delay: float):
+    offset, count = int(option(args, '--offset', 0)), int(option(args, '--count', -1))
+    with open(local_path(args[-1]), 'rb') as f:
+        f.seek(offset)
+        sys.stdout.buffer.write(f.read(count))
+
+
+def copy(args: List[str], line_delay: float):
+    """copy SOURCE DEST --files-from-raw LIST, skipping files with the same size and mtime"""
+    source, destination = args[0], local_path(args[1])
+    with open(option(args, '--files-from-raw', option(args, '--files-from'))) as f:
+        paths = [line.rstrip('\n') for line in f if line.strip()]
+    fail_after = int(os.environ.get('FAKE_RCLONE_COPY_FAIL_AFTER', -1))
+    sent = copied = 0
+    for path in paths:
+        if copied == fail_after:
+            raise RuntimeError(f"injected failure after {copied} file(s)")
+        source_path, target_path = os.path.join(source, path), os.path.join(destination, path)
+        source_stat = os.stat(source_path)
+        try:
+            target_stat = os.stat(target_path)
+            unchanged = (target_stat.st_size, target_stat.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns)
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            shutil.copy2(source_path, target_path)
+            sent += source_stat.st_size
+            copied += 1
+    # The final stats line rclone logs with --use-json-log
+    print(json.dumps({'level': 'notice', 'msg': 'Transferred', 'stats': {'bytes': sent, 'transfers': copied}}),
+          file=sys.stderr)
+
+
+def rcat(args: List[str], line_delay: float):
+    """rcat DEST: store standard input, all or nothing, like the cloud backends"""
+    destination = local_path(args[0])
+    data = sys.stdin.buffer.read()
+    fail_path = os.environ.get('FAKE_RCLONE_RCAT_FAIL_PATH')
+    if fail_path and fail_path in args[0]:
+        raise RuntimeError(f"injected failure after reading {len(data)} bytes for {args[0]}")
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with open(destination + '.partial', 'wb') as f:
+        f.write(data)
+    os.replace(destination + '.partial', destination)
+    print(json.dumps({'level': 'notice', 'msg': 'Transferred', 'stats': {'bytes': len(data), 'transfers': 1}}),
+          file=sys.stderr)
+
+
+COMMANDS = {'lsjson': lsjson, 'lsf': lsf, 'size': size, 'cat': cat, 'copy': copy, 'rcat': rcat}
+
+
+def main(argv: List[str]) -> int:
+    started = time.time()
+    command = argv[0] if argv else ''
+
+    def log(outcome: str):
+        path = os.environ.get('FAKE_RCLONE_LOG')
+        if path:
+            with open(path, 'a') as f:
+                f.write(f"{started:.6f} {command} {time.time() - started:.6f} {outcome}\n")
+
+    latency = os.environ.get('FAKE_RCLONE_LATENCY', '0')
+    low, _, high = latency.partition(':')
+    time.sleep(random.uniform(float(low), float(high or low)))
+
+    if random.random() < float(os.environ.get('FAKE_RCLONE_HANG_RATE', 0)):
+        log('hang')
+        while True:
+            time.sleep(3600)
+    if random.random() < float(os.environ.get('FAKE_RCLONE_FAIL_RATE', 0)):
+        log('fail')
+        print("Failed to list: injected failure", file=sys.stderr)
+        return 1
+    if command not in COMMANDS:
+        log('unsupported')
+        print(f"fake rclone: unsupported command {command!r}", file=sys.stderr)
+        return 2
+    try:
+        COMMANDS[command](argv[1:], float(os.environ.get('FAKE_RCLONE_LINE_DELAY', 0)))
+    except FileNotFoundError as e:
+        log('not-found')
+        print(f"directory not found: {e}", file=sys.stderr)
+        return 3
+    except RuntimeError as e:
+        log('fail')
+        print(json.dumps({'level': 'error', 'msg': str(e)}), file=sys.stderr)
+        return 1
+    log('ok')
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Synthetic /opt/backups/paperless trees for the exporter benchmarks
+
+Every backup gets the five artifacts, checksums.txt and backup-info.txt the
+backup script writes, plus a fan-out of small files (500 per directory) up
+to the requested file count. All files are sparse, so a tree of terabytes
+of apparent size costs only its inodes.
+"""
+
+import json
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Top-level artifacts of a backup and their sizes at artifact_scale 1
+ARTIFACTS = {
+    'database.sql': 64 << 20,
+    'data.tar.gz': 8 << 20,
+    'media.tar.gz': 2 << 30,
+    'export.tar.gz': 1 << 20,
+    'static.tar.gz': 16 << 20,
+}
+FILES_PER_DIR = 500
+SHAPE_FILE = '.bench-shape.json'
+
+
+def build_tree(root: Path, backups: int, files: int, artifact_scale: float = 1.0, max_file_size: int = 4096,
+               newest: datetime = datetime(2026, 1, 1, 2, 0, 0)):
+    """Write `backups` daily backup directories of `files` files each under `root`"""
+    for index in range(backups):
+        taken = newest - timedelta(days=index)
+        backup = root / f"backup-{taken:%Y%m%d_%H%M%S}"
+        backup.mkdir(parents=True)
+        for name, size in ARTIFACTS.items():
+            with open(backup / name, 'wb') as f:
+                f.truncate(int(size * artifact_scale))
+        (backup / 'checksums.txt').write_text(''.join(f"{'0' * 64}  {name}\n" for name in ARTIFACTS))
+        (backup / 'backup-info.txt').write_text(f"Backup Date: {taken:%a %b %d %H:%M:%S} UTC {taken:%Y}\n")
+        for number in range(files - len(ARTIFACTS) - 2):
+            directory = backup / 'objects' / f"{number // FILES_PER_DIR:03d}"
+            if number % FILES_PER_DIR == 0:
+                directory.mkdir(parents=True)
+            with open(directory / f"{number:06d}", 'wb') as f:
+                f.truncate(number % (max_file_size + 1))
+
+
+def ensure_tree(root: Path, backups: int, files: int, artifact_scale: float = 1.0, max_file_size: int = 4096) -> Path:
+    """Build the tree unless `root` already holds one of the same shape"""
+    shape = {'backups': backups, 'files': files, 'artifact_scale': artifact_scale, 'max_file_size': max_file_size}
+    root.mkdir(parents=True, exist_ok=True)
+    marker = root / SHAPE_FILE
+    if marker.exists() and json.loads(marker.read_text()) == shape:
+        return root
+    if any(root.iterdir()):
+        raise ValueError(f"{root} holds a different tree; remove it or choose another directory")
+    build_tree(root, backups, files, artifact_scale, max_file_size)
+    marker.write_text(json.dumps(shape))
+    return root
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Generate a synthetic backup tree for the exporter benchmarks')
+    parser.add_argument('root', help='Directory to create the backup-* directories in')
+    parser.add_argument('--backups', type=int, default=100, help='Number of daily backups')
+    parser.add_argument('--files', type=int, default=10000, help='Files per backup, artifacts included')
+    parser.add_argument('--artifact-scale', type=float, default=1.0,
+                        help='Multiplier for the sparse artifact sizes (1.0 = ~2.1 GiB per backup)')
+    parser.add_argument('--max-file-size', type=int, default=4096, help='Largest of the small sparse files')
+    args = parser.parse_args(argv)
+
+    try:
+        ensure_tree(Path(args.root), args.backups, args.files, args.artifact_scale, args.max_file_size)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{args.root}: {args.backups} backups of {args.files} files")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""
+Schema migrations and concurrent access in backup_catalog.py
+
+- a missing database, an empty one and one left at every earlier schema
+  version all migrate to the current one, keeping the rows already recorded
+- the catalog runs in WAL mode, so a read-only reader (the exporter) keeps
+  getting consistent answers while a backup script writes
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from backup_catalog import MIGRATIONS, BackupCatalog
+
+WRITES = 200
+
+
+def columns(conn: sqlite3.Connection, table: str):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def migrate_to(path: str, version: int):
+    """Leave a database at `version` the way an older catalog would have"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    for script in MIGRATIONS[:version]:
+        conn.executescript(script)
+    conn.execute(f"PRAGMA user_version={version}")
+    if version:
+        conn.execute("INSERT INTO backups (name, backup_timestamp, size_bytes, uploaded_at) "
+                     "VALUES ('backup-20260101_020000', 1767232800, 1024, 1767236400)")
+    conn.close()
+
+
+def check_current(catalog: BackupCatalog):
+    assert catalog.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert catalog.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert 'checksum_ok' in columns(catalog.conn, 'backups')
+    assert 'bytes_in_flight' in columns(catalog.conn, 'upload_progress')
+    assert 'mtime_ns' in columns(catalog.conn, 'upload_files')
+    # Every migrated table is usable
+    catalog.record_upload('backup-20260102_020000', 2048, checksum_ok=True)
+    catalog.begin_upload('backup-20260102_020000', 'backup', 'remote:backup-20260102_020000',
+                         [('database.sql', 10, 1)])
+
+
+def test_migrate_new_database(tmp_path):
+    catalog = BackupCatalog(str(tmp_path / 'catalog' / 'catalog.db'))
+    try:
+        check_current(catalog)
+    finally:
+        catalog.close()
+
+
+@pytest.mark.parametrize('version', range(len(MIGRATIONS)))
+def test_migrate_from_earlier_version(tmp_path, version):
+    path = str(tmp_path / 'catalog.db')
+    migrate_to(path, version)
+    catalog = BackupCatalog(path)
+    try:
+        check_current(catalog)
+        names = {backup['name'] for backup in catalog.live_cloud_backups()}
+        assert ('backup-20260101_020000' in names) == (version > 0)
+    finally:
+        catalog.close()
+    # Opening it again runs nothing twice
+    BackupCatalog(path).close()
+
+
+def test_reader_during_writes(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    BackupCatalog(path).close()
+    reader = BackupCatalog(path, readonly=True)
+    errors, counts = [], []
+
+    def write():
+        writer = BackupCatalog(path)
+        try:
+            for number in range(WRITES):
+                name = f"backup-2026{number // 28 % 12 + 1:02d}{number % 28 + 1:02d}_{number % 24:02d}0000"
+                writer.record_upload(name, number)
+                writer.record_deletions([(name, 'local')])
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        while thread.is_alive():
+            counts.append(len(reader.live_cloud_backups()))
+    except sqlite3.Error as e:
+        errors.append(e)
+    finally:
+        thread.join()
+    counts.append(len(reader.live_cloud_backups()))
+    reader.close()
+
+    assert not errors
+    assert counts == sorted(counts)
+    assert counts[-1] == WRITES
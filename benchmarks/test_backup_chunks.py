@@ -0,0 +1,193 @@
+"""
+Content-defined chunking in backup_chunks.py
+
+Chunks a stretch of incompressible data (like PDFs and images) and compares
+the throughput with the per-byte gear hash the chunker used before:
+
+- chunks join back to the input and stay within the size limits, averaging
+  about a megabyte
+- inserting bytes only changes the chunks around the insertion; every other
+  chunk keeps its hash, which is what lets an edited file reuse its chunks
+
+and runs the backup, restore, dedup and gc commands against a store:
+
+- a volume backed up and restored comes back identical, symlinks included
+- a second backup stores only the chunks of the edited region and none for
+  a copied or unchanged file, and only those are pending upload
+- gc drops the chunks of a deleted backup and keeps every chunk a remaining
+  manifest references
+"""
+
+import io
+import os
+import time
+import random
+import shutil
+import filecmp
+import hashlib
+from pathlib import Path
+
+import backup_chunks
+from backup_chunks import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, ChunkStore, iter_chunks, manifest_chunks, read_manifest
+from backup_verify import MANIFEST_FILE
+
+BENCH_CHUNK_MIB = int(os.environ.get('BENCH_CHUNK_MIB', 64))
+LEGACY_SAMPLE = 2 * 1024 * 1024
+
+
+def legacy_scan(data: bytes) -> int:
+    """The gear rolling hash the chunker ran byte by byte in Python"""
+    rng = random.Random(0x5EED)
+    gear = [rng.getrandbits(64) for _ in range(256)]
+    mask, cut_mask = (1 << 64) - 1, ((1 << 20) - 1) << 44
+    h = cuts = 0
+    for byte in data:
+        h = ((h << 1) + gear[byte]) & mask
+        if not h & cut_mask:
+            cuts += 1
+    return cuts
+
+
+def chunk_hashes(data: bytes):
+    return [hashlib.sha256(chunk).hexdigest() for chunk in iter_chunks(io.BytesIO(data))]
+
+
+def test_chunking_throughput(report):
+    data = os.urandom(BENCH_CHUNK_MIB * 1024 * 1024)
+    started = time.perf_counter()
+    chunks = list(iter_chunks(io.BytesIO(data)))
+    seconds = time.perf_counter() - started
+    rate = len(data) / seconds / 1e6
+
+    started = time.perf_counter()
+    legacy_scan(data[:LEGACY_SAMPLE])
+    legacy_rate = LEGACY_SAMPLE / (time.perf_counter() - started) / 1e6
+
+    sizes = [len(chunk) for chunk in chunks]
+    report(f"chunking {BENCH_CHUNK_MIB} MiB of random data", [
+        f"{len(chunks)} chunks averaging {sum(sizes) / len(sizes) / 1024 / 1024:.2f} MiB in {seconds:.2f}s "
+        f"({rate:.0f} MB/s)",
+        f"per-byte gear hash: {legacy_rate:.1f} MB/s ({rate / legacy_rate:.0f}x slower)",
+    ])
+    assert b''.join(chunks) == data
+    assert all(MIN_CHUNK_SIZE < size <= MAX_CHUNK_SIZE for size in sizes[:-1])
+    assert 512 * 1024 < len(data) / len(chunks) < 2 * 1024 * 1024
+    assert rate > 10 * legacy_rate
+
+
+def test_insertion_changes_only_nearby_chunks():
+    # Fixed data, so the test does not depend on where maximum-size cuts fall
+    data = random.Random(1).randbytes(32 * 1024 * 1024)
+    at = 10 * 1024 * 1024 + 12345
+    before = chunk_hashes(data)
+    after = chunk_hashes(data[:at] + b'inserted text' + data[at:])
+    # The chunk holding the insertion changes, and at most the one after it
+    # when the insertion sits in a cut pattern
+    assert len(set(after) - set(before)) <= 2
+    assert len(set(before) - set(after)) <= 2
+    # Zero-filled regions never match the pattern, so they cut at the maximum
+    zeros = [len(chunk) for chunk in iter_chunks(io.BytesIO(bytes(3 * MAX_CHUNK_SIZE)))]
+    assert zeros == [MAX_CHUNK_SIZE] * 3
+
+
+def make_volume(root: Path) -> Path:
+    volume = root / 'media'
+    (volume / 'documents' / 'originals').mkdir(parents=True)
+    (volume / 'documents' / 'empty').mkdir()
+    for number in range(5):
+        (volume / 'documents' / 'originals' / f"{number:04d}.pdf").write_bytes(os.urandom(3 * MIN_CHUNK_SIZE))
+    (volume / 'small.txt').write_bytes(b'hello\n')
+    (volume / 'large.bin').write_bytes(random.Random(2).randbytes(6 * 1024 * 1024))
+    (volume / 'link.pdf').symlink_to('documents/originals/0000.pdf')
+    return volume
+
+
+def backup(store: Path, backups: Path, name: str, volume: Path, previous: str = None) -> dict:
+    output = backups / name
+    output.mkdir(parents=True)
+    args = ['--store', str(store), 'backup', '--output', str(output), '--volume', f"media={volume}"]
+    if previous:
+        args += ['--previous', str(backups / previous / MANIFEST_FILE)]
+    assert backup_chunks.main(args) == 0
+    return read_manifest((output / MANIFEST_FILE).read_bytes())
+
+
+def restore(store: Path, backups: Path, name: str, target: Path):
+    assert backup_chunks.main(['--store', str(store), 'restore', '--source-dir', str(backups),
+                               '--target-dir', str(target), name]) == 0
+
+
+def assert_same_tree(left: Path, right: Path):
+    comparison = filecmp.dircmp(left, right)
+    assert not comparison.left_only and not comparison.right_only and not comparison.diff_files
+    for directory in comparison.common_dirs:
+        assert_same_tree(left / directory, right / directory)
+
+
+def pending(store: Path):
+    chunk_store = ChunkStore(str(store), readonly=True)
+    try:
+        return chunk_store.pending_uploads()
+    finally:
+        chunk_store.close()
+
+
+def test_backup_restore_round_trip(tmp_path):
+    volume = make_volume(tmp_path)
+    store, backups = tmp_path / 'store', tmp_path / 'backups'
+    manifest = backup(store, backups, 'backup-20260101_020000', volume)
+    assert len(pending(store)) == len(manifest_chunks(manifest))
+
+    restore(store, backups, 'backup-20260101_020000', tmp_path / 'restored')
+    assert_same_tree(volume, tmp_path / 'restored' / 'media')
+    assert os.readlink(tmp_path / 'restored' / 'media' / 'link.pdf') == 'documents/originals/0000.pdf'
+    assert (tmp_path / 'restored' / 'media' / 'documents' / 'empty').is_dir()
+
+
+def test_second_backup_stores_only_changes(tmp_path, monkeypatch):
+    volume = make_volume(tmp_path)
+    store, backups = tmp_path / 'store', tmp_path / 'backups'
+    first = backup(store, backups, 'backup-20260101_020000', volume)
+    monkeypatch.setattr('sys.stdin', io.StringIO(''.join(f"{path}\n" for path in pending(store))))
+    assert backup_chunks.main(['--store', str(store), 'mark-uploaded']) == 0
+    assert pending(store) == []
+
+    # Insert into the middle of the large file, and copy a document (new inode)
+    large = volume / 'large.bin'
+    data = large.read_bytes()
+    large.write_bytes(data[:3 * 1024 * 1024] + b'an edit' + data[3 * 1024 * 1024:])
+    shutil.copy(volume / 'documents' / 'originals' / '0001.pdf', volume / 'copy.pdf')
+    second = backup(store, backups, 'backup-20260102_020000', volume, previous='backup-20260101_020000')
+
+    new_chunks = manifest_chunks(second) - manifest_chunks(first)
+    assert 1 <= len(new_chunks) <= 2
+    assert sorted(Path(path).name for path in pending(store)) == sorted(new_chunks)
+    files = {entry['path']: entry for entry in second['volumes']['media'] if entry['type'] == 'file'}
+    assert files['copy.pdf']['chunks'] == files['documents/originals/0001.pdf']['chunks']
+
+    restore(store, backups, 'backup-20260102_020000', tmp_path / 'restored')
+    assert_same_tree(volume, tmp_path / 'restored' / 'media')
+
+
+def test_gc_keeps_referenced_chunks(tmp_path):
+    volume = make_volume(tmp_path)
+    store, backups = tmp_path / 'store', tmp_path / 'backups'
+    first = backup(store, backups, 'backup-20260101_020000', volume)
+    (volume / 'documents' / 'originals' / '0002.pdf').unlink()
+    (volume / 'new.pdf').write_bytes(os.urandom(2 * MIN_CHUNK_SIZE))
+    second = backup(store, backups, 'backup-20260102_020000', volume, previous='backup-20260101_020000')
+
+    shutil.rmtree(backups / 'backup-20260101_020000')
+    assert backup_chunks.main(['--store', str(store), 'gc', '--backups-dir', str(backups)]) == 0
+
+    chunk_store = ChunkStore(str(store), readonly=True)
+    try:
+        assert chunk_store.known == manifest_chunks(second)
+    finally:
+        chunk_store.close()
+    on_disk = {path.name for path in (store / 'data').glob('*/*')}
+    assert on_disk == manifest_chunks(second)
+    assert manifest_chunks(first) - manifest_chunks(second)
+
+    restore(store, backups, 'backup-20260102_020000', tmp_path / 'restored')
+    assert_same_tree(volume, tmp_path / 'restored' / 'media')
@@ -0,0 +1,128 @@
+"""
+Output of backup_pipeline.py read back by standard tools
+
+- ParallelGzipWriter's concatenated members decompress to exactly the
+  input with gzip(1) and Python's gzip module, for inputs on either side of
+  the member boundary, and each member decompresses on its own
+- the member index written next to each volume archive points at the right
+  bytes: decompressing only the gzip members its offsets name gives back
+  every file and its recorded sha256, and each member's header alone reads
+  as a tar archive of that member
+- `tee` records the sha256 of exactly the bytes it wrote
+"""
+
+import io
+import os
+import gzip
+import json
+import shutil
+import tarfile
+import hashlib
+import subprocess
+import concurrent.futures
+
+import pytest
+
+from backup_pipeline import DEFAULT_BLOCK_SIZE, HashingWriter, ParallelGzipWriter, archive_volume, index_name, tee_stream
+
+SIZES = [0, 1, DEFAULT_BLOCK_SIZE - 1, DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE + 1, 3 * DEFAULT_BLOCK_SIZE + 17]
+
+
+def compress(data: bytes, path, write_size: int = 65537) -> ParallelGzipWriter:
+    with open(path, 'wb') as raw, concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        hashing = HashingWriter(raw)
+        compressor = ParallelGzipWriter(hashing, executor, level=6, max_pending=4)
+        # Writes that don't line up with the blocks
+        for start in range(0, len(data), write_size):
+            compressor.write(data[start:start + write_size])
+        compressor.close()
+    assert hashing.sha256.hexdigest() == hashlib.sha256(path.read_bytes()).hexdigest()
+    return compressor
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_parallel_gzip_round_trip(tmp_path, size):
+    # Half random, half repetitive, so members compress to different lengths
+    data = (os.urandom(size // 2) + b'paperless' * size)[:size]
+    path = tmp_path / 'data.gz'
+    compressor = compress(data, path)
+
+    assert gzip.decompress(path.read_bytes()) == data
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == data
+    assert len(compressor.block_lengths) == max(1, -(-size // DEFAULT_BLOCK_SIZE))
+    assert sum(compressor.block_lengths) == path.stat().st_size
+
+    # Every member stands alone
+    compressed, offset = path.read_bytes(), 0
+    for number, length in enumerate(compressor.block_lengths):
+        block = gzip.decompress(compressed[offset:offset + length])
+        assert block == data[number * DEFAULT_BLOCK_SIZE:(number + 1) * DEFAULT_BLOCK_SIZE]
+        offset += length
+
+    if shutil.which('gzip'):
+        subprocess.run(['gzip', '-t', str(path)], check=True)
+        assert subprocess.run(['gzip', '-dc', str(path)], check=True, capture_output=True).stdout == data
+
+
+def read_range(archive: bytes, index, start: int, end: int) -> bytes:
+    """Tar bytes [start, end) from only the gzip members covering them"""
+    if start >= end:
+        return b''
+    block_size, blocks = index['block_size'], index['blocks'] + [index['compressed_size']]
+    first, last = start // block_size, (end - 1) // block_size
+    data = gzip.decompress(archive[blocks[first]:blocks[last + 1]])
+    return data[start - first * block_size:end - first * block_size]
+
+
+def test_index_offsets_point_at_members(tmp_path):
+    volume = tmp_path / 'volume'
+    (volume / 'documents' / 'originals').mkdir(parents=True)
+    files = {
+        'empty.txt': b'',
+        'small.txt': b'hello\n',
+        'documents/originals/scan.pdf': os.urandom(10000),
+        # A name too long for a ustar header, so the member gets a PAX header
+        'documents/' + 'long-name-' * 12 + '.pdf': os.urandom(3000),
+        'documents/exact.bin': os.urandom(4096),
+    }
+    for path, data in files.items():
+        (volume / path).write_bytes(data)
+    (volume / 'link.pdf').symlink_to('documents/originals/scan.pdf')
+    output = tmp_path / 'backup'
+    output.mkdir()
+
+    # Small blocks, so members straddle gzip member boundaries
+    result = archive_volume('media', str(volume), str(output), block_size=4096)
+    archive = (output / 'media.tar.gz').read_bytes()
+    index = json.loads(gzip.decompress((output / index_name('media.tar.gz')).read_bytes()))
+    assert result['index']['file'] == index_name('media.tar.gz')
+    assert index['size'] == len(gzip.decompress(archive))
+    assert len(index['blocks']) >= 8
+
+    members = {member['path']: member for member in index['members']}
+    assert {f"./{path}" for path in files} <= set(members)
+    for path, data in files.items():
+        member = members[f"./{path}"]
+        assert member['size'] == len(data)
+        content = read_range(archive, index, member['data_offset'], member['data_offset'] + member['size'])
+        assert content == data
+        assert member['sha256'] == hashlib.sha256(data).hexdigest()
+
+    for member in index['members']:
+        padded = -(-member['size'] // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        alone = read_range(archive, index, member['offset'], member['data_offset'] + padded)
+        with tarfile.open(fileobj=io.BytesIO(alone + b'\0' * 1024)) as tar:
+            [info] = tar.getmembers()
+            assert info.name == member['path']
+            if info.isreg():
+                assert tar.extractfile(info).read() == files[member['path'][2:]]
+    assert members['./link.pdf']['sha256'] is None
+
+
+def test_tee_hashes_what_it_writes(tmp_path):
+    data = os.urandom(2 * DEFAULT_BLOCK_SIZE + 5)
+    result = tee_stream(io.BytesIO(data), tmp_path / 'database.sql', chunk_size=65536)
+    assert (tmp_path / 'database.sql').read_bytes() == data
+    assert result['sha256'] == hashlib.sha256(data).hexdigest()
+    assert result['bytes_in'] == len(data)
@@ -0,0 +1,100 @@
+"""
+Retention decisions and their catalog records in backup_retention.py
+
+- the daily, weekly and monthly rules each keep the newest backup of a
+  calendar day, ISO week (Monday to Sunday) and month, across the boundary
+  between two of them
+- a rule with a count of 0 keeps nothing, and a policy keeping nothing at
+  all is refused
+- the local age limit removes old local copies while the policy keeps the
+  backup, and every local deletion, including ones made by hand, ends up
+  in the catalog
+"""
+
+import time
+from typing import List, Set
+
+import pytest
+
+import backup_retention
+from backup_catalog import BackupCatalog, parse_backup_timestamp
+from backup_retention import RetentionPolicy, build_plan
+
+
+def kept(names: List[str], **counts) -> Set[str]:
+    reasons = RetentionPolicy(**counts).apply({name: parse_backup_timestamp(name) for name in names})
+    return {name for name, rules in reasons.items() if rules}
+
+
+def test_daily_keeps_newest_of_each_day():
+    names = ['backup-20260301_020000', 'backup-20260301_235959',
+             'backup-20260302_000000', 'backup-20260302_120000',
+             'backup-20260303_020000']
+    assert kept(names, daily=2) == {'backup-20260303_020000', 'backup-20260302_120000'}
+    assert kept(names, daily=3) == {'backup-20260303_020000', 'backup-20260302_120000', 'backup-20260301_235959'}
+
+
+def test_weekly_splits_iso_weeks_between_sunday_and_monday():
+    # Sunday 1 March is in ISO week 9; Monday 2 to Sunday 8 March is week 10
+    names = ['backup-20260301_020000', 'backup-20260302_020000',
+             'backup-20260308_020000', 'backup-20260309_020000']
+    assert kept(names, weekly=2) == {'backup-20260309_020000', 'backup-20260308_020000'}
+    assert kept(names, weekly=3) == {'backup-20260309_020000', 'backup-20260308_020000', 'backup-20260301_020000'}
+
+
+def test_monthly_keeps_newest_of_each_month():
+    names = ['backup-20260130_020000', 'backup-20260131_235959',
+             'backup-20260201_000000', 'backup-20260228_020000']
+    assert kept(names, monthly=1) == {'backup-20260228_020000'}
+    assert kept(names, monthly=2) == {'backup-20260228_020000', 'backup-20260131_235959'}
+    # More months asked for than exist keeps one per month, nothing extra
+    assert kept(names, monthly=12) == {'backup-20260228_020000', 'backup-20260131_235959'}
+
+
+def test_rules_combine_and_zero_disables_a_rule():
+    names = [f"backup-202601{day:02d}_020000" for day in range(1, 29)]
+    # 4 January is a Sunday, so each ISO week ends on the 4th, 11th, 18th and 25th
+    assert kept(names, last=2, weekly=0) == {'backup-20260128_020000', 'backup-20260127_020000'}
+    assert kept(names, last=2, weekly=3) == {'backup-20260128_020000', 'backup-20260127_020000',
+                                            'backup-20260125_020000', 'backup-20260118_020000'}
+    assert kept(names, last=0, daily=0, weekly=0, monthly=1) == {'backup-20260128_020000'}
+    with pytest.raises(ValueError):
+        RetentionPolicy(last=0, daily=0, weekly=0, monthly=0)
+
+
+def test_local_age_limit_keeps_cloud_copy():
+    now = parse_backup_timestamp('backup-20260320_030000')
+    local = ['backup-20260301_020000', 'backup-20260315_020000', 'backup-20260320_020000']
+    cloud = ['backup-20260301_020000', 'backup-20260315_020000']
+    plan = {entry['name']: entry for entry in build_plan(RetentionPolicy(last=3), local, cloud, 7, now)}
+    assert plan['backup-20260301_020000']['keep'] and not plan['backup-20260301_020000']['keep_local']
+    assert plan['backup-20260315_020000']['keep'] and plan['backup-20260315_020000']['keep_local']
+    # Without a policy only the age limit applies
+    plan = {entry['name']: entry for entry in build_plan(None, local, None, 7, now)}
+    assert [name for name, entry in plan.items() if not entry['keep_local']] == ['backup-20260301_020000']
+    assert all(entry['keep'] for entry in plan.values())
+
+
+def test_local_cleanup_is_recorded(tmp_path):
+    backups_dir = tmp_path / 'backups'
+    stamp = lambda days_ago: time.strftime('backup-%Y%m%d_%H%M%S', time.localtime(time.time() - days_ago * 86400))
+    old, removed_by_hand, recent = stamp(10), stamp(5), stamp(1)
+    for name in (old, recent):
+        (backups_dir / name).mkdir(parents=True)
+    catalog_path = str(tmp_path / 'catalog.db')
+    catalog = BackupCatalog(catalog_path)
+    for name in (old, removed_by_hand, recent):
+        catalog.record_upload(name, 1024)
+    catalog.close()
+
+    assert backup_retention.main(['--backups-dir', str(backups_dir), '--catalog', catalog_path,
+                                  '--local-max-age-days', '7']) == 0
+
+    assert sorted(path.name for path in backups_dir.iterdir()) == [recent]
+    catalog = BackupCatalog(catalog_path)
+    try:
+        assert catalog.live_local_backups() == [recent]
+        # Still in the cloud: only the local copies were deleted
+        assert {backup['name'] for backup in catalog.live_cloud_backups()} == {old, removed_by_hand, recent}
+    finally:
+        catalog.close()
@@ -0,0 +1,162 @@
+"""
+Resuming interrupted uploads with backup_upload.py
+
+Uploads a directory of real files through the fake rclone, which is made to
+die after copying a few files of every batch it is given, and reruns the
+upload until it completes, as the backup script's retries would:
+
+- the remote ends up identical to the source, and every file is sent once
+- a rerun only hands rclone the batch that was interrupted, never the
+  batches the catalog already recorded (the old `rclone copy` of the whole
+  backup re-examined every file on each run)
+
+An archive larger than the part size is uploaded in parts, with the upload
+cut off at one of them:
+
+- a rerun sends only the parts that were not finished, not the whole file
+- the parts read back as the original archive: a full and a sampled
+  verification pass, the post-upload check accepts them, and the exporter
+  counts them as one media file of the archive's size
+"""
+
+import os
+import subprocess
+import filecmp
+
+import backup_pipeline
+import backup_upload
+import backup_verify
+from backup_catalog import BackupCatalog
+from backup_exporter.rclone import CloudInventory
+
+FILES = 120
+BATCH_FILES = 10
+FAIL_AFTER = 4
+NAME = 'backup-20260101_020000'
+
+
+def test_interrupted_upload_resumes(tmp_path, fake_remote, monkeypatch, report):
+    source = tmp_path / NAME
+    source.mkdir()
+    for number in range(FILES):
+        (source / f"{number:04d}.bin").write_bytes(os.urandom(1024 + number * 97))
+
+    offered = []
+    copy_batch = backup_upload.copy_batch
+
+    def counting_copy_batch(source, destination, paths, *args, **kwargs):
+        offered.append(len(paths))
+        return copy_batch(source, destination, paths, *args, **kwargs)
+
+    monkeypatch.setattr(backup_upload, 'copy_batch', counting_copy_batch)
+    monkeypatch.setenv('FAKE_RCLONE_COPY_FAIL_AFTER', str(FAIL_AFTER))
+
+    files = backup_upload.list_upload_files(source)
+    catalog = BackupCatalog(str(tmp_path / 'catalog.db'))
+    runs, bytes_sent = 0, 0
+    try:
+        while True:
+            runs += 1
+            assert runs <= FILES, "upload never completed"
+            try:
+                summary = backup_upload.upload(source, f"remote:{NAME}", files, NAME, catalog=catalog,
+                                               batch_files=BATCH_FILES, attempts=1)
+            except backup_upload.UploadError:
+                bytes_sent += catalog.conn.execute(
+                    "SELECT run_bytes_sent FROM upload_progress WHERE name = ?", (NAME,)).fetchone()[0]
+                continue
+            bytes_sent += summary['bytes_sent']
+            break
+        status = catalog.conn.execute("SELECT status FROM upload_progress WHERE name = ?", (NAME,)).fetchone()[0]
+    finally:
+        catalog.close()
+
+    total_bytes = sum(size for _, size, _ in files)
+    batches = -(-FILES // BATCH_FILES)
+    report(f"{FILES} files in batches of {BATCH_FILES}, rclone dies after {FAIL_AFTER} files per call", [
+        f"{runs} run(s), {len(offered)} rclone call(s), {sum(offered)} file(s) offered to rclone",
+        f"a whole-backup rclone copy per run would have offered {runs * FILES}",
+    ])
+    comparison = filecmp.dircmp(source, fake_remote / NAME)
+    assert not comparison.left_only and not comparison.diff_files
+    assert status == 'done'
+    # Only finished batches count; files an interrupted call copied are skipped by the next one
+    assert bytes_sent <= total_bytes
+    # Each rerun starts at the interrupted batch: every batch is offered until it completes, never after
+    assert sum(offered) <= FILES + (runs - 1) * BATCH_FILES
+    assert len(offered) == runs + batches - 1
+
+
+def test_large_file_resumes_by_part(tmp_path, fake_remote, monkeypatch, report):
+    volume = tmp_path / 'volume'
+    volume.mkdir()
+    for number in range(24):
+        (volume / f"{number:02d}.pdf").write_bytes(os.urandom(256 * 1024 + number))
+    source = tmp_path / NAME
+    source.mkdir()
+    assert backup_pipeline.main(['archive', '--output', str(source), '--volume', f"media={volume}",
+                                 '--checksums', str(source / 'checksums.txt')]) == 0
+    archive_size = (source / 'media.tar.gz').stat().st_size
+    part_size = 1024 * 1024
+    parts = -(-archive_size // part_size)
+    assert parts > 4
+
+    offered = []
+    copy_part = backup_upload.copy_part
+
+    def counting_copy_part(source, destination, part, *args, **kwargs):
+        offered.append(part[0][0])
+        return copy_part(source, destination, part, *args, **kwargs)
+
+    monkeypatch.setattr(backup_upload, 'copy_part', counting_copy_part)
+    files = backup_upload.list_upload_files(source)
+    catalog = BackupCatalog(str(tmp_path / 'catalog.db'))
+    try:
+        # Cut off while sending the fourth part
+        monkeypatch.setenv('FAKE_RCLONE_RCAT_FAIL_PATH', 'media.tar.gz.part00003')
+        try:
+            backup_upload.upload(source, f"remote:{NAME}", files, NAME, catalog=catalog, attempts=1,
+                                 part_size=part_size)
+            assert False, "the injected failure did not stop the upload"
+        except backup_upload.UploadError:
+            pass
+        assert sorted(path.name for path in (fake_remote / NAME).glob('media.tar.gz.part*')) == [
+            f"media.tar.gz.part{number:05d}" for number in range(3)]
+        first_run = list(offered)
+
+        monkeypatch.delenv('FAKE_RCLONE_RCAT_FAIL_PATH')
+        offered.clear()
+        summary = backup_upload.upload(source, f"remote:{NAME}", files, NAME, catalog=catalog, attempts=1,
+                                       part_size=part_size)
+    finally:
+        catalog.close()
+
+    report(f"media.tar.gz of {archive_size} bytes in {parts} parts of {part_size}, cut off at part 3", [
+        f"first run: {len(first_run)} part(s) offered; rerun: {len(offered)} part(s), "
+        f"{summary['bytes_sent']} bytes sent",
+    ])
+    assert first_run == [f"media.tar.gz.part{number:05d}" for number in range(4)]
+    # The rerun starts at the part that was cut off
+    assert offered == [f"media.tar.gz.part{number:05d}" for number in range(3, parts)]
+    assert summary['skipped_parts'] == 3 and summary['parts'] == parts
+    assert summary['bytes_sent'] <= archive_size - 3 * part_size
+    assert not (fake_remote / NAME / 'media.tar.gz').exists()
+
+    remote = backup_verify.RcloneSource('remote:')
+    assert remote.list_files(NAME)['media.tar.gz'] == archive_size
+    assert backup_verify.verify_backup(remote, NAME)['ok']
+    # Sampled runs also expect a backup-info.txt, which this backup does not have
+    sampled = backup_verify.verify_backup(remote, NAME, plan=backup_verify.SamplePlan(1.0, 1))
+    media = {r['file']: r for r in sampled['results']}['media.tar.gz']
+    assert media['ok'] and media['bytes_checked'] == archive_size, media
+    check = backup_verify.check_upload(remote, source)
+    assert check['ok'], check
+    assert {r['file']: r['method'] for r in check['results']}['media.tar.gz'] == 'parts'
+
+    listing = subprocess.run(['rclone', 'lsjson', '-R', '--files-only', 'remote:'], capture_output=True, check=True)
+    inventory = CloudInventory()
+    for line in listing.stdout.splitlines():
+        inventory.feed(line)
+    totals = inventory.backups[NAME]
+    assert totals['types']['Media'] == archive_size
+    assert totals['file_count'] == len(files)
@@ -0,0 +1,117 @@
+"""
+Checking an upload against the local backup with backup_verify.py --local-dir
+
+Writes a backup with its checksums.txt, copies it to the fake rclone remote
+the way `rclone copy` does (mtimes kept) and checks it from one listing:
+
+- a faithful copy passes, every file checksums.txt lists compared by the
+  sha256 the remote lists
+- a file missing from the remote, or one whose remote bytes differ at the
+  same size, fails the check and is recorded in the catalog as a mismatch
+- on a remote listing no hashes (crypt), files are compared by size and
+  mtime, and a copy that lost its mtime fails
+- an upload check reads nothing back, so it adds nothing to the bit-rot
+  coverage the sampled verification reports
+"""
+
+import os
+import shutil
+
+import pytest
+
+import backup_pipeline
+import backup_verify
+from backup_catalog import BackupCatalog
+
+NAME = 'backup-20260101_020000'
+
+
+@pytest.fixture
+def uploaded(tmp_path, fake_remote):
+    volume = tmp_path / 'volume'
+    volume.mkdir()
+    for number in range(3):
+        (volume / f"{number}.pdf").write_bytes(os.urandom(20000 + number))
+    backup_dir = tmp_path / 'backups' / NAME
+    backup_dir.mkdir(parents=True)
+    assert backup_pipeline.main(['archive', '--output', str(backup_dir), '--volume', f"media={volume}",
+                                 '--checksums', str(backup_dir / 'checksums.txt')]) == 0
+    shutil.copytree(backup_dir, fake_remote / NAME)
+    catalog_path = str(tmp_path / 'catalog.db')
+    catalog = BackupCatalog(catalog_path)
+    catalog.record_upload(NAME, 1024)
+    catalog.close()
+    return backup_dir, fake_remote / NAME, catalog_path
+
+
+def check(backup_dir, catalog_path) -> int:
+    return backup_verify.main(['--remote', 'remote:', '--local-dir', str(backup_dir), '--catalog', catalog_path])
+
+
+def latest_check(catalog_path):
+    catalog = BackupCatalog(catalog_path)
+    try:
+        return catalog.upload_checks()[NAME]
+    finally:
+        catalog.close()
+
+
+def test_matching_upload(uploaded):
+    backup_dir, _, catalog_path = uploaded
+    summary = backup_verify.check_upload(backup_verify.RcloneSource('remote:'), backup_dir)
+    assert summary['ok']
+    # checksums.txt cannot list itself, so it is the one file compared by size and mtime
+    methods = {r['file']: r['method'] for r in summary['results']}
+    assert methods.pop('checksums.txt') == 'size_mtime'
+    assert set(methods.values()) == {'hash'}
+    assert 'media.tar.gz' in methods
+
+    assert check(backup_dir, catalog_path) == 0
+    result = latest_check(catalog_path)
+    assert result['ok'] and result['mismatches'] == []
+    catalog = BackupCatalog(catalog_path)
+    try:
+        assert catalog.verify_coverage(86400).get(NAME, 0.0) == 0.0
+    finally:
+        catalog.close()
+
+
+def test_missing_file(uploaded):
+    backup_dir, remote_dir, catalog_path = uploaded
+    (remote_dir / 'media.tar.gz').unlink()
+
+    assert check(backup_dir, catalog_path) == 1
+    result = latest_check(catalog_path)
+    assert not result['ok']
+    assert result['mismatches'] == ['media.tar.gz: missing from remote']
+
+
+def test_hash_mismatch(uploaded):
+    backup_dir, remote_dir, catalog_path = uploaded
+    remote_file = remote_dir / 'media.tar.gz'
+    stat = remote_file.stat()
+    data = bytearray(remote_file.read_bytes())
+    data[len(data) // 2] ^= 0xff
+    remote_file.write_bytes(bytes(data))
+    # Same size and mtime: only the hash tells them apart
+    os.utime(remote_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert check(backup_dir, catalog_path) == 1
+    [mismatch] = latest_check(catalog_path)['mismatches']
+    assert mismatch.startswith('media.tar.gz: checksum mismatch')
+
+
+def test_size_and_mtime_without_remote_hashes(uploaded, monkeypatch):
+    backup_dir, remote_dir, _ = uploaded
+    monkeypatch.setenv('FAKE_RCLONE_HASHES', '0')
+    source = backup_verify.RcloneSource('remote:')
+    summary = backup_verify.check_upload(source, backup_dir)
+    assert summary['ok']
+    assert summary['methods'] == {'hash': 0, 'size_mtime': len(summary['results']), 'parts': 0}
+    assert summary['bytes_checked'] == 0
+
+    os.utime(remote_dir / 'media.tar.gz', (0, 0))
+    summary = backup_verify.check_upload(source, backup_dir)
+    [failed] = [r for r in summary['results'] if not r['ok']]
+    assert failed['file'] == 'media.tar.gz'
+    assert failed['error'].startswith('modification time differs')
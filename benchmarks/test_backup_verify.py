@@ -0,0 +1,173 @@
+"""
+Sampled verification in backup_verify.py
+
+- any `window_days` consecutive daily plans check every read slot of an
+  archive, and a single run never checks a slot twice
+- run against a real archive, with or without its member index, a window
+  with one run per slot decompresses every gzip member exactly once, and a
+  corrupted member fails the one run that reaches it
+- adjacent slots are read as one range: with the index each byte of the
+  range is read once, and without it a range costs at most SAMPLE_READ_SIZE
+  of extra reading (the old way read each slot plus SAMPLE_READ_SIZE)
+"""
+
+import os
+import gzip
+import json
+import math
+
+import pytest
+
+import backup_verify
+
+from backup_pipeline import archive_volume, index_name
+from backup_verify import SAMPLE_READ_SIZE, LocalSource, SamplePlan, count_tar_headers, sample_archive
+
+NAME = 'backup-20260101_020000'
+DAY = 20000
+
+
+@pytest.mark.parametrize('size, fraction, window_days', [
+    (1, 0.05, 7),
+    (SAMPLE_READ_SIZE * 3, 0.05, 7),
+    (SAMPLE_READ_SIZE * 50 + 1, 0.05, 7),
+    (SAMPLE_READ_SIZE * 50 + 1, 0.5, 7),
+    (SAMPLE_READ_SIZE * 1000, 0.001, 30),
+])
+def test_window_covers_every_slot(size, fraction, window_days):
+    slots = math.ceil(size / SAMPLE_READ_SIZE)
+    for first_day in (DAY, DAY + 3):
+        covered = set()
+        for day in range(first_day, first_day + window_days):
+            plan = SamplePlan(fraction, window_days, seed='test', day=day)
+            offsets = plan.offsets(NAME, 'media.tar.gz', size)
+            assert len(set(offsets)) == len(offsets)
+            assert len(offsets) >= min(slots, math.ceil(fraction * slots))
+            assert all(offset % SAMPLE_READ_SIZE == 0 and 0 <= offset < size for offset in offsets)
+            covered.update(offsets)
+        assert covered == {slot * SAMPLE_READ_SIZE for slot in range(slots)}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    volume = tmp_path / 'volume'
+    volume.mkdir()
+    for number in range(12):
+        (volume / f"{number:02d}.bin").write_bytes(os.urandom(700 * 1024 + number))
+    backup = tmp_path / 'backups' / NAME
+    backup.mkdir(parents=True)
+    archive_volume('media', str(volume), str(backup))
+    index = json.loads(gzip.decompress((backup / index_name('media.tar.gz')).read_bytes()))
+    return backup / 'media.tar.gz', index
+
+
+class CountingSource(LocalSource):
+    """Counts the ranged reads and the bytes they return"""
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        self.reads = self.bytes_read = 0
+
+    def read_range(self, backup_name, file_name, offset, count):
+        data = super().read_range(backup_name, file_name, offset, count)
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+
+@pytest.mark.parametrize('indexed', [True, False])
+def test_window_checks_every_member_once(archive, indexed):
+    path, index = archive
+    size = path.stat().st_size
+    source = LocalSource(str(path.parent.parent))
+    # One slot per run; a longer window wraps around and checks some twice
+    window_days = math.ceil(size / SAMPLE_READ_SIZE)
+    assert window_days > 1
+
+    bytes_checked = members = 0
+    for day in range(DAY, DAY + window_days):
+        result = sample_archive(source, NAME, 'media.tar.gz', size, SamplePlan(0.01, window_days, day=day),
+                                indexed=indexed)
+        assert result['ok'], result['error']
+        bytes_checked += result['bytes_checked']
+        members += result['members']
+    # Every gzip member, and nothing twice
+    assert bytes_checked == index['compressed_size'] == size
+    # The tar headers a full pass sees (PAX members have two each)
+    assert members == count_tar_headers(gzip.decompress(path.read_bytes())) >= len(index['members'])
+
+
+@pytest.mark.parametrize('indexed', [True, False])
+def test_corrupt_member_fails_its_run(archive, indexed):
+    path, index = archive
+    size = path.stat().st_size
+    # Flip a byte inside the third gzip member
+    corrupt_at = index['blocks'][2] + 100
+    data = bytearray(path.read_bytes())
+    data[corrupt_at] ^= 0xff
+    path.write_bytes(bytes(data))
+    source = LocalSource(str(path.parent.parent))
+
+    window_days = math.ceil(size / SAMPLE_READ_SIZE)
+    failed = []
+    for day in range(DAY, DAY + window_days):
+        result = sample_archive(source, NAME, 'media.tar.gz', size, SamplePlan(0.01, window_days, day=day),
+                                indexed=indexed)
+        if not result['ok']:
+            failed.append(result['error'])
+    assert len(failed) == 1
+    assert f"at byte {index['blocks'][2]}" in failed[0]
+
+
+def test_adjacent_slots_are_read_once(archive, report):
+    path, index = archive
+    size = path.stat().st_size
+    plan = SamplePlan(1.0, 1, day=DAY)
+    assert len(plan.offsets(NAME, 'media.tar.gz', size)) > 1
+    assert plan.ranges(NAME, 'media.tar.gz', size) == [(0, size)]
+
+    lines = []
+    for indexed in (True, False):
+        source = CountingSource(str(path.parent.parent))
+        result = sample_archive(source, NAME, 'media.tar.gz', size, plan, indexed=indexed)
+        assert result['ok'], result['error']
+        assert result['bytes_checked'] == size
+        lines.append(f"{'index' if indexed else 'header scan'}: {source.reads} read(s), "
+                     f"{source.bytes_read} bytes of a {size} byte archive")
+        if indexed:
+            assert source.bytes_read == size
+        else:
+            assert source.bytes_read <= size + SAMPLE_READ_SIZE
+    report("a whole archive sampled in one run", lines)
+
+
+def test_stale_index_falls_back_to_scanning(archive):
+    path, index = archive
+    size = path.stat().st_size
+    index_path = path.parent / index_name('media.tar.gz')
+    index_path.write_bytes(gzip.compress(json.dumps(dict(index, blocks=index['blocks'][::2])).encode()))
+    source = LocalSource(str(path.parent.parent))
+    # The index is not listed in checksums.txt here, so only its mismatch with the archive shows
+    result = sample_archive(source, NAME, 'media.tar.gz', size, SamplePlan(1.0, 1, day=DAY), indexed=True)
+    assert not result['ok']
+    assert 'does not end where the index says' in result['error']
+
+    # Listed with another digest, the index is not trusted and members are found by their headers
+    result = sample_archive(source, NAME, 'media.tar.gz', size, SamplePlan(1.0, 1, day=DAY), indexed=True,
+                            index_sha256='0' * 64)
+    assert result['ok'], result['error']
+    assert result['bytes_checked'] == size
+
+
+def test_long_range_is_read_in_pieces(archive, monkeypatch):
+    path, index = archive
+    size = path.stat().st_size
+    monkeypatch.setattr(backup_verify, 'MAX_SAMPLE_READ_SIZE', 3 * 1024 * 1024)
+    for indexed in (True, False):
+        source = CountingSource(str(path.parent.parent))
+        result = sample_archive(source, NAME, 'media.tar.gz', size, SamplePlan(1.0, 1, day=DAY), indexed=indexed)
+        assert result['ok'], result['error']
+        assert result['bytes_checked'] == size
+        assert source.reads >= size / (3 * 1024 * 1024)
+        # Only a member cut off by the end of a piece is read again
+        assert source.bytes_read <= size + source.reads * 1.1 * 1024 * 1024
@@ -0,0 +1,24 @@
+"""
+Scrape latency of a running exporter under concurrent load
+
+Starts the exporter as a subprocess against the session's synthetic tree
+with a fake rclone that is slow and often hangs. In background mode a
+scrape only serialises the last snapshot, so:
+
+- no scrape fails while rclone calls hang or time out
+- p99 stays far below the rclone deadline, which no scrape should wait on
+"""
+
+from exporter_load import format_report, run_load
+
+RCLONE_TIMEOUT = 2
+
+
+def test_scrapes_under_hanging_rclone(backup_tree, report):
+    result = run_load(backup_tree, scrapers=4, duration=5, warmup=1, rclone_latency='0.2:1',
+                      rclone_hang_rate=0.5, rclone_timeout=RCLONE_TIMEOUT)
+
+    report("4 scrapers, background mode, half of rclone calls hang", format_report(result))
+    assert result['scrapes'] > 0
+    assert result['errors'] == 0
+    assert result['latency_ms']['p99'] < RCLONE_TIMEOUT * 1000 / 4
@@ -0,0 +1,257 @@
+"""
+Stage durations and throughput tailed from the backup logs
+
+Renders backup_paperless.sh with the role defaults and runs it against the
+fake docker host and the fake remote, then reads its log the way the
+exporter does:
+
+- every stage of a real run is parsed, and each stage that logs byte counts
+  (export, pg_dump, upload, verify) gets its bytes from the run's log file
+  rather than from output that only reaches cron
+
+The tailer itself is checked on hand-written logs:
+
+- stage start and end lines become one histogram observation per
+  successful stage, and skipped or failed stages none
+- each byte is read once: the offset carries over between polls and,
+  through the state file, across a restart
+- a half-written last line is read when the next poll finds it finished
+- a truncated or rotated log is read again from the start
+- a run cut off by a newer log is counted as failed
+- the last run's outcome, stage durations and throughput are published
+"""
+
+import os
+import re
+import subprocess
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import jinja2
+import yaml
+
+from backup_exporter import BackupExporter
+from backup_exporter.runlog import RunLogTailer
+
+ROLE_DIR = Path(__file__).resolve().parent.parent / 'ansible' / 'roles' / 'paperless_backup'
+STARTED = datetime(2026, 1, 1, 2, 0, 0)
+# A run as backup_paperless.sh logs it, as (seconds since the start, message)
+RUN = [
+    (0, 'Starting Paperless-ngx backup process'),
+    (0, 'Exporting Docker volumes...'),
+    (40, 'Archived media: 8000 -> 6000 bytes'),
+    (60, 'Backing up PostgreSQL database...'),
+    (65, 'Wrote database.sql: 5000 bytes in 5.0s'),
+    (70, 'Database backup completed'),
+    (70, 'Creating backup metadata...'),
+    (72, 'Uploading backup to cloud storage...'),
+    (90, '✓ Uploaded backup-20260101_020000: 3 file(s), 11000 bytes sent'),
+    (100, 'Backup uploaded successfully'),
+    (100, 'Verifying backup upload...'),
+    (130, 'WARNING: Backup verification failed'),
+    (131, 'Cleaning up old local backups (keeping 7 days)...'),
+    (140, 'Backup process completed successfully'),
+]
+
+
+def log_lines(run, started: datetime = STARTED) -> str:
+    return ''.join(f"[{started + timedelta(seconds=offset):%Y-%m-%d %H:%M:%S}] {message}\n"
+                   for offset, message in run)
+
+
+def observations(tailer: RunLogTailer):
+    """(count, sum) of every stage histogram"""
+    counts = {}
+    for stage, histogram in tailer.snapshot()['histograms'].items():
+        _, total, count = histogram.snapshot()
+        counts[stage] = (count, total)
+    return counts
+
+
+def render_script(base_dir: Path, name: str, **overrides) -> Path:
+    """Render a paperless_backup template with the role defaults into base_dir/scripts"""
+    variables = yaml.safe_load((ROLE_DIR / 'defaults' / 'main.yml').read_text())
+    variables.update(backup_base_dir=str(base_dir), paperless_data_dir=str(base_dir / 'paperless'),
+                     backup_catalog_path=str(base_dir / 'catalog' / 'catalog.db'),
+                     backup_chunk_store=str(base_dir / 'chunks'), **overrides)
+    template = jinja2.Template((ROLE_DIR / 'templates' / f"{name}.j2").read_text(), keep_trailing_newline=True)
+    script = base_dir / 'scripts' / name
+    script.write_text(template.render(variables))
+    script.chmod(0o755)
+    return script
+
+
+def make_base_dir(tmp_path: Path, docker_root: Path) -> Path:
+    """A backup base directory with the role's scripts installed, and volumes to back up"""
+    base_dir = tmp_path / 'backups'
+    for directory in ('scripts', 'logs', 'catalog'):
+        (base_dir / directory).mkdir(parents=True)
+    for script in (ROLE_DIR / 'files').glob('*.py'):
+        (base_dir / 'scripts' / script.name).symlink_to(script)
+    for volume in ('data', 'media', 'export', 'static'):
+        directory = docker_root / 'volumes' / f"paperless_{volume}"
+        directory.mkdir()
+        for number in range(20):
+            (directory / f"{number:03d}.bin").write_bytes(os.urandom(4096 + number * 512))
+    return base_dir
+
+
+def test_rendered_backup_run(tmp_path, fake_docker, fake_remote, report):
+    base_dir = make_base_dir(tmp_path, fake_docker)
+    script = render_script(base_dir, 'backup_paperless.sh')
+
+    result = subprocess.run(['bash', str(script)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    tailer = RunLogTailer(base_dir / 'logs')
+    assert tailer.poll()
+    run = tailer.snapshot()['last_run']
+    assert run['success']
+    stages = run['stages']
+    report("stages of a rendered backup run", [
+        f"{stage}: {result['seconds']:.0f}s, {result['bytes']} bytes" for stage, result in stages.items()
+    ])
+    assert set(stages) == {'export', 'pg_dump', 'checksum', 'upload', 'verify'}
+    assert all(result['ok'] for result in stages.values())
+    backup_dir, = base_dir.glob('backup-*/')
+    assert stages['pg_dump']['bytes'] == (backup_dir / 'database.sql').stat().st_size > 0
+    for stage in ('export', 'upload', 'verify'):
+        assert stages[stage]['bytes'] > 0
+
+
+def test_stage_observations(tmp_path):
+    (tmp_path / 'backup-20260101_020000.log').write_text(log_lines(RUN))
+    tailer = RunLogTailer(tmp_path)
+    assert tailer.poll()
+
+    # Verification failed, so it is reported but kept out of the histograms
+    assert observations(tailer) == {'export': (1, 60), 'pg_dump': (1, 10), 'checksum': (1, 2),
+                                    'upload': (1, 28), 'verify': (0, 0)}
+    run = tailer.snapshot()['last_run']
+    assert not run['success']
+    assert run['stages']['pg_dump'] == {'seconds': 10, 'bytes': 5000, 'ok': True}
+    assert run['stages']['export']['bytes'] == 8000
+    assert run['stages']['upload']['bytes'] == 11000
+    assert run['stages']['verify']['ok'] is False
+
+
+def test_skipped_stage(tmp_path):
+    run = [(offset, 'WARNING: Database container not running, skipping database backup')
+           if message == 'Database backup completed' else (offset, message)
+           for offset, message in RUN if not message.startswith('Wrote ')]
+    (tmp_path / 'backup-20260101_020000.log').write_text(log_lines(run))
+    tailer = RunLogTailer(tmp_path)
+    tailer.poll()
+    assert 'pg_dump' not in tailer.snapshot()['last_run']['stages']
+    assert observations(tailer)['pg_dump'] == (0, 0)
+
+
+def test_offsets_across_polls_and_restart(tmp_path):
+    logs_dir, state_path = tmp_path / 'logs', tmp_path / 'run_logs.json'
+    logs_dir.mkdir()
+    log = logs_dir / 'backup-20260101_020000.log'
+    first, rest = log_lines(RUN[:6]), log_lines(RUN[6:])
+    log.write_text(first)
+
+    tailer = RunLogTailer(logs_dir, state_path)
+    assert tailer.poll()
+    assert tailer.snapshot()['bytes_read'] == len(first.encode())
+    assert not tailer.poll()
+    assert tailer.snapshot()['last_run'] is None
+
+    # A restart picks up at the saved offset, with the run in progress
+    restarted = RunLogTailer(logs_dir, state_path)
+    assert not restarted.poll()
+    with open(log, 'a') as f:
+        f.write(rest)
+    assert restarted.poll()
+    assert restarted.snapshot()['bytes_read'] == log.stat().st_size
+    assert restarted.snapshot()['last_run']['stages']['pg_dump']['bytes'] == 5000
+    assert observations(restarted)['export'] == (1, 60)
+
+    # ... and once the run was counted, another restart does not count it again
+    again = RunLogTailer(logs_dir, state_path)
+    assert not again.poll()
+    assert observations(again)['export'] == (1, 60)
+
+
+def test_half_written_line(tmp_path):
+    log = tmp_path / 'backup-20260101_020000.log'
+    whole = log_lines(RUN).encode()
+    cut = len(whole) - 20
+    log.write_bytes(whole[:cut])
+
+    tailer = RunLogTailer(tmp_path)
+    tailer.poll()
+    assert tailer.snapshot()['last_run'] is None
+    assert tailer.snapshot()['bytes_read'] == whole.rindex(b'\n', 0, cut) + 1
+
+    with open(log, 'ab') as f:
+        f.write(whole[cut:])
+    assert tailer.poll()
+    assert tailer.snapshot()['last_run']['finished_at'] == (STARTED + timedelta(seconds=140)).timestamp()
+    assert tailer.snapshot()['bytes_read'] == len(whole)
+
+
+def test_truncated_and_rotated_logs(tmp_path):
+    log = tmp_path / 'backup-20260101_020000.log'
+    log.write_text(log_lines(RUN))
+    tailer = RunLogTailer(tmp_path)
+    tailer.poll()
+
+    # Truncated in place and rewritten with a shorter run
+    short = [(0, 'Exporting Docker volumes...'), (30, 'Backing up PostgreSQL database...'),
+             (35, 'Database backup completed'), (36, 'Backup process completed successfully')]
+    log.write_text(log_lines(short, STARTED + timedelta(days=1)))
+    assert tailer.poll()
+    assert tailer.snapshot()['last_run']['success']
+    assert observations(tailer)['export'] == (2, 90)
+
+    # Rotated: the old file moves aside and a new one takes its name
+    log.rename(tmp_path / 'backup-20260101_020000.log.1')
+    log.write_text(log_lines(short, STARTED + timedelta(days=2)))
+    assert tailer.poll()
+    assert observations(tailer)['export'] == (3, 120)
+    assert tailer.snapshot()['last_run']['finished_at'] == (STARTED + timedelta(days=2, seconds=36)).timestamp()
+
+
+def test_superseded_run(tmp_path):
+    # The first run died during the upload, and the next night's run started
+    (tmp_path / 'backup-20260101_020000.log').write_text(log_lines(RUN[:9]))
+    (tmp_path / 'backup-20260102_020000.log').write_text(log_lines(RUN[:2], STARTED + timedelta(days=1)))
+    tailer = RunLogTailer(tmp_path)
+    assert tailer.poll()
+
+    run = tailer.snapshot()['last_run']
+    assert not run['success']
+    assert run['finished_at'] == (STARTED + timedelta(seconds=90)).timestamp()
+    assert run['stages']['upload'] == {'seconds': 18, 'bytes': 11000, 'ok': False}
+    assert observations(tailer)['upload'] == (0, 0)
+    assert observations(tailer)['pg_dump'] == (1, 10)
+    # The newer run is still going and is not counted yet
+    assert not tailer.poll()
+
+
+def test_run_metrics(tmp_path):
+    backup_dir = tmp_path / 'backups'
+    (backup_dir / 'logs').mkdir(parents=True)
+    (backup_dir / 'logs' / 'backup-20260101_020000.log').write_text(log_lines(RUN))
+    exporter = BackupExporter(str(backup_dir), cloud_source='catalog', run_logs_dir=str(backup_dir / 'logs'))
+    metrics = exporter.generate_metrics()
+
+    def value(name: str, stage: str = None) -> float:
+        labels = re.escape(f'{{stage="{stage}"}}') if stage else ''
+        match = re.search(rf'^{name}{labels} (\S+)$', metrics, re.MULTILINE)
+        assert match, f"{name} {stage or ''} missing"
+        return float(match.group(1))
+
+    assert value('backup_run_last_success') == 0
+    assert value('backup_run_last_duration_seconds') == 140
+    assert value('backup_run_last_stage_success', 'verify') == 0
+    assert value('backup_run_last_stage_success', 'pg_dump') == 1
+    assert value('backup_run_last_stage_duration_seconds', 'upload') == 28
+    assert value('backup_run_last_stage_throughput_bytes_per_second', 'pg_dump') == 500
+    assert value('backup_run_last_stage_throughput_bytes_per_second', 'export') == 8000 / 60
+    # The checksum stage logs no byte counts, so it has no throughput
+    assert 'backup_run_last_stage_throughput_bytes_per_second{stage="checksum"}' not in metrics
+    assert value('backup_run_stage_duration_seconds_count', 'export') == 1
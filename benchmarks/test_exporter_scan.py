@@ -0,0 +1,228 @@
+"""
+Cost per scrape of the backup exporter's local scan
+
+Run with `python3 -m pytest benchmarks -s`. BENCH_BACKUPS and BENCH_FILES set
+the tree shape (100 backups of 10k files by default). Each test prints its
+timings and asserts the scan's structural guarantees rather than absolute
+times, which depend on the machine:
+
+- a cold scrape stats every file exactly once, whatever collectors run
+- a warm scrape of an unchanged tree stats nothing
+- the single pass beats the old per-type stat plus a full rglob per backup
+- allocated sizes come from st_blocks, so the sparse tree takes far less
+  disk than its apparent size
+- sizes recorded in the catalog spare the walk, unless allocated sizes
+  were asked for
+- a worker pool sizes backups to the same totals as a serial scan, and
+  overlaps the waits when directory reads block on a slow disk
+- the index stays consistent while another thread invalidates it, as the
+  inotify watcher does during scrapes and state saves
+"""
+
+import os
+import sys
+import time
+import threading
+import statistics
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from backup_exporter import BackupExporter, default_collectors
+from backup_exporter.collectors import FILE_TYPE_MAP
+from backup_catalog import BackupCatalog
+
+WARM_SCRAPES = 20
+# Added to each directory read to stand in for a cold or slow backup disk
+SLOW_DISK_LATENCY = 0.002
+
+
+def make_exporter(backup_tree: Path, scan_workers: int = 4, catalog_path: str = None,
+                  **collector_options) -> BackupExporter:
+    exporter = BackupExporter(str(backup_tree), cloud_source='catalog', scan_workers=scan_workers,
+                              catalog_path=catalog_path, collectors=default_collectors(**collector_options))
+    # The tree was just written; don't treat it as still being written
+    exporter.scan_index.settle_seconds = 0
+    return exporter
+
+
+def count_files(backup_tree: Path) -> int:
+    return sum(1 for backup in backup_tree.glob('backup-*') for f in backup.rglob('*') if f.is_file())
+
+
+def legacy_scan(backup_tree: Path) -> int:
+    """The scan the old files/ exporter ran: stat each typed artifact, then rglob the whole backup"""
+    size_bytes = 0
+    for backup_path in backup_tree.glob('backup-*'):
+        if not backup_path.is_dir():
+            continue
+        datetime.strptime(backup_path.name.replace('backup-', ''), '%Y%m%d_%H%M%S')
+        for file_name in FILE_TYPE_MAP:
+            file_path = backup_path / file_name
+            if file_path.exists() and file_path.is_file():
+                size_bytes += file_path.stat().st_size
+        size_bytes += sum(f.stat().st_size for f in backup_path.rglob('*') if f.is_file())
+    return size_bytes
+
+
+@pytest.mark.parametrize('timestamp_source', [('name', 'mtime'), ('info', 'name')])
+def test_cold_scrape(backup_tree, report, timestamp_source):
+    total_files = count_files(backup_tree)
+    exporter = make_exporter(backup_tree, timestamp_strategies=timestamp_source)
+
+    started = time.perf_counter()
+    metrics = exporter.generate_metrics()
+    elapsed = time.perf_counter() - started
+
+    backups = exporter.scan_index.entries
+    report(f"cold scrape, timestamps from {','.join(timestamp_source)}", [
+        f"{len(backups)} backups, {total_files} files in {elapsed:.3f}s",
+        f"{elapsed / total_files * 1e6:.2f}µs per file",
+        f"{len(metrics)} bytes of metrics",
+    ])
+    assert exporter.scan_index.files_stat == total_files
+    assert 'backup_local_type_size_bytes' in metrics
+
+
+def test_warm_scrape(backup_tree, report):
+    exporter = make_exporter(backup_tree)
+    exporter.generate_metrics()
+    files_stat = exporter.scan_index.files_stat
+
+    timings = []
+    for _ in range(WARM_SCRAPES):
+        started = time.perf_counter()
+        exporter.generate_metrics()
+        timings.append(time.perf_counter() - started)
+
+    report("warm scrape (index hits)", [
+        f"p50 {statistics.median(timings) * 1000:.2f}ms, max {max(timings) * 1000:.2f}ms over {WARM_SCRAPES} scrapes",
+    ])
+    assert exporter.scan_index.files_stat == files_stat
+
+
+def test_single_pass_vs_legacy(backup_tree, report):
+    started = time.perf_counter()
+    legacy_scan(backup_tree)
+    legacy = time.perf_counter() - started
+
+    exporter = make_exporter(backup_tree)
+    started = time.perf_counter()
+    exporter.get_local_backups()
+    single_pass = time.perf_counter() - started
+
+    report("cold scan, single pass vs per-type stat + rglob", [
+        f"legacy {legacy:.3f}s, single pass {single_pass:.3f}s ({legacy / single_pass:.1f}x)",
+    ])
+    assert single_pass < legacy
+
+
+def test_disk_usage(backup_tree, report):
+    exporter = make_exporter(backup_tree, disk_usage=True)
+    started = time.perf_counter()
+    backups = exporter.get_local_backups()
+    elapsed = time.perf_counter() - started
+
+    apparent = sum(b['size_bytes'] for b in backups)
+    allocated = sum(b['allocated_bytes'] for b in backups)
+    report("cold scan with disk usage", [
+        f"{len(backups)} backups in {elapsed:.3f}s",
+        f"apparent {apparent / 2**30:.1f} GiB, allocated {allocated / 2**20:.1f} MiB (sparse tree)",
+    ])
+    assert exporter.scan_index.files_stat == count_files(backup_tree)
+    assert allocated < apparent
+
+
+def test_catalog_sizes_skip_the_walk(backup_tree, tmp_path, report):
+    sizes = {b['name']: b['size_bytes'] for b in make_exporter(backup_tree).get_local_backups()}
+    catalog = BackupCatalog(str(tmp_path / 'catalog.db'))
+    try:
+        for name, size_bytes in sizes.items():
+            catalog.record_upload(name, size_bytes, checksum_ok=True)
+    finally:
+        catalog.close()
+
+    stat_calls = {}
+    for disk_usage in (False, True):
+        exporter = make_exporter(backup_tree, catalog_path=str(tmp_path / 'catalog.db'), disk_usage=disk_usage)
+        backups = exporter.get_local_backups()
+        assert {b['name']: b['size_bytes'] for b in backups} == sizes
+        stat_calls[disk_usage] = exporter.scan_index.files_stat
+    report("cold scan with sizes recorded in the catalog", [
+        f"default: {stat_calls[False]} files stat'ed; with disk usage: {stat_calls[True]}",
+    ])
+    # Only the top-level artifacts are listed for the type breakdown
+    assert stat_calls[False] < count_files(backup_tree) / 10
+    assert stat_calls[True] == count_files(backup_tree)
+
+
+def test_parallel_sizing(backup_tree, report, monkeypatch):
+    def cold_scan(workers):
+        exporter = make_exporter(backup_tree, scan_workers=workers, disk_usage=True)
+        started = time.perf_counter()
+        backups = exporter.get_local_backups()
+        return time.perf_counter() - started, [(b['name'], b['size_bytes'], b['allocated_bytes']) for b in backups]
+
+    warm = {workers: cold_scan(workers) for workers in (1, 4)}
+
+    # A disk wait releases the GIL like the sleep does, so blocked walks overlap
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        time.sleep(SLOW_DISK_LATENCY)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', slow_scandir)
+    slow = {workers: cold_scan(workers) for workers in (1, 4)}
+    monkeypatch.undo()
+
+    report("cold scan, serial vs 4 workers", [
+        f"page cache: 1 worker {warm[1][0]:.3f}s, 4 workers {warm[4][0]:.3f}s ({warm[1][0] / warm[4][0]:.1f}x)",
+        f"{SLOW_DISK_LATENCY * 1000:.0f}ms per directory read: 1 worker {slow[1][0]:.3f}s, "
+        f"4 workers {slow[4][0]:.3f}s ({slow[1][0] / slow[4][0]:.1f}x)",
+    ])
+    assert warm[1][1] == warm[4][1] == slow[1][1] == slow[4][1]
+    assert slow[4][0] < slow[1][0]
+
+
+def test_invalidation_during_lookups(backup_tree):
+    exporter = make_exporter(backup_tree)
+    index = exporter.scan_index
+    expected = {b['name']: b['size_bytes'] for b in exporter.get_local_backups()}
+    paths = set(index.dump())
+    # Entries for backups that are gone, so every dump and prune walks many
+    entry = next(iter(index.dump().values()))
+    fields = set(entry['fields'])
+    gone = {f"{backup_tree}/backup-gone-{number}": entry for number in range(2000)}
+    stop, errors = threading.Event(), []
+
+    def invalidate():
+        try:
+            while not stop.is_set():
+                index.load(gone, fields)
+                for path in gone:
+                    index.invalidate(path)
+                index.invalidate()
+        except Exception as e:
+            errors.append(e)
+
+    # Switch threads often, so the two interleave inside the index's loops
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    thread = threading.Thread(target=invalidate)
+    thread.start()
+    try:
+        for _ in range(WARM_SCRAPES):
+            backups = exporter.get_local_backups()
+            for _ in range(20):
+                index.dump()
+            assert {b['name']: b['size_bytes'] for b in backups} == expected
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(switch_interval)
+    assert not errors
+    # Once the invalidations stop, the index fills up again
+    exporter.get_local_backups()
+    assert set(index.dump()) == paths
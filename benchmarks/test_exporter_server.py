@@ -0,0 +1,108 @@
+"""
+The exporter's HTTP front end
+
+Serves a background collector over a real socket and checks the behaviour
+scrapers depend on:
+
+- /metrics is gzipped only for clients that accept gzip, and says so in Vary
+- one keep-alive connection carries many scrapes
+- a conditional GET gets the full, current response rather than a 304:
+  freshness ages move between requests even when no new snapshot arrived
+"""
+
+import gzip
+import time
+import threading
+import http.client
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from backup_exporter import BackupCollector, BackupExporter
+from backup_exporter.server import MetricsHandler
+
+SCRAPES = 10
+
+
+@pytest.fixture
+def server(tmp_path):
+    backup = tmp_path / 'backups' / 'backup-20260101_020000'
+    backup.mkdir(parents=True)
+    (backup / 'paperless_data.tar.gz').write_bytes(b'x' * 4096)
+    collector = BackupCollector(BackupExporter(str(tmp_path / 'backups'), cloud_source='catalog'))
+    collector.refresh_local()
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.source = collector
+    httpd.profiling = False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def get(conn: http.client.HTTPConnection, path: str = '/metrics', **headers):
+    conn.request('GET', path, headers=headers)
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def sample(body: bytes, name: str) -> float:
+    for line in body.decode('utf-8').splitlines():
+        if line.startswith(name):
+            return float(line.split()[-1])
+    raise AssertionError(f"{name} not in the response")
+
+
+def test_gzip_negotiation(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+    try:
+        response, plain = get(conn)
+        assert response.status == 200
+        assert response.getheader('Content-Encoding') is None
+        assert response.getheader('Vary') == 'Accept-Encoding'
+        assert b'backup_local_count 1' in plain
+
+        response, body = get(conn, **{'Accept-Encoding': 'br, gzip;q=0.8'})
+        assert response.getheader('Content-Encoding') == 'gzip'
+        assert int(response.getheader('Content-Length')) == len(body)
+        assert b'backup_local_count 1' in gzip.decompress(body)
+
+        response, body = get(conn, **{'Accept-Encoding': 'gzip;q=0, identity'})
+        assert response.getheader('Content-Encoding') is None
+        assert b'backup_local_count 1' in body
+    finally:
+        conn.close()
+
+
+def test_keep_alive(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+    try:
+        get(conn)
+        sock = conn.sock
+        for path in ['/metrics', '/healthz', '/-/ready'] * SCRAPES:
+            response, _ = get(conn, path)
+            assert response.status == 200
+            assert response.version == 11 and not response.will_close
+        # Every request went over the first connection
+        assert conn.sock is sock
+    finally:
+        conn.close()
+
+
+def test_conditional_get_returns_current_metrics(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+    try:
+        response, first = get(conn)
+        assert response.getheader('ETag') is None
+        time.sleep(0.05)
+        response, second = get(conn, **{'If-None-Match': '*'})
+        assert response.status == 200
+        age = 'backup_exporter_snapshot_age_seconds{family="local"}'
+        assert sample(second, age) > sample(first, age)
+    finally:
+        conn.close()
@@ -0,0 +1,129 @@
+"""
+Exporter restarts with --state-dir
+
+Runs the exporter against a synthetic tree until its snapshot, scan index
+and cloud listing are saved, then restarts it on the same state directory,
+as a redeploy would:
+
+- the restarted exporter is ready and serves every backup from the saved
+  snapshot without walking the tree (only the backup directories are stat'ed)
+- the cloud listing is reused while it is younger than its TTL, so the
+  restart makes no rclone call
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import http.client
+from pathlib import Path
+
+from exporter_load import BENCH_DIR, EXPORTER_DIR, free_port, stop, wait_ready
+from synthetic_tree import ensure_tree
+
+BACKUPS = 20
+FILES = 1000
+
+
+def start_exporter(tree: Path, workdir: Path, state_dir: Path, rclone_log: Path):
+    port = free_port()
+    env = dict(os.environ,
+               PATH=f"{workdir / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+               PYTHONPATH=str(EXPORTER_DIR),
+               FAKE_RCLONE_ROOT=str(workdir / 'remote'),
+               FAKE_RCLONE_LOG=str(rclone_log))
+    command = ['python3', '-m', 'backup_exporter', f'--backup-dir={tree}', f'--port={port}',
+               '--rclone-remote=bench', f'--state-dir={state_dir}', '--no-run-logs']
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc, port
+
+
+def get_metrics(port: int) -> str:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/metrics')
+    body = conn.getresponse().read().decode('utf-8')
+    conn.close()
+    return body
+
+
+def sample(body: str, name: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.split()[-1])
+    raise AssertionError(f"{name} not in the response")
+
+
+def aged_tree(root: Path) -> Path:
+    """A tree whose files and directories were written a day ago
+
+    The scan index rescans backups holding files younger than its settle
+    window, as they may still be being written; a fresh tree would be walked
+    again after the restart whatever was saved.
+    """
+    tree = ensure_tree(root, BACKUPS, FILES)
+    written = time.time() - 86400
+    for directory, _, files in os.walk(tree, topdown=False):
+        for name in files:
+            os.utime(os.path.join(directory, name), (written, written))
+        os.utime(directory, (written, written))
+    return tree
+
+
+def test_restart_serves_saved_snapshot(tmp_path, report):
+    backup_tree = aged_tree(tmp_path / 'backups')
+    workdir = Path(tempfile.mkdtemp(prefix='exporter-warm-'))
+    try:
+        (workdir / 'bin').mkdir()
+        (workdir / 'bin' / 'rclone').symlink_to(BENCH_DIR / 'fake_rclone.py')
+        (workdir / 'remote').mkdir()
+        (workdir / 'remote' / 'paperless-backup').symlink_to(backup_tree.resolve())
+        state_dir = workdir / 'state'
+        state_dir.mkdir()
+        state_path = state_dir / 'snapshot.json.gz'
+
+        cold_log = workdir / 'cold-rclone.log'
+        proc, port = start_exporter(backup_tree, workdir, state_dir, cold_log)
+        try:
+            cold_ready = wait_ready(port, proc, 600)
+            # Both families published and saved
+            deadline = time.monotonic() + 120
+            while True:
+                assert time.monotonic() < deadline, "state was never saved with the cloud listing"
+                if state_path.exists():
+                    state = json.loads(gzip.decompress(state_path.read_bytes()))
+                    if state['cloud']['fetched_at'] is not None and state['snapshot']['cloud']['collected_at']:
+                        break
+                time.sleep(0.2)
+            cold_stat = sample(get_metrics(port), 'backup_exporter_scan_files_stat_total')
+        finally:
+            stop(proc)
+
+        warm_log = workdir / 'warm-rclone.log'
+        proc, port = start_exporter(backup_tree, workdir, state_dir, warm_log)
+        try:
+            warm_ready = wait_ready(port, proc, 600)
+            first = get_metrics(port)
+            # Let the background revalidation run
+            time.sleep(2)
+            after = get_metrics(port)
+        finally:
+            stop(proc)
+        warm_calls = warm_log.read_text().splitlines() if warm_log.exists() else []
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    warm_stat = sample(after, 'backup_exporter_scan_files_stat_total')
+    report(f"restart on a saved state, {BACKUPS} backups", [
+        f"cold start: ready in {cold_ready:.2f}s, {cold_stat:.0f} files stat'ed",
+        f"warm start: ready in {warm_ready:.2f}s, {warm_stat:.0f} files stat'ed, "
+        f"{len(warm_calls)} rclone call(s), state file {state_path.name}",
+    ])
+    assert sample(first, 'backup_local_count') == BACKUPS
+    assert sample(first, 'backup_cloud_count') == BACKUPS
+    assert 'backup_exporter_snapshot_restored{family="local"} 0' in after
+    # Only each backup directory is stat'ed to confirm the saved index
+    assert warm_stat == BACKUPS
+    assert not [line for line in warm_calls if ' lsjson ' in line]
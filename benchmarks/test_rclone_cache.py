@@ -0,0 +1,77 @@
+"""
+The exporter's stale-while-revalidate cloud cache against the fake rclone
+
+Adds a backup to the remote before each forced reload and asks for the
+listing with a wait, as the first scrape after startup does:
+
+- get(wait=...) returns the reloaded listing, not the one it replaced, even
+  when the thread storing it is slow to get scheduled
+- a failed reload keeps the previous listing and records the error
+- the runner's stats() counts each call by result, in a copy that later
+  calls do not change
+"""
+
+import time
+
+from backup_exporter import AsyncRcloneRunner, BackupExporter
+
+ROUNDS = 20
+
+
+def add_backup(remote, number: int):
+    backup = remote / 'paperless-backup' / f"backup-202601{number + 1:02d}_020000"
+    backup.mkdir(parents=True)
+    (backup / 'paperless_data.tar.gz').write_bytes(b'x' * (1000 + number))
+
+
+def test_wait_returns_reloaded_value(tmp_path, fake_remote, monkeypatch):
+    exporter = BackupExporter(str(tmp_path / 'local'), rclone_remote='bench',
+                              rclone=AsyncRcloneRunner(call_timeout=30, total_timeout=30))
+    cache = exporter.cloud_cache
+    store = cache._store
+
+    def slow_store(future, started_at):
+        # Widens the gap between the listing finishing and landing in the cache
+        time.sleep(0.05)
+        store(future, started_at)
+
+    monkeypatch.setattr(cache, '_store', slow_store)
+    for number in range(ROUNDS):
+        add_backup(fake_remote, number)
+        # Expire the cached listing so the next get reloads it
+        cache.fetched_at = None if number == 0 else time.time() - cache.ttl
+        backups = cache.get(wait=30)
+        assert len(backups) == number + 1, f"round {number}: got the listing from before the reload"
+        assert cache.last_error is None
+
+
+def test_failed_reload_keeps_value(tmp_path, fake_remote, monkeypatch):
+    exporter = BackupExporter(str(tmp_path / 'local'), rclone_remote='bench',
+                              rclone=AsyncRcloneRunner(call_timeout=30, total_timeout=30))
+    cache = exporter.cloud_cache
+    add_backup(fake_remote, 0)
+    assert len(cache.get(wait=30)) == 1
+
+    monkeypatch.setenv('FAKE_RCLONE_FAIL_RATE', '1')
+    cache.fetched_at = time.time() - cache.ttl
+    assert len(cache.get(wait=30)) == 1
+    assert cache.last_error is not None and cache.failed_at is not None
+    # The failure backs off instead of reloading on every call
+    assert cache._revalidate_if_stale() is None
+
+
+def test_call_stats(tmp_path, fake_remote, monkeypatch):
+    runner = AsyncRcloneRunner(call_timeout=30, total_timeout=30)
+    exporter = BackupExporter(str(tmp_path / 'local'), rclone_remote='bench', rclone=runner)
+    add_backup(fake_remote, 0)
+    exporter.cloud_cache.get(wait=30)
+    before = runner.stats()
+
+    monkeypatch.setenv('FAKE_RCLONE_FAIL_RATE', '1')
+    exporter.cloud_cache.fetched_at = time.time() - exporter.cloud_cache.ttl
+    exporter.cloud_cache.get(wait=30)
+    after = runner.stats()
+
+    assert before['calls'] == {('lsjson', 'ok'): 1}
+    assert after['calls'] == {('lsjson', 'ok'): 1, ('lsjson', 'error'): 1}
+    assert after['durations']['lsjson'].snapshot()[2] == 2